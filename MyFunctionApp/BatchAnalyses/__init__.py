@@ -0,0 +1,194 @@
+import importlib
+import json
+import logging
+import re
+from collections import defaultdict
+from urllib.parse import parse_qsl
+import azure.functions as func
+from markupsafe import Markup
+from shared_code.storage import get_container_client
+from shared_code.analytics import analytics
+from shared_code.compression import compressor
+from shared_code.formats import FORMATS, negotiate
+from shared_code.reports import report_template
+from shared_code.results import load_result, prefetched_results
+from shared_code.schema import EDUCATION_LEVELS
+
+FUNCTION_NAME = "BatchAnalyses"
+
+# HTTP functions that can be run in a batch
+ANALYSES = [
+    'DisparitiesMvsW',
+    'EarningAboveLevel',
+    'EducationImpactForDG',
+    'HourlyWagesCompMvsW',
+    'PercentageChangeOverYears',
+    'RaceBasedEarning',
+    'TrendingWagesOverYears',
+    'WageGapAndTrendOverYears',
+    'WageInequality',
+    'WageRangesDistribution',
+]
+
+# A batch is one report or one JSON document; the charts of several reports are not stacked
+BATCH_FORMATS = ['html', 'json']
+
+# Most analyses run by one request
+MAX_ANALYSES = 50
+
+# Content of a report's <body>
+BODY = re.compile(r'<body[^>]*>(.*)</body>', re.DOTALL | re.IGNORECASE)
+
+def main(req: func.HttpRequest) -> func.HttpResponse:
+    logging.info('Azure HTTP trigger function to run several analyses over one load of their datasets.')
+
+    # Output format, from the format parameter or the Accept header
+    try:
+        response_format = negotiate(req)
+        if req.params.get('format') and response_format not in BATCH_FORMATS:
+            raise ValueError(f"Invalid batch format: {response_format}")
+    except ValueError:
+        return func.HttpResponse(f"Invalid format. Choose from {BATCH_FORMATS}.", status_code=400)
+    if response_format not in BATCH_FORMATS:
+        return func.HttpResponse(f"Not acceptable. Available formats: {BATCH_FORMATS}.", status_code=406)
+
+    # The analyses to run, each with its own parameters
+    try:
+        analyses = parse_analyses(req)
+    except ValueError as e:
+        return func.HttpResponse(str(e), status_code=400)
+
+    try:
+        modules = {name: importlib.import_module(name) for name in dict.fromkeys(name for name, _ in analyses)}
+
+        # The materialized reports of an HTML batch are read together, not one analysis at a time
+        keys = [] if response_format != 'html' else [key for key in map(materialized_key, analyses) if key]
+        with prefetched_results(keys):
+            # Every metric of the analyses that are not served materialized, in one pass over
+            # one load of each dataset; the analyses then find their metrics memoized by the
+            # shared analytics core
+            container_client = get_container_client("sources")
+            metrics = defaultdict(list)
+            for name, params in analyses:
+                module = modules[name]
+                if not (response_format == 'html' and is_materialized(module, (name, params))):
+                    metrics[module.DATASET].extend(module.METRICS)
+            for dataset_metrics in metrics.values():
+                analytics.compute(container_client, list(dict.fromkeys(dataset_metrics)))
+
+            outcomes = [run(modules[name], name, params, response_format) for name, params in analyses]
+        if response_format == 'json':
+            body = render_json(outcomes)
+        else:
+            body = render(outcomes)
+
+        # Compressed when the client accepts it (and the body is large enough to be worth it)
+        body, headers = compressor.respond(req, body, FORMATS[response_format], {'Vary': 'Accept'})
+        return func.HttpResponse(body, mimetype=FORMATS[response_format], status_code=200, headers=headers)
+
+    except Exception as e:
+        logging.error(f"Error occurred: {str(e)}")
+        return func.HttpResponse(f"Error occurred: {str(e)}", status_code=500)
+
+def parse_analyses(req):
+    """``[(name, params)]`` of the analyses requested by ``req``.
+
+    A POST body ``{"analyses": [...]}`` lists them as ``"Name"``, ``"Name?year=2020&..."`` or
+    ``{"name": "Name", "params": {...}}``; a GET request names them in the ``analyses``
+    parameter, separated by commas, without parameters. Raises ValueError for a malformed or
+    unknown analysis.
+    """
+    items = None
+    try:
+        req_body = req.get_json()
+    except ValueError:
+        pass
+    else:
+        items = req_body.get('analyses') if isinstance(req_body, dict) else req_body
+    if items is None and req.params.get('analyses'):
+        items = [name.strip() for name in req.params.get('analyses').split(',') if name.strip()]
+    if not items or not isinstance(items, list):
+        raise ValueError(f"Please provide the analyses to run. Choose from {ANALYSES}.")
+    if len(items) > MAX_ANALYSES:
+        raise ValueError(f"Too many analyses; at most {MAX_ANALYSES} can be run at once.")
+
+    analyses = []
+    for item in items:
+        if isinstance(item, str):
+            name, _, query = item.partition('?')
+            params = dict(parse_qsl(query))
+        elif isinstance(item, dict) and isinstance(item.get('params', {}), dict):
+            name, params = item.get('name'), item.get('params', {})
+        else:
+            raise ValueError(f"Invalid analysis {item!r}.")
+        if name not in ANALYSES:
+            raise ValueError(f"Unknown analysis {name!r}. Choose from {ANALYSES}.")
+        analyses.append((name, {key: str(value) for key, value in params.items()}))
+    return analyses
+
+def materialized_key(analysis):
+    """``(name, params)`` of the result MaterializeResults saved for ``analysis``, or None.
+
+    The unparameterised reports are saved as they are, the others for one year and one
+    education level.
+    """
+    name, params = analysis
+    if not params:
+        return name, {}
+    if (params.keys() == {'year', 'education_level'} and params['year'].isdigit()
+            and params['education_level'] in EDUCATION_LEVELS):
+        return name, {'year': int(params['year']), 'education_level': params['education_level']}
+    return None
+
+def is_materialized(module, analysis):
+    """Whether the report of ``analysis`` is materialized for the current version of its dataset."""
+    key = materialized_key(analysis)
+    return key is not None and load_result(key[0], module.DATASET, **key[1]) is not None
+
+def run(module, name, params, response_format):
+    """Run one analysis through its own function, as if it had been requested on its own."""
+    req = func.HttpRequest(
+        method='GET', url=f'/api/{name}', params={**params, 'format': response_format}, headers={}, body=b'',
+    )
+    response = module.main(req)
+    return {'name': name, 'params': params, 'status': response.status_code, 'body': response.get_body().decode()}
+
+def render_json(outcomes):
+    """The outcomes as one JSON document, embedding each analysis' JSON as it was returned."""
+    parts = []
+    for outcome in outcomes:
+        head = {'name': outcome['name'], 'params': outcome['params'], 'status': outcome['status']}
+        if outcome['status'] == 200:
+            parts.append(json.dumps(head)[:-1] + ', "data": ' + outcome['body'] + '}')
+        else:
+            parts.append(json.dumps(dict(head, error=outcome['body'])))
+    return '{"analyses": [' + ', '.join(parts) + ']}'
+
+def render(outcomes):
+    """The reports of the outcomes, one after another on one HTML page."""
+    sections = []
+    for outcome in outcomes:
+        match = BODY.search(outcome['body'])
+        # The reports are trusted markup produced by the functions themselves
+        report = Markup(match.group(1) if match else outcome['body']) if outcome['status'] == 200 else None
+        sections.append(dict(outcome, report=report))
+    return REPORT.render(sections=sections)
+
+# HTML response with every report in its own section
+REPORT = report_template("""
+    <html>
+    <body>
+        {% for section in sections %}
+        <section id="{{ section.name }}">
+            {% if section.report is not none %}
+            {{ section.report }}
+            {% else %}
+            <h1>{{ section.name }}</h1>
+            <p>Error {{ section.status }}: {{ section.body }}</p>
+            {% endif %}
+        </section>
+        <hr>
+        {% endfor %}
+    </body>
+    </html>
+    """)
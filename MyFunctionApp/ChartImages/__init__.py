@@ -0,0 +1,36 @@
+import logging
+import re
+import azure.functions as func
+from shared_code.chart_cache import chart_cache
+from shared_code.results import CHART_CACHE_CONTROL, load_chart
+
+# Chart PNGs named by their content hash, as referenced by the HTML reports
+CHART_NAME = re.compile(r'^([0-9a-f]{32})\.png$')
+
+def main(req: func.HttpRequest) -> func.HttpResponse:
+    logging.info('Azure HTTP trigger function to serve a rendered chart.')
+
+    match = CHART_NAME.match(req.route_params.get('name', ''))
+    if not match:
+        return func.HttpResponse("Chart not found.", status_code=404)
+    digest = match.group(1)
+
+    # The content never changes for a given name, so a revalidation always matches
+    etag = f'"{digest}"'
+    headers = {'Cache-Control': CHART_CACHE_CONTROL, 'ETag': etag}
+    if etag in (req.headers.get('If-None-Match') or ''):
+        return func.HttpResponse(status_code=304, headers=headers)
+
+    try:
+        # Rendered by this worker, or stored in the results container by whichever rendered it
+        png = chart_cache.find(digest)
+        if png is None:
+            png = load_chart(digest)
+        if png is None:
+            return func.HttpResponse("Chart not found.", status_code=404)
+
+        return func.HttpResponse(png, mimetype="image/png", status_code=200, headers=headers)
+
+    except Exception as e:
+        logging.error(f"Error occurred: {str(e)}")
+        return func.HttpResponse(f"Error occurred: {str(e)}", status_code=500)
@@ -0,0 +1,19 @@
+import logging
+import azure.functions as func
+from shared_code.storage import get_container_client
+from shared_code.columnar import write_mirror
+
+def main(myblob: func.InputStream):
+    logging.info(f'Azure blob trigger function to mirror {myblob.name} as Parquet.')
+
+    # The trigger path is "<container>/<blob name>"
+    blob_name = myblob.name.split('/', 1)[-1]
+    if not blob_name.endswith('.csv'):
+        logging.info(f"Skipping {blob_name}: only CSV sources are mirrored.")
+        return
+
+    try:
+        write_mirror(get_container_client("sources"), blob_name)
+    except Exception as e:
+        logging.error(f"Error occurred: {str(e)}")
+        raise
@@ -1,110 +1,137 @@
 import logging
-import os
-import pandas as pd
-import matplotlib.pyplot as plt
 import azure.functions as func
-from azure.storage.blob import BlobServiceClient
-import io
-import base64
+from shared_code.storage import get_container_client
+from shared_code.analytics import analytics
+from shared_code.results import load_result
+from shared_code.chart_cache import chart_cache
+from shared_code.charts import Chart, new_figure
+from shared_code.compression import compressor
+from shared_code.formats import FORMATS, json_body, negotiate
+from shared_code.reports import report_template, table_rows
+from shared_code.schema import BRACKETS, POVERTY_WAGES
+
+FUNCTION_NAME = "DisparitiesMvsW"
+DATASET = POVERTY_WAGES.blob_name
+
+# Metrics of the shared analytics core rendered by this function
+METRICS = ['gender_bracket_totals', 'gender_bracket_totals_by_year']
 
 def main(req: func.HttpRequest) -> func.HttpResponse:
     logging.info('Azure HTTP trigger function to analyze income disparities across different income brackets for men and women.')
 
+    # Output format, from the format parameter or the Accept header
+    try:
+        response_format = negotiate(req)
+    except ValueError:
+        return func.HttpResponse(f"Invalid format. Choose from {list(FORMATS)}.", status_code=400)
+    if response_format is None:
+        return func.HttpResponse(f"Not acceptable. Available formats: {list(FORMATS)}.", status_code=406)
+
     try:
-        # Securely get the connection string from environment variables
-        storage_account_key = os.getenv('AZURE_STORAGE_ACCOUNT_KEY')
-        storage_account_name = os.getenv('AZURE_STORAGE_ACCOUNT_NAME')  # Ensure the account name is set in environment variables
-        
-        if not storage_account_key or not storage_account_name:
-            raise ValueError("Storage account credentials not found in environment variables.")
-        
-        connection_string = f"DefaultEndpointsProtocol=https;AccountName={storage_account_name};AccountKey={storage_account_key};EndpointSuffix=core.windows.net"
-        
-        # Connect to Blob Storage
-        blob_service_client = BlobServiceClient.from_connection_string(connection_string)
-        container_client = blob_service_client.get_container_client("sources")
-        blob_client = container_client.get_blob_client("poverty_level_wages.csv")
-        
-        # Download the CSV from Blob Storage
-        blob_data = blob_client.download_blob().readall()
-        df = pd.read_csv(io.BytesIO(blob_data))
-
-        # --- Calculate total for each income bracket for men and women ---
-        income_brackets = {
-            '0-75%': ['men_0-75%_of_poverty_wages', 'women_0-75%_of_poverty_wages'],
-            '75-100%': ['men_75-100%_of_poverty_wages', 'women_75-100%_of_poverty_wages'],
-            '100-125%': ['men_100-125%_of_poverty_wages', 'women_100-125%_of_poverty_wages'],
-            '125-200%': ['men_125-200%_of_poverty_wages', 'women_125-200%_of_poverty_wages'],
-            '200-300%': ['men_200-300%_of_poverty_wages', 'women_200-300%_of_poverty_wages'],
-            '300%+': ['men_300%+_of_poverty_wages', 'women_300%+_of_poverty_wages']
-        }
-
-        bracket_totals = {bracket: df[columns].sum().values for bracket, columns in income_brackets.items()}
-        bracket_df = pd.DataFrame.from_dict(bracket_totals, orient='index', columns=['Men', 'Women'])
-
-        # --- Grouped Bar Chart ---
-        plt.figure(figsize=(10, 6))
-        bracket_df.plot(kind='bar')
-        plt.title('Income Disparities Across Different Income Brackets for Men and Women')
-        plt.xlabel('Income Bracket (% of Poverty Level)')
-        plt.ylabel('Total Number of Workers')
-        plt.xticks(rotation=45)
-        plt.legend(title='Gender')
-        plt.tight_layout()
-
-        # Save the bar chart to an in-memory bytes buffer
-        bar_chart_buffer = io.BytesIO()
-        plt.savefig(bar_chart_buffer, format='png')
-        bar_chart_buffer.seek(0)
-        bar_chart_base64 = base64.b64encode(bar_chart_buffer.getvalue()).decode('utf-8')
-
-        # --- Calculate Percentage Distribution ---
-        bracket_df_percentage = bracket_df.div(bracket_df.sum(axis=1), axis=0) * 100
-
-        # --- Plot Trends Over Time ---
-        plt.figure(figsize=(12, 6))
-        for gender in ['Men', 'Women']:
-            plt.plot(df['year'], df[f'{gender.lower()}_0-75%_of_poverty_wages'], label=f'{gender} 0-75%', marker='o')
-            plt.plot(df['year'], df[f'{gender.lower()}_75-100%_of_poverty_wages'], label=f'{gender} 75-100%', marker='o')
-            # You can repeat this for other income brackets as necessary.
-
-        plt.title('Trends in Income Disparities Across Different Income Brackets Over Time')
-        plt.xlabel('Year')
-        plt.ylabel('Number of Workers')
-        plt.legend()
-        plt.grid(True)
-        plt.tight_layout()
-
-        # Save the trends chart to an in-memory bytes buffer
-        trends_chart_buffer = io.BytesIO()
-        plt.savefig(trends_chart_buffer, format='png')
-        trends_chart_buffer.seek(0)
-        trends_chart_base64 = base64.b64encode(trends_chart_buffer.getvalue()).decode('utf-8')
-
-        # HTML response with Base64-encoded images
-        html_response = f"""
-        <html>
-        <body>
-            <h1>Income Disparities Analysis Across Different Income Brackets</h1>
-            <h2>Bracket Totals (Men vs Women):</h2>
-            <table border="1">
-                <tr>
-                    <th>Income Bracket</th>
-                    <th>Men</th>
-                    <th>Women</th>
-                </tr>
-                {"".join([f"<tr><td>{bracket}</td><td>{values[0]}</td><td>{values[1]}</td></tr>" for bracket, values in bracket_totals.items()])}
-            </table>
-            <h2>Grouped Bar Chart: Income Disparities</h2>
-            <img src="data:image/png;base64,{bar_chart_base64}" alt="Bar Chart">
-            <h2>Trends Over Time: Income Disparities</h2>
-            <img src="data:image/png;base64,{trends_chart_base64}" alt="Trends Chart">
-        </body>
-        </html>
-        """
-
-        return func.HttpResponse(html_response, mimetype="text/html", status_code=200)
+        # Serve the HTML report precomputed by MaterializeResults, computing it live on a miss
+        body = load_result(FUNCTION_NAME, DATASET) if response_format == 'html' else None
+        if body is None:
+            # Shared, pooled Blob Storage client (built once per worker process)
+            container_client = get_container_client("sources")
+
+            # Evaluate this analysis' metrics through the shared, memoized analytics core
+            results, etag = analytics.compute(container_client, METRICS)
+            if response_format == 'json':
+                body = render_json(results)
+            elif response_format == 'svg':
+                body = chart_cache.svg_document(FUNCTION_NAME, charts(results), etag)
+            else:
+                body = render(results, etag)
+
+        # Compressed when the client accepts it (and the body is large enough to be worth it)
+        body, headers = compressor.respond(req, body, FORMATS[response_format], {'Vary': 'Accept'})
+        return func.HttpResponse(body, mimetype=FORMATS[response_format], status_code=200, headers=headers)
 
     except Exception as e:
         logging.error(f"Error occurred: {str(e)}")
         return func.HttpResponse(f"Error occurred: {str(e)}", status_code=500)
+
+def charts(results):
+    """Charts of the report, in page order."""
+    return [
+        Chart('bar_chart', draw_bar_chart, {'bracket_df': results['gender_bracket_totals']}),
+        Chart('trends_chart', draw_trends_chart, {'df': results['gender_bracket_totals_by_year']}),
+    ]
+
+def draw_bar_chart(bracket_df):
+    # --- Grouped Bar Chart ---
+    fig, ax = new_figure(figsize=(10, 6))
+    bracket_df.plot(kind='bar', ax=ax)
+    ax.set_title('Income Disparities Across Different Income Brackets for Men and Women')
+    ax.set_xlabel('Income Bracket (% of Poverty Level)')
+    ax.set_ylabel('Total Number of Workers')
+    ax.tick_params(axis='x', labelrotation=45)
+    ax.legend(title='Gender')
+    fig.tight_layout()
+    return fig
+
+def draw_trends_chart(df):
+    # --- Plot Trends Over Time ---
+    fig, ax = new_figure(figsize=(12, 6))
+    for gender in ['Men', 'Women']:
+        ax.plot(df['year'], df[f'{gender.lower()}_0-75%_of_poverty_wages'], label=f'{gender} 0-75%', marker='o')
+        ax.plot(df['year'], df[f'{gender.lower()}_75-100%_of_poverty_wages'], label=f'{gender} 75-100%', marker='o')
+        # You can repeat this for other income brackets as necessary.
+
+    ax.set_title('Trends in Income Disparities Across Different Income Brackets Over Time')
+    ax.set_xlabel('Year')
+    ax.set_ylabel('Number of Workers')
+    ax.legend()
+    ax.grid(True)
+    fig.tight_layout()
+    return fig
+
+def render_json(results):
+    """Bracket totals for men and women, overall and for every year, as JSON."""
+    bracket_df = results['gender_bracket_totals']
+    df = results['gender_bracket_totals_by_year']
+    response_data = {
+        "bracket_totals": {
+            bracket: {"men": bracket_df.at[bracket, 'Men'], "women": bracket_df.at[bracket, 'Women']}
+            for bracket in bracket_df.index
+        },
+        "years": df['year'],
+        "by_year": {
+            gender: {bracket: df[f'{gender}_{bracket}_of_poverty_wages'] for bracket in BRACKETS}
+            for gender in ['men', 'women']
+        },
+    }
+    return json_body(response_data)
+
+def render(results, etag):
+    """Render the bracket totals for men and women as an HTML report."""
+    # --- Total for each income bracket for men and women ---
+    bracket_df = results['gender_bracket_totals']
+
+    # Chart URLs; the charts are drawn only when the chart cache misses
+    images = chart_cache.urls(FUNCTION_NAME, charts(results), etag)
+
+    rows = table_rows([bracket_df.index, bracket_df['Men'], bracket_df['Women']], ['%s', '%.2f', '%.2f'])
+    return REPORT.render(rows=rows, images=images)
+
+# HTML response referencing the chart images
+REPORT = report_template("""
+    <html>
+    <body>
+        <h1>Income Disparities Analysis Across Different Income Brackets</h1>
+        <h2>Bracket Totals (Men vs Women):</h2>
+        <table border="1">
+            <tr>
+                <th>Income Bracket</th>
+                <th>Men</th>
+                <th>Women</th>
+            </tr>
+            {% for chunk in rows %}{{ chunk }}{% endfor %}
+        </table>
+        <h2>Grouped Bar Chart: Income Disparities</h2>
+        <img src="{{ images['bar_chart'] }}" alt="Bar Chart">
+        <h2>Trends Over Time: Income Disparities</h2>
+        <img src="{{ images['trends_chart'] }}" alt="Trends Chart">
+    </body>
+    </html>
+    """)
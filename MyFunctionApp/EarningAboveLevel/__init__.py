@@ -1,81 +1,111 @@
 import logging
-import os
-import pandas as pd
-import matplotlib.pyplot as plt
 import azure.functions as func
-from azure.storage.blob import BlobServiceClient
-import io
-import base64
+from shared_code.storage import get_container_client
+from shared_code.analytics import analytics
+from shared_code.results import load_result
+from shared_code.chart_cache import chart_cache
+from shared_code.charts import Chart, new_figure
+from shared_code.compression import compressor
+from shared_code.formats import FORMATS, json_body, negotiate
+from shared_code.reports import report_template, table_rows
+from shared_code.schema import POVERTY_WAGES
+
+FUNCTION_NAME = "EarningAboveLevel"
+DATASET = POVERTY_WAGES.blob_name
+
+# Metrics of the shared analytics core rendered by this function
+METRICS = ['bracket_totals_by_year', 'share_above_300']
 
 def main(req: func.HttpRequest) -> func.HttpResponse:
     logging.info('Azure HTTP trigger function for analyzing workers earning above 300% of poverty level.')
 
+    # Output format, from the format parameter or the Accept header
+    try:
+        response_format = negotiate(req)
+    except ValueError:
+        return func.HttpResponse(f"Invalid format. Choose from {list(FORMATS)}.", status_code=400)
+    if response_format is None:
+        return func.HttpResponse(f"Not acceptable. Available formats: {list(FORMATS)}.", status_code=406)
+
     try:
-        # Securely get the connection string from environment variables
-        storage_account_key = os.getenv('AZURE_STORAGE_ACCOUNT_KEY')
-        storage_account_name = os.getenv('AZURE_STORAGE_ACCOUNT_NAME')  # Ensure the account name is set in environment variables
+        # Serve the HTML report precomputed by MaterializeResults, computing it live on a miss
+        body = load_result(FUNCTION_NAME, DATASET) if response_format == 'html' else None
+        if body is None:
+            # Shared, pooled Blob Storage client (built once per worker process)
+            container_client = get_container_client("sources")
+
+            # Evaluate this analysis' metrics through the shared, memoized analytics core
+            results, etag = analytics.compute(container_client, METRICS)
+            if response_format == 'json':
+                body = render_json(results)
+            elif response_format == 'svg':
+                body = chart_cache.svg_document(FUNCTION_NAME, charts(results), etag)
+            else:
+                body = render(results, etag)
+
+        # Compressed when the client accepts it (and the body is large enough to be worth it)
+        body, headers = compressor.respond(req, body, FORMATS[response_format], {'Vary': 'Accept'})
+        return func.HttpResponse(body, mimetype=FORMATS[response_format], status_code=200, headers=headers)
 
-        if not storage_account_key or not storage_account_name:
-            raise ValueError("Storage account credentials not found in environment variables.")
-        
-        connection_string = f"DefaultEndpointsProtocol=https;AccountName={storage_account_name};AccountKey={storage_account_key};EndpointSuffix=core.windows.net"
-        
-        # Connect to Blob Storage
-        blob_service_client = BlobServiceClient.from_connection_string(connection_string)
-        container_client = blob_service_client.get_container_client("sources")
-        blob_client = container_client.get_blob_client("poverty_level_wages.csv")
-        
-        # Download the CSV from Blob Storage
-        blob_data = blob_client.download_blob().readall()
-        df = pd.read_csv(io.BytesIO(blob_data))
+    except Exception as e:
+        logging.error(f"Error occurred: {str(e)}")
+        return func.HttpResponse(f"Error occurred: {str(e)}", status_code=500)
 
-        # --- Calculate total number of workers for each year ---
-        df['total_workers'] = df[['0-75%_of_poverty_wages', 
-                                  '75-100%_of_poverty_wages', 
-                                  '100-125%_of_poverty_wages', 
-                                  '125-200%_of_poverty_wages', 
-                                  '200-300%_of_poverty_wages', 
-                                  '300%+_of_poverty_wages']].sum(axis=1)
+def charts(results):
+    """Charts of the report, in page order."""
+    return [
+        Chart('line_chart', draw_line_chart, {
+            'years': results['bracket_totals_by_year']['year'],
+            'proportion_above_300': results['share_above_300'],
+        }),
+    ]
 
-        # --- Calculate the proportion of workers earning above 300% of poverty wages ---
-        df['proportion_above_300%'] = df['300%+_of_poverty_wages'] / df['total_workers']
+def draw_line_chart(years, proportion_above_300):
+    # --- Plot the proportion of workers earning above 300% of the poverty level over time ---
+    fig, ax = new_figure(figsize=(10, 6))
+    ax.plot(years, proportion_above_300, marker='o', linestyle='-', color='blue')
+    ax.set_title('Proportion of Workers Earning Above 300% of Poverty Level Over Time')
+    ax.set_xlabel('Year')
+    ax.set_ylabel('Proportion of Workers (300%+ of Poverty Level)')
+    ax.grid(True)
+    fig.tight_layout()
+    return fig
 
-        # --- Plot the proportion of workers earning above 300% of the poverty level over time ---
-        plt.figure(figsize=(10, 6))
-        plt.plot(df['year'], df['proportion_above_300%'], marker='o', linestyle='-', color='blue')
-        plt.title('Proportion of Workers Earning Above 300% of Poverty Level Over Time')
-        plt.xlabel('Year')
-        plt.ylabel('Proportion of Workers (300%+ of Poverty Level)')
-        plt.grid(True)
-        plt.tight_layout()
+def render_json(results):
+    """Share of workers above 300% of the poverty level, per year, as JSON."""
+    response_data = {
+        "years": results['bracket_totals_by_year']['year'],
+        "proportion_above_300": results['share_above_300'],
+    }
+    return json_body(response_data)
 
-        # Save the plot to an in-memory bytes buffer
-        line_chart_buffer = io.BytesIO()
-        plt.savefig(line_chart_buffer, format='png')
-        line_chart_buffer.seek(0)
-        line_chart_base64 = base64.b64encode(line_chart_buffer.getvalue()).decode('utf-8')
+def render(results, etag):
+    """Render the share of workers above 300% of the poverty level as an HTML report."""
+    # --- Proportion of workers earning above 300% of poverty wages, per year ---
+    years = results['bracket_totals_by_year']['year']
+    proportion_above_300 = results['share_above_300']
 
-        # Generate the HTML response
-        html_response = f"""
-        <html>
-        <body>
-            <h1>Proportion of Workers Earning Above 300% of Poverty Level Over Time</h1>
-            <h2>Proportion Data</h2>
-            <table border="1">
-                <tr>
-                    <th>Year</th>
-                    <th>Proportion of Workers (300%+)</th>
-                </tr>
-                {"".join([f"<tr><td>{int(row['year'])}</td><td>{row['proportion_above_300%']:.2%}</td></tr>" for _, row in df.iterrows()])}
-            </table>
-            <h2>Trend Chart</h2>
-            <img src="data:image/png;base64,{line_chart_base64}" alt="Proportion of Workers Earning Above 300% of Poverty Level">
-        </body>
-        </html>
-        """
+    # Chart URLs; the charts are drawn only when the chart cache misses
+    images = chart_cache.urls(FUNCTION_NAME, charts(results), etag)
 
-        return func.HttpResponse(html_response, mimetype="text/html", status_code=200)
+    rows = table_rows([years, proportion_above_300 * 100], ['%d', '%.2f%%'])
+    return REPORT.render(rows=rows, images=images)
 
-    except Exception as e:
-        logging.error(f"Error occurred: {str(e)}")
-        return func.HttpResponse(f"Error occurred: {str(e)}", status_code=500)
+# HTML response with the table and chart
+REPORT = report_template("""
+    <html>
+    <body>
+        <h1>Proportion of Workers Earning Above 300% of Poverty Level Over Time</h1>
+        <h2>Proportion Data</h2>
+        <table border="1">
+            <tr>
+                <th>Year</th>
+                <th>Proportion of Workers (300%+)</th>
+            </tr>
+            {% for chunk in rows %}{{ chunk }}{% endfor %}
+        </table>
+        <h2>Trend Chart</h2>
+        <img src="{{ images['line_chart'] }}" alt="Proportion of Workers Earning Above 300% of Poverty Level">
+    </body>
+    </html>
+    """)
@@ -1,108 +1,142 @@
 import logging
-import os  # Ensure os is imported for environment variables
-import pandas as pd
-import matplotlib.pyplot as plt
 import azure.functions as func
-from azure.storage.blob import BlobServiceClient
-import io
-import base64
+from shared_code.storage import get_container_client
+from shared_code.analytics import analytics
+from shared_code.results import load_result
+from shared_code.chart_cache import chart_cache
+from shared_code.charts import Chart, new_figure
+from shared_code.compression import compressor
+from shared_code.formats import FORMATS, json_body, negotiate
+from shared_code.reports import report_template
+from shared_code.schema import POVERTY_WAGES
+
+FUNCTION_NAME = "HourlyWagesCompMvsW"
+DATASET = POVERTY_WAGES.blob_name
+
+# Metrics of the shared analytics core rendered by this function
+METRICS = ['gender_shares', 'gender_share_summary']
 
 def main(req: func.HttpRequest) -> func.HttpResponse:
     logging.info('Azure HTTP trigger function to analyze poverty-level wages for men and women.')
 
+    # Output format, from the format parameter or the Accept header
+    try:
+        response_format = negotiate(req)
+    except ValueError:
+        return func.HttpResponse(f"Invalid format. Choose from {list(FORMATS)}.", status_code=400)
+    if response_format is None:
+        return func.HttpResponse(f"Not acceptable. Available formats: {list(FORMATS)}.", status_code=406)
+
     try:
-        # Connect to Blob Storage
-        storage_account_key = os.getenv('AZURE_STORAGE_ACCOUNT_KEY')
-        storage_account_name = os.getenv('AZURE_STORAGE_ACCOUNT_NAME')
-        
-        if not storage_account_key or not storage_account_name:
-            raise ValueError("Azure Storage account credentials are missing.")
-        
-        # Initialize BlobServiceClient with credentials
-        blob_service_client = BlobServiceClient(account_url=f"https://{storage_account_name}.blob.core.windows.net", credential=storage_account_key)
-        container_client = blob_service_client.get_container_client("sources")
-        blob_client = container_client.get_blob_client("poverty_level_wages.csv")
-        
-        # Download the CSV from Blob Storage
-        blob_data = blob_client.download_blob().readall()
-        df = pd.read_csv(io.BytesIO(blob_data))
-
-        # --- Calculations for men and women ---
-        men_mean = df['men_share_below_poverty_wages'].mean()
-        women_mean = df['women_share_below_poverty_wages'].mean()
-
-        men_median = df['men_share_below_poverty_wages'].median()
-        women_median = df['women_share_below_poverty_wages'].median()
-
-        # --- Bar Chart: Comparison of Mean Hourly Poverty-Level Wages Between Men and Women ---
-        plt.figure(figsize=(10, 6))
-        plt.bar(['Men', 'Women'], [men_mean, women_mean], color=['blue', 'orange'])
-        plt.title('Comparison of Mean Hourly Poverty-Level Wages Between Men and Women')
-        plt.xlabel('Gender')
-        plt.ylabel('Mean Hourly Poverty-Level Wage')
-        plt.grid(True)
-        plt.tight_layout()
-
-        # Save the bar chart to an in-memory bytes buffer
-        bar_chart_buffer = io.BytesIO()
-        plt.savefig(bar_chart_buffer, format='png')
-        bar_chart_buffer.seek(0)
-
-        # Encode the image to Base64
-        bar_chart_base64 = base64.b64encode(bar_chart_buffer.getvalue()).decode('utf-8')
-
-        # --- Box Plot: Distribution of Hourly Poverty-Level Wages by Gender ---
-        plt.figure(figsize=(10, 6))
-        plt.boxplot(
-            [df['men_share_below_poverty_wages'].dropna(), df['women_share_below_poverty_wages'].dropna()],
-            labels=['Men', 'Women']
-        )
-        plt.title('Distribution of Hourly Poverty-Level Wages by Gender')
-        plt.ylabel('Hourly Poverty-Level Wage')
-        plt.grid(True)
-        plt.tight_layout()
-
-        # Save the box plot to an in-memory bytes buffer
-        box_plot_buffer = io.BytesIO()
-        plt.savefig(box_plot_buffer, format='png')
-        box_plot_buffer.seek(0)
-
-        # Encode the image to Base64
-        box_plot_base64 = base64.b64encode(box_plot_buffer.getvalue()).decode('utf-8')
-
-        # Combine results into JSON
-        response_data = {
-            "men_mean": men_mean,
-            "women_mean": women_mean,
-            "men_median": men_median,
-            "women_median": women_median
-        }
-
-        # HTML response with Base64-encoded images
-        html_response = f"""
-        <html>
-        <body>
-            <h1>Poverty-Level Wage Analysis for Men and Women</h1>
-            <h2>Mean Hourly Poverty-Level Wage:</h2>
-            <ul>
-                <li>Men: {men_mean:.2f}%</li>
-                <li>Women: {women_mean:.2f}%</li>
-            </ul>
-            <h2>Median Hourly Poverty-Level Wage:</h2>
-            <ul>
-                <li>Men: {men_median:.2f}%</li>
-                <li>Women: {women_median:.2f}%</li>
-            </ul>
-            <h2>Bar Chart: Mean Hourly Poverty-Level Wages Comparison</h2>
-            <img src="data:image/png;base64,{bar_chart_base64}" alt="Bar Chart">
-            <h2>Box Plot: Hourly Poverty-Level Wages Distribution by Gender</h2>
-            <img src="data:image/png;base64,{box_plot_base64}" alt="Box Plot">
-        </body>
-        </html>
-        """
-
-        return func.HttpResponse(html_response, mimetype="text/html", status_code=200)
+        # Serve the HTML report precomputed by MaterializeResults, computing it live on a miss
+        body = load_result(FUNCTION_NAME, DATASET) if response_format == 'html' else None
+        if body is None:
+            # Shared, pooled Blob Storage client (built once per worker process)
+            container_client = get_container_client("sources")
+
+            # Evaluate this analysis' metrics through the shared, memoized analytics core
+            results, etag = analytics.compute(container_client, METRICS)
+            if response_format == 'json':
+                body = render_json(results)
+            elif response_format == 'svg':
+                body = chart_cache.svg_document(FUNCTION_NAME, charts(results), etag)
+            else:
+                body = render(results, etag)
+
+        # Compressed when the client accepts it (and the body is large enough to be worth it)
+        body, headers = compressor.respond(req, body, FORMATS[response_format], {'Vary': 'Accept'})
+        return func.HttpResponse(body, mimetype=FORMATS[response_format], status_code=200, headers=headers)
 
     except Exception as e:
         logging.error(f"Error occurred: {str(e)}")
         return func.HttpResponse(f"Error occurred: {str(e)}", status_code=500)
+
+def charts(results):
+    """Charts of the report, in page order."""
+    df = results['gender_shares']
+    summary = results['gender_share_summary']
+    return [
+        Chart('bar_chart', draw_bar_chart, {
+            'men_mean': summary.at['mean', 'men_share_below_poverty_wages'],
+            'women_mean': summary.at['mean', 'women_share_below_poverty_wages'],
+        }),
+        Chart('box_plot', draw_box_plot, {
+            'men': df['men_share_below_poverty_wages'].dropna(),
+            'women': df['women_share_below_poverty_wages'].dropna(),
+        }),
+    ]
+
+def draw_bar_chart(men_mean, women_mean):
+    # --- Bar Chart: Comparison of Mean Hourly Poverty-Level Wages Between Men and Women ---
+    fig, ax = new_figure(figsize=(10, 6))
+    ax.bar(['Men', 'Women'], [men_mean, women_mean], color=['blue', 'orange'])
+    ax.set_title('Comparison of Mean Hourly Poverty-Level Wages Between Men and Women')
+    ax.set_xlabel('Gender')
+    ax.set_ylabel('Mean Hourly Poverty-Level Wage')
+    ax.grid(True)
+    fig.tight_layout()
+    return fig
+
+def draw_box_plot(men, women):
+    # --- Box Plot: Distribution of Hourly Poverty-Level Wages by Gender ---
+    fig, ax = new_figure(figsize=(10, 6))
+    ax.boxplot([men, women], tick_labels=['Men', 'Women'])
+    ax.set_title('Distribution of Hourly Poverty-Level Wages by Gender')
+    ax.set_ylabel('Hourly Poverty-Level Wage')
+    ax.grid(True)
+    fig.tight_layout()
+    return fig
+
+def render_json(results):
+    """Mean and median poverty-level wages for men and women, and the yearly series, as JSON."""
+    df = results['gender_shares']
+    summary = results['gender_share_summary']
+    response_data = {
+        "men_mean": summary.at['mean', 'men_share_below_poverty_wages'],
+        "women_mean": summary.at['mean', 'women_share_below_poverty_wages'],
+        "men_median": summary.at['median', 'men_share_below_poverty_wages'],
+        "women_median": summary.at['median', 'women_share_below_poverty_wages'],
+        "men": df['men_share_below_poverty_wages'],
+        "women": df['women_share_below_poverty_wages'],
+    }
+    return json_body(response_data)
+
+def render(results, etag):
+    """Render mean and median poverty-level wages for men and women as an HTML report."""
+    # --- Summary statistics for men and women ---
+    summary = results['gender_share_summary']
+    men_mean = summary.at['mean', 'men_share_below_poverty_wages']
+    women_mean = summary.at['mean', 'women_share_below_poverty_wages']
+
+    men_median = summary.at['median', 'men_share_below_poverty_wages']
+    women_median = summary.at['median', 'women_share_below_poverty_wages']
+
+    # Chart URLs; the charts are drawn only when the chart cache misses
+    images = chart_cache.urls(FUNCTION_NAME, charts(results), etag)
+
+    return REPORT.render(
+        men_mean=men_mean, women_mean=women_mean, men_median=men_median, women_median=women_median, images=images,
+    )
+
+# HTML response referencing the chart images
+REPORT = report_template("""
+    <html>
+    <body>
+        <h1>Poverty-Level Wage Analysis for Men and Women</h1>
+        <h2>Mean Hourly Poverty-Level Wage:</h2>
+        <ul>
+            <li>Men: {{ '%.2f' | format(men_mean) }}%</li>
+            <li>Women: {{ '%.2f' | format(women_mean) }}%</li>
+        </ul>
+        <h2>Median Hourly Poverty-Level Wage:</h2>
+        <ul>
+            <li>Men: {{ '%.2f' | format(men_median) }}%</li>
+            <li>Women: {{ '%.2f' | format(women_median) }}%</li>
+        </ul>
+        <h2>Bar Chart: Mean Hourly Poverty-Level Wages Comparison</h2>
+        <img src="{{ images['bar_chart'] }}" alt="Bar Chart">
+        <h2>Box Plot: Hourly Poverty-Level Wages Distribution by Gender</h2>
+        <img src="{{ images['box_plot'] }}" alt="Box Plot">
+    </body>
+    </html>
+    """)
@@ -0,0 +1,71 @@
+import importlib
+import logging
+import azure.functions as func
+from shared_code.storage import get_container_client
+from shared_code.dataset_cache import dataset_cache
+from shared_code.analytics import analytics
+from shared_code.results import save_result
+
+# HTTP functions whose responses are precomputed; the parameterised ones are rendered for
+# every (year, education_level) combination present in their dataset
+FUNCTIONS = [
+    'DisparitiesMvsW',
+    'EarningAboveLevel',
+    'HourlyWagesCompMvsW',
+    'PercentageChangeOverYears',
+    'RaceBasedEarning',
+    'TrendingWagesOverYears',
+    'WageInequality',
+    'WageRangesDistribution',
+]
+PARAMETERIZED_FUNCTIONS = [
+    'EducationImpactForDG',
+    'WageGapAndTrendOverYears',
+]
+
+def main(myblob: func.InputStream):
+    logging.info(f'Azure blob trigger function to materialize analysis results for {myblob.name}.')
+
+    # The trigger path is "<container>/<blob name>"
+    blob_name = myblob.name.split('/', 1)[-1]
+    container_client = get_container_client("sources")
+
+    # Revalidate this worker's cached copies so the results are computed from the new blob
+    # (extending them with just the new rows when the blob was only appended to)
+    dataset_cache.expire(container_client, blob_name)
+
+    modules = [importlib.import_module(name) for name in FUNCTIONS + PARAMETERIZED_FUNCTIONS]
+    modules = [module for module in modules if module.DATASET == blob_name]
+    if not modules:
+        return
+
+    # Every metric of every affected function in one pass over one load of the blob
+    metrics = list(dict.fromkeys(name for module in modules for name in module.METRICS))
+    results, source_etag = analytics.compute(container_client, metrics)
+
+    failures = 0
+    for module in modules:
+        name = module.FUNCTION_NAME
+        try:
+            if name in PARAMETERIZED_FUNCTIONS:
+                count = materialize_parameterized(module, results, source_etag)
+            else:
+                save_result(name, module.render(results, source_etag), source_etag)
+                count = 1
+            logging.info(f"Materialized {count} result(s) for {name}.")
+        except Exception as e:
+            failures += 1
+            logging.error(f"Error occurred while materializing {name}: {str(e)}")
+
+    if failures:
+        raise RuntimeError(f"Failed to materialize {failures} function(s) for {blob_name}.")
+
+def materialize_parameterized(module, results, source_etag):
+    count = 0
+    for year in sorted(results['education_tensor'].years):
+        for education_level in module.EDUCATION_LEVELS:
+            html_response = module.render(results, source_etag, int(year), education_level)
+            if html_response is not None:
+                save_result(module.FUNCTION_NAME, html_response, source_etag, year=int(year), education_level=education_level)
+                count += 1
+    return count
@@ -1,75 +1,111 @@
 import logging
-import os  # Ensure os is imported for environment variables
-import pandas as pd
-import matplotlib.pyplot as plt
 import azure.functions as func
-from azure.storage.blob import BlobServiceClient
-import io
-import base64
+from shared_code.storage import get_container_client
+from shared_code.analytics import analytics
+from shared_code.results import load_result
+from shared_code.chart_cache import chart_cache
+from shared_code.charts import Chart, new_figure
+from shared_code.compression import compressor
+from shared_code.formats import FORMATS, json_body, negotiate
+from shared_code.reports import report_template, table_rows
+from shared_code.schema import POVERTY_WAGES
+
+FUNCTION_NAME = "PercentageChangeOverYears"
+DATASET = POVERTY_WAGES.blob_name
+
+# Metrics of the shared analytics core rendered by this function
+METRICS = ['wages_by_year', 'wage_pct_change']
 
 def main(req: func.HttpRequest) -> func.HttpResponse:
     logging.info('Azure HTTP trigger function for calculating percentage change in annual poverty-level wages.')
 
+    # Output format, from the format parameter or the Accept header
     try:
-        # Get environment variables for Azure Storage account
-        storage_account_key = os.getenv('AZURE_STORAGE_ACCOUNT_KEY')
-        storage_account_name = os.getenv('AZURE_STORAGE_ACCOUNT_NAME')
-        
-        if not storage_account_key or not storage_account_name:
-            raise ValueError("Azure Storage account credentials are missing.")
-        
-        # Initialize BlobServiceClient with credentials
-        blob_service_client = BlobServiceClient(account_url=f"https://{storage_account_name}.blob.core.windows.net", credential=storage_account_key)
-        container_client = blob_service_client.get_container_client("sources")
-        blob_client = container_client.get_blob_client("poverty_level_wages.csv")
-        
-        # Download the CSV from Blob Storage
-        blob_data = blob_client.download_blob().readall()
-        df = pd.read_csv(io.BytesIO(blob_data))
-
-        # --- Sort the DataFrame by 'year' in ascending order ---
-        df = df.sort_values(by='year').reset_index(drop=True)
-
-        # --- Calculate the year-over-year percentage change in annual poverty-level wages ---
-        df['pct_change_poverty_wage'] = df['annual_poverty-level_wage'].pct_change() * 100
+        response_format = negotiate(req)
+    except ValueError:
+        return func.HttpResponse(f"Invalid format. Choose from {list(FORMATS)}.", status_code=400)
+    if response_format is None:
+        return func.HttpResponse(f"Not acceptable. Available formats: {list(FORMATS)}.", status_code=406)
 
-        # --- Plot the year-over-year percentage change in poverty-level wages ---
-        plt.figure(figsize=(10, 6))
-        plt.plot(df['year'], df['pct_change_poverty_wage'], marker='o', linestyle='-', color='blue')
-        plt.title('Year-over-Year Percentage Change in Annual Poverty-Level Wages')
-        plt.xlabel('Year')
-        plt.ylabel('Percentage Change (%)')
-        plt.grid(True)
-        plt.tight_layout()
-
-        # Save the plot to an in-memory bytes buffer
-        chart_buffer = io.BytesIO()
-        plt.savefig(chart_buffer, format='png')
-        chart_buffer.seek(0)
-        chart_base64 = base64.b64encode(chart_buffer.getvalue()).decode('utf-8')
+    try:
+        # Serve the HTML report precomputed by MaterializeResults, computing it live on a miss
+        body = load_result(FUNCTION_NAME, DATASET) if response_format == 'html' else None
+        if body is None:
+            # Shared, pooled Blob Storage client (built once per worker process)
+            container_client = get_container_client("sources")
 
-        # Generate the HTML response with table and chart
-        html_response = f"""
-        <html>
-        <body>
-            <h1>Year-over-Year Percentage Change in Annual Poverty-Level Wages</h1>
-            <h2>Percentage Change Data</h2>
-            <table border="1">
-                <tr>
-                    <th>Year</th>
-                    <th>Annual Poverty-Level Wage</th>
-                    <th>Percentage Change (%)</th>
-                </tr>
-                {"".join([f"<tr><td>{int(row['year'])}</td><td>{row['annual_poverty-level_wage']:.2f}</td><td>{row['pct_change_poverty_wage']:.2f}%</td></tr>" for _, row in df.iterrows()])}
-            </table>
-            <h2>Trend Chart</h2>
-            <img src="data:image/png;base64,{chart_base64}" alt="Percentage Change in Poverty-Level Wages">
-        </body>
-        </html>
-        """
+            # Evaluate this analysis' metrics through the shared, memoized analytics core
+            results, etag = analytics.compute(container_client, METRICS)
+            if response_format == 'json':
+                body = render_json(results)
+            elif response_format == 'svg':
+                body = chart_cache.svg_document(FUNCTION_NAME, charts(results), etag)
+            else:
+                body = render(results, etag)
 
-        return func.HttpResponse(html_response, mimetype="text/html", status_code=200)
+        # Compressed when the client accepts it (and the body is large enough to be worth it)
+        body, headers = compressor.respond(req, body, FORMATS[response_format], {'Vary': 'Accept'})
+        return func.HttpResponse(body, mimetype=FORMATS[response_format], status_code=200, headers=headers)
 
     except Exception as e:
         logging.error(f"Error occurred: {str(e)}")
         return func.HttpResponse(f"Error occurred: {str(e)}", status_code=500)
+
+def charts(results):
+    """Charts of the report, in page order."""
+    return [
+        Chart('chart', draw_chart, {'years': results['wages_by_year']['year'], 'pct_change': results['wage_pct_change']}),
+    ]
+
+def draw_chart(years, pct_change):
+    # --- Plot the year-over-year percentage change in poverty-level wages ---
+    fig, ax = new_figure(figsize=(10, 6))
+    ax.plot(years, pct_change, marker='o', linestyle='-', color='blue')
+    ax.set_title('Year-over-Year Percentage Change in Annual Poverty-Level Wages')
+    ax.set_xlabel('Year')
+    ax.set_ylabel('Percentage Change (%)')
+    ax.grid(True)
+    fig.tight_layout()
+    return fig
+
+def render_json(results):
+    """Annual poverty-level wages and their year-over-year percentage change, as JSON."""
+    df = results['wages_by_year']
+    response_data = {
+        "years": df['year'],
+        "annual_poverty_level_wage": df['annual_poverty-level_wage'],
+        "pct_change": results['wage_pct_change'],
+    }
+    return json_body(response_data)
+
+def render(results, etag):
+    """Render the year-over-year change in poverty-level wages as an HTML report."""
+    # --- Wages sorted by year and their year-over-year percentage change ---
+    df = results['wages_by_year']
+    pct_change = results['wage_pct_change']
+
+    # Chart URLs; the charts are drawn only when the chart cache misses
+    images = chart_cache.urls(FUNCTION_NAME, charts(results), etag)
+
+    rows = table_rows([df['year'], df['annual_poverty-level_wage'], pct_change], ['%d', '%.2f', '%.2f%%'])
+    return REPORT.render(rows=rows, images=images)
+
+# HTML response with the table and chart
+REPORT = report_template("""
+    <html>
+    <body>
+        <h1>Year-over-Year Percentage Change in Annual Poverty-Level Wages</h1>
+        <h2>Percentage Change Data</h2>
+        <table border="1">
+            <tr>
+                <th>Year</th>
+                <th>Annual Poverty-Level Wage</th>
+                <th>Percentage Change (%)</th>
+            </tr>
+            {% for chunk in rows %}{{ chunk }}{% endfor %}
+        </table>
+        <h2>Trend Chart</h2>
+        <img src="{{ images['chart'] }}" alt="Percentage Change in Poverty-Level Wages">
+    </body>
+    </html>
+    """)
@@ -1,106 +1,131 @@
 import logging
-import os  # Ensure os is imported for environment variables
-import pandas as pd
-import matplotlib.pyplot as plt
 import azure.functions as func
-from azure.storage.blob import BlobServiceClient
-import io
-import base64
+from shared_code.storage import get_container_client
+from shared_code.analytics import analytics
+from shared_code.results import load_result
+from shared_code.chart_cache import chart_cache
+from shared_code.charts import Chart, new_figure
+from shared_code.compression import compressor
+from shared_code.formats import FORMATS, json_body, negotiate
+from shared_code.reports import report_template
+from shared_code.schema import POVERTY_WAGES
+
+FUNCTION_NAME = "RaceBasedEarning"
+DATASET = POVERTY_WAGES.blob_name
+
+# Metrics of the shared analytics core rendered by this function
+METRICS = ['race_shares', 'race_share_means']
+
+RACES = ['white', 'black', 'hispanic']
 
 def main(req: func.HttpRequest) -> func.HttpResponse:
     logging.info('Azure HTTP trigger function to analyze share of workers earning below poverty-level wages by race.')
 
+    # Output format, from the format parameter or the Accept header
+    try:
+        response_format = negotiate(req)
+    except ValueError:
+        return func.HttpResponse(f"Invalid format. Choose from {list(FORMATS)}.", status_code=400)
+    if response_format is None:
+        return func.HttpResponse(f"Not acceptable. Available formats: {list(FORMATS)}.", status_code=406)
+
     try:
-        # Get environment variables for Azure Storage account
-        storage_account_key = os.getenv('AZURE_STORAGE_ACCOUNT_KEY')
-        storage_account_name = os.getenv('AZURE_STORAGE_ACCOUNT_NAME')
-        
-        if not storage_account_key or not storage_account_name:
-            raise ValueError("Azure Storage account credentials are missing.")
-        
-        # Initialize BlobServiceClient with credentials
-        blob_service_client = BlobServiceClient(account_url=f"https://{storage_account_name}.blob.core.windows.net", credential=storage_account_key)
-        container_client = blob_service_client.get_container_client("sources")
-        blob_client = container_client.get_blob_client("poverty_level_wages.csv")
-        
-        # Download the CSV from Blob Storage
-        blob_data = blob_client.download_blob().readall()
-        df = pd.read_csv(io.BytesIO(blob_data))
-
-        # --- Calculations for racial groups ---
-        white_mean = df['white_share_below_poverty_wages'].mean()
-        black_mean = df['black_share_below_poverty_wages'].mean()
-        hispanic_mean = df['hispanic_share_below_poverty_wages'].mean()
-
-        # --- Bar Chart: Mean Share of Workers Earning Below Poverty-Level Wages by Race ---
-        races = ['White', 'Black', 'Hispanic']
-        mean_shares = [white_mean, black_mean, hispanic_mean]
-
-        plt.figure(figsize=(10, 6))
-        plt.bar(races, mean_shares, color=['blue', 'green', 'orange'])
-        plt.title('Mean Share of Workers Earning Below Poverty-Level Wages by Race')
-        plt.xlabel('Race')
-        plt.ylabel('Mean Share Below Poverty-Level Wages (%)')
-        plt.grid(True)
-        plt.tight_layout()
-
-        # Save the bar chart to an in-memory bytes buffer
-        bar_chart_buffer = io.BytesIO()
-        plt.savefig(bar_chart_buffer, format='png')
-        bar_chart_buffer.seek(0)
-
-        # Encode the image to Base64
-        bar_chart_base64 = base64.b64encode(bar_chart_buffer.getvalue()).decode('utf-8')
-
-        # --- Line Chart: Trends in Share of Workers Earning Below Poverty-Level Wages by Race Over Time ---
-        plt.figure(figsize=(12, 6))
-        plt.plot(df['year'], df['white_share_below_poverty_wages'], label='White', marker='o', color='blue')
-        plt.plot(df['year'], df['black_share_below_poverty_wages'], label='Black', marker='o', color='green')
-        plt.plot(df['year'], df['hispanic_share_below_poverty_wages'], label='Hispanic', marker='o', color='orange')
-
-        plt.title('Trends in Share of Workers Earning Below Poverty-Level Wages by Race Over Time')
-        plt.xlabel('Year')
-        plt.ylabel('Share Below Poverty-Level Wages (%)')
-        plt.legend()
-        plt.grid(True)
-        plt.tight_layout()
-
-        # Save the trend line chart to an in-memory bytes buffer
-        trend_chart_buffer = io.BytesIO()
-        plt.savefig(trend_chart_buffer, format='png')
-        trend_chart_buffer.seek(0)
-
-        # Encode the image to Base64
-        trend_chart_base64 = base64.b64encode(trend_chart_buffer.getvalue()).decode('utf-8')
-
-        # Combine results into JSON
-        response_data = {
-            "white_mean": white_mean,
-            "black_mean": black_mean,
-            "hispanic_mean": hispanic_mean
-        }
-
-        # HTML response with Base64-encoded images
-        html_response = f"""
-        <html>
-        <body>
-            <h1>Analysis of Workers Earning Below Poverty-Level Wages by Race</h1>
-            <h2>Mean Share of Workers Earning Below Poverty-Level Wages by Race:</h2>
-            <ul>
-                <li>White: {white_mean:.2f}%</li>
-                <li>Black: {black_mean:.2f}%</li>
-                <li>Hispanic: {hispanic_mean:.2f}%</li>
-            </ul>
-            <h2>Bar Chart: Mean Share of Workers Below Poverty-Level Wages by Race</h2>
-            <img src="data:image/png;base64,{bar_chart_base64}" alt="Bar Chart">
-            <h2>Line Chart: Trends in Share of Workers Earning Below Poverty-Level Wages by Race Over Time</h2>
-            <img src="data:image/png;base64,{trend_chart_base64}" alt="Trend Line Chart">
-        </body>
-        </html>
-        """
-
-        return func.HttpResponse(html_response, mimetype="text/html", status_code=200)
+        # Serve the HTML report precomputed by MaterializeResults, computing it live on a miss
+        body = load_result(FUNCTION_NAME, DATASET) if response_format == 'html' else None
+        if body is None:
+            # Shared, pooled Blob Storage client (built once per worker process)
+            container_client = get_container_client("sources")
+
+            # Evaluate this analysis' metrics through the shared, memoized analytics core
+            results, etag = analytics.compute(container_client, METRICS)
+            if response_format == 'json':
+                body = render_json(results)
+            elif response_format == 'svg':
+                body = chart_cache.svg_document(FUNCTION_NAME, charts(results), etag)
+            else:
+                body = render(results, etag)
+
+        # Compressed when the client accepts it (and the body is large enough to be worth it)
+        body, headers = compressor.respond(req, body, FORMATS[response_format], {'Vary': 'Accept'})
+        return func.HttpResponse(body, mimetype=FORMATS[response_format], status_code=200, headers=headers)
 
     except Exception as e:
         logging.error(f"Error occurred: {str(e)}")
         return func.HttpResponse(f"Error occurred: {str(e)}", status_code=500)
+
+def charts(results):
+    """Charts of the report, in page order."""
+    means = results['race_share_means']
+    return [
+        Chart('bar_chart', draw_bar_chart, {
+            'mean_shares': [means[f'{race}_share_below_poverty_wages'] for race in RACES],
+        }),
+        Chart('trend_chart', draw_trend_chart, {'df': results['race_shares']}),
+    ]
+
+def draw_bar_chart(mean_shares):
+    # --- Bar Chart: Mean Share of Workers Earning Below Poverty-Level Wages by Race ---
+    fig, ax = new_figure(figsize=(10, 6))
+    ax.bar(['White', 'Black', 'Hispanic'], mean_shares, color=['blue', 'green', 'orange'])
+    ax.set_title('Mean Share of Workers Earning Below Poverty-Level Wages by Race')
+    ax.set_xlabel('Race')
+    ax.set_ylabel('Mean Share Below Poverty-Level Wages (%)')
+    ax.grid(True)
+    fig.tight_layout()
+    return fig
+
+def draw_trend_chart(df):
+    # --- Line Chart: Trends in Share of Workers Earning Below Poverty-Level Wages by Race Over Time ---
+    fig, ax = new_figure(figsize=(12, 6))
+    ax.plot(df['year'], df['white_share_below_poverty_wages'], label='White', marker='o', color='blue')
+    ax.plot(df['year'], df['black_share_below_poverty_wages'], label='Black', marker='o', color='green')
+    ax.plot(df['year'], df['hispanic_share_below_poverty_wages'], label='Hispanic', marker='o', color='orange')
+
+    ax.set_title('Trends in Share of Workers Earning Below Poverty-Level Wages by Race Over Time')
+    ax.set_xlabel('Year')
+    ax.set_ylabel('Share Below Poverty-Level Wages (%)')
+    ax.legend()
+    ax.grid(True)
+    fig.tight_layout()
+    return fig
+
+def render_json(results):
+    """Mean share below poverty-level wages by race, and the yearly series, as JSON."""
+    df = results['race_shares']
+    means = results['race_share_means']
+    response_data = {f"{race}_mean": means[f'{race}_share_below_poverty_wages'] for race in RACES}
+    response_data["years"] = df['year']
+    response_data["by_year"] = {race: df[f'{race}_share_below_poverty_wages'] for race in RACES}
+    return json_body(response_data)
+
+def render(results, etag):
+    """Render the mean share below poverty-level wages by race as an HTML report."""
+    # --- Means for racial groups ---
+    means = results['race_share_means']
+    white_mean = means['white_share_below_poverty_wages']
+    black_mean = means['black_share_below_poverty_wages']
+    hispanic_mean = means['hispanic_share_below_poverty_wages']
+
+    # Chart URLs; the charts are drawn only when the chart cache misses
+    images = chart_cache.urls(FUNCTION_NAME, charts(results), etag)
+
+    return REPORT.render(white_mean=white_mean, black_mean=black_mean, hispanic_mean=hispanic_mean, images=images)
+
+# HTML response referencing the chart images
+REPORT = report_template("""
+    <html>
+    <body>
+        <h1>Analysis of Workers Earning Below Poverty-Level Wages by Race</h1>
+        <h2>Mean Share of Workers Earning Below Poverty-Level Wages by Race:</h2>
+        <ul>
+            <li>White: {{ '%.2f' | format(white_mean) }}%</li>
+            <li>Black: {{ '%.2f' | format(black_mean) }}%</li>
+            <li>Hispanic: {{ '%.2f' | format(hispanic_mean) }}%</li>
+        </ul>
+        <h2>Bar Chart: Mean Share of Workers Below Poverty-Level Wages by Race</h2>
+        <img src="{{ images['bar_chart'] }}" alt="Bar Chart">
+        <h2>Line Chart: Trends in Share of Workers Earning Below Poverty-Level Wages by Race Over Time</h2>
+        <img src="{{ images['trend_chart'] }}" alt="Trend Line Chart">
+    </body>
+    </html>
+    """)
@@ -1,123 +1,80 @@
 import logging
-import os  # Ensure os is imported to use os.getenv
-import pandas as pd
-import matplotlib.pyplot as plt
 import numpy as np
-from sklearn.linear_model import LinearRegression
 import azure.functions as func
-from azure.storage.blob import BlobServiceClient
-import io
-import base64
+from shared_code.storage import get_container_client
+from shared_code.analytics import analytics
+from shared_code.results import load_result
+from shared_code.chart_cache import chart_cache
+from shared_code.charts import Chart, new_figure
+from shared_code.compression import compressor
+from shared_code.formats import FORMATS, json_body, negotiate
+from shared_code.reports import report_template, table_rows
+from shared_code.schema import POVERTY_WAGES, WAGES_BY_EDUCATION
+
+FUNCTION_NAME = "TrendingWagesOverYears"
+DATASET = POVERTY_WAGES.blob_name
+EDUCATION_DATASET = WAGES_BY_EDUCATION.blob_name
+
+# Metrics of the shared analytics core rendered by this function
+METRICS = ['wages_by_year', 'wage_pct_change', 'wage_moving_average', 'wage_trend', 'poverty_trend_moments']
+
+# Trend moments of every series of the education dataset, for the JSON output
+EDUCATION_METRICS = ['education_trend_moments']
+
+MAX_FORECAST_YEARS = 50
 
 def main(req: func.HttpRequest) -> func.HttpResponse:
     logging.info('Azure HTTP trigger function to process and visualize poverty-level wages.')
 
+    # Optional number of future years to forecast and interval level
+    forecast_years = req.params.get('forecast', '0')
+    level = req.params.get('level', '0.95')
+
+    if not forecast_years.isdigit() or int(forecast_years) > MAX_FORECAST_YEARS:
+        return func.HttpResponse(f"Invalid forecast. Please provide a number of years up to {MAX_FORECAST_YEARS}.", status_code=400)
+    forecast_years = int(forecast_years)
+
+    try:
+        level = float(level)
+    except ValueError:
+        level = None
+    if level is None or not 0 < level < 1:
+        return func.HttpResponse("Invalid level. Please provide a prediction interval level between 0 and 1.", status_code=400)
+
+    # Output format, from the format parameter or the Accept header
     try:
-        # Get environment variables for Azure Storage account
-        storage_account_key = os.getenv('AZURE_STORAGE_ACCOUNT_KEY')
-        storage_account_name = os.getenv('AZURE_STORAGE_ACCOUNT_NAME')
-        
-        if not storage_account_key or not storage_account_name:
-            raise ValueError("Azure Storage account credentials are missing.")
-        
-        # Initialize BlobServiceClient with credentials
-        blob_service_client = BlobServiceClient(account_url=f"https://{storage_account_name}.blob.core.windows.net", credential=storage_account_key)
-        container_client = blob_service_client.get_container_client("sources")
-        blob_client = container_client.get_blob_client("poverty_level_wages.csv")
-
-        # Download the CSV from Blob Storage
-        download_stream = blob_client.download_blob()
-        df = pd.read_csv(io.StringIO(download_stream.content_as_text()))
-
-        # Ensure necessary columns are present
-        required_columns = ['year', 'annual_poverty-level_wage']
-        if not all(col in df.columns for col in required_columns):
-            raise ValueError("Missing required columns in dataset")
-
-        # Sort the DataFrame by 'year' in ascending order
-        df = df.sort_values(by='year', ascending=True)
-
-        # Calculate the year-over-year percentage change
-        df['percentage_change'] = df['annual_poverty-level_wage'].pct_change() * 100
-
-        # Create HTML for the percentage change display
-        percentage_change_html = df[['year', 'annual_poverty-level_wage', 'percentage_change']].to_html(index=False)
-
-        # Plotting the trend
-        plt.figure(figsize=(10, 6))
-        plt.plot(df['year'], df['annual_poverty-level_wage'], marker='o', linestyle='-', color='b')
-        plt.title('Trend of Annual Poverty-Level Wages Over the Years')
-        plt.xlabel('Year')
-        plt.ylabel('Annual Poverty-Level Wage')
-        plt.grid(True)
-        plt.tight_layout()
-        trend_plot_path = '/tmp/trend_plot.png'
-        plt.savefig(trend_plot_path)
-        plt.close()
-
-        # Calculate a moving average to smooth the data
-        df['moving_average'] = df['annual_poverty-level_wage'].rolling(window=3).mean()
-
-        # Plot the moving average
-        plt.figure(figsize=(10, 6))
-        plt.plot(df['year'], df['annual_poverty-level_wage'], marker='o', linestyle='-', color='b', label='Annual Wage')
-        plt.plot(df['year'], df['moving_average'], color='orange', linestyle='--', label='3-Year Moving Average')
-        plt.title('Trend of Annual Poverty-Level Wages Over the Years')
-        plt.xlabel('Year')
-        plt.ylabel('Annual Poverty-Level Wage')
-        plt.legend()
-        plt.grid(True)
-        plt.tight_layout()
-        moving_avg_plot_path = '/tmp/moving_avg_plot.png'
-        plt.savefig(moving_avg_plot_path)
-        plt.close()
-
-        # Prepare the data for linear regression
-        X = df['year'].values.reshape(-1, 1)
-        y = df['annual_poverty-level_wage'].values
-
-        # Create and fit a linear regression model
-        model = LinearRegression()
-        model.fit(X, y)
-
-        # Predict using the model
-        df['trend'] = model.predict(X)
-
-        # Plot the trend line
-        plt.figure(figsize=(10, 6))
-        plt.plot(df['year'], df['annual_poverty-level_wage'], marker='o', linestyle='-', color='b', label='Annual Wage')
-        plt.plot(df['year'], df['trend'], color='r', linestyle='--', label='Trend Line (Linear Regression)')
-        plt.title('Trend of Annual Poverty-Level Wages Over the Years')
-        plt.xlabel('Year')
-        plt.ylabel('Annual Poverty-Level Wage')
-        plt.legend()
-        plt.grid(True)
-        plt.tight_layout()
-        trend_line_plot_path = '/tmp/trend_line_plot.png'
-        plt.savefig(trend_line_plot_path)
-        plt.close()
-
-        # Generate HTML to display the plots
-        plots_html = f"""
-        <html>
-        <body>
-            <h1>Analysis of Annual Poverty-Level Wages</h1>
-            <h2>Percentage Change</h2>
-            {percentage_change_html}
-            <h2>Trend Plot</h2>
-            <img src="data:image/png;base64,{plot_to_base64(trend_plot_path)}" alt="Trend Plot"/>
-            <h2>Moving Average Plot</h2>
-            <img src="data:image/png;base64,{plot_to_base64(moving_avg_plot_path)}" alt="Moving Average Plot"/>
-            <h2>Linear Regression Trend Line Plot</h2>
-            <img src="data:image/png;base64,{plot_to_base64(trend_line_plot_path)}" alt="Trend Line Plot"/>
-        </body>
-        </html>
-        """
+        response_format = negotiate(req)
+    except ValueError:
+        return func.HttpResponse(f"Invalid format. Choose from {list(FORMATS)}.", status_code=400)
+    if response_format is None:
+        return func.HttpResponse(f"Not acceptable. Available formats: {list(FORMATS)}.", status_code=406)
 
+    try:
+        # Serve the result precomputed by MaterializeResults, computing it live on a miss;
+        # only the default report is materialized
+        body = load_result(FUNCTION_NAME, DATASET) if response_format == 'html' and not forecast_years else None
+        if body is None:
+            # Shared, pooled Blob Storage client (built once per worker process)
+            container_client = get_container_client("sources")
+
+            # Evaluate this analysis' metrics through the shared, memoized analytics core
+            results, etag = analytics.compute(container_client, METRICS)
+
+            if response_format == 'json':
+                education_results, _ = analytics.compute(container_client, EDUCATION_METRICS)
+                body = render_json(results, education_results, forecast_years, level)
+            elif response_format == 'svg':
+                body = chart_cache.svg_document(FUNCTION_NAME, charts(results, forecast_years, level), etag)
+            else:
+                body = render(results, etag, forecast_years, level)
+
+        # Compressed when the client accepts it (and the body is large enough to be worth it)
+        body, headers = compressor.respond(req, body, FORMATS[response_format], {'Vary': 'Accept'})
         return func.HttpResponse(
-            plots_html,
-            mimetype="text/html",
-            status_code=200
+            body,
+            mimetype=FORMATS[response_format],
+            status_code=200,
+            headers=headers
         )
     
     except Exception as e:
@@ -127,6 +84,162 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
             status_code=500
         )
 
-def plot_to_base64(plot_path):
-    with open(plot_path, "rb") as image_file:
-        return base64.b64encode(image_file.read()).decode('utf-8')
+def forecast_range(results, forecast_years):
+    """The ``forecast_years`` years following the last year in the dataset."""
+    last_year = int(results['wages_by_year']['year'].max())
+    return np.arange(last_year + 1, last_year + 1 + forecast_years)
+
+def wage_forecast(results, forecast_years, level):
+    """``(years, prediction, lower, upper)`` of the wage, from the closed-form trend line."""
+    moments = results['poverty_trend_moments']
+    wage = moments.columns.index('annual_poverty-level_wage')
+    years = forecast_range(results, forecast_years)
+    prediction, lower, upper = (values[:, wage] for values in moments.forecast(years, level))
+    return years, prediction, lower, upper
+
+def charts(results, forecast_years=0, level=0.95):
+    """Charts of the report, in page order (the forecast plot only when forecasting)."""
+    df = results['wages_by_year']
+    report = [
+        Chart('trend_plot', draw_trend_plot, {'df': df}),
+        Chart('moving_avg_plot', draw_moving_avg_plot, {'df': df, 'moving_average': results['wage_moving_average']}),
+        Chart('trend_line_plot', draw_trend_line_plot, {'df': df, 'trend': results['wage_trend']}),
+    ]
+    if forecast_years:
+        years, prediction, lower, upper = wage_forecast(results, forecast_years, level)
+        report.append(Chart('forecast_plot', draw_forecast_plot, {
+            'df': df, 'years': years, 'prediction': prediction, 'lower': lower, 'upper': upper, 'level': level,
+        }, {'forecast': forecast_years, 'level': level}))
+    return report
+
+def draw_trend_plot(df):
+    # Plotting the trend
+    fig, ax = new_figure(figsize=(10, 6))
+    ax.plot(df['year'], df['annual_poverty-level_wage'], marker='o', linestyle='-', color='b')
+    ax.set_title('Trend of Annual Poverty-Level Wages Over the Years')
+    ax.set_xlabel('Year')
+    ax.set_ylabel('Annual Poverty-Level Wage')
+    ax.grid(True)
+    fig.tight_layout()
+    return fig
+
+def draw_moving_avg_plot(df, moving_average):
+    # Plot the moving average
+    fig, ax = new_figure(figsize=(10, 6))
+    ax.plot(df['year'], df['annual_poverty-level_wage'], marker='o', linestyle='-', color='b', label='Annual Wage')
+    ax.plot(df['year'], moving_average, color='orange', linestyle='--', label='3-Year Moving Average')
+    ax.set_title('Trend of Annual Poverty-Level Wages Over the Years')
+    ax.set_xlabel('Year')
+    ax.set_ylabel('Annual Poverty-Level Wage')
+    ax.legend()
+    ax.grid(True)
+    fig.tight_layout()
+    return fig
+
+def draw_trend_line_plot(df, trend):
+    # Plot the trend line
+    fig, ax = new_figure(figsize=(10, 6))
+    ax.plot(df['year'], df['annual_poverty-level_wage'], marker='o', linestyle='-', color='b', label='Annual Wage')
+    ax.plot(df['year'], trend, color='r', linestyle='--', label='Trend Line (Linear Regression)')
+    ax.set_title('Trend of Annual Poverty-Level Wages Over the Years')
+    ax.set_xlabel('Year')
+    ax.set_ylabel('Annual Poverty-Level Wage')
+    ax.legend()
+    ax.grid(True)
+    fig.tight_layout()
+    return fig
+
+def draw_forecast_plot(df, years, prediction, lower, upper, level):
+    # Plot the forecast with its prediction interval
+    fig, ax = new_figure(figsize=(10, 6))
+    ax.plot(df['year'], df['annual_poverty-level_wage'], marker='o', linestyle='-', color='b', label='Annual Wage')
+    ax.plot(years, prediction, color='r', linestyle='--', label='Forecast')
+    ax.fill_between(years, lower, upper, color='r', alpha=0.2, label=f'{level:.0%} Prediction Interval')
+    ax.set_title('Forecast of Annual Poverty-Level Wages')
+    ax.set_xlabel('Year')
+    ax.set_ylabel('Annual Poverty-Level Wage')
+    ax.legend()
+    ax.grid(True)
+    fig.tight_layout()
+    return fig
+
+def render_json(results, education_results, forecast_years=0, level=0.95):
+    """Trend lines of every wage and share series in both datasets, with optional forecasts."""
+    df = results['wages_by_year']
+    years = forecast_range(results, forecast_years)
+    response_data = {
+        "level": level,
+        "forecast_years": years.tolist(),
+        "trends": {
+            POVERTY_WAGES.blob_name: results['poverty_trend_moments'].summary(years, level),
+            EDUCATION_DATASET: education_results['education_trend_moments'].summary(years, level),
+        },
+        "series": {
+            "years": df['year'],
+            "annual_poverty_level_wage": df['annual_poverty-level_wage'],
+            "pct_change": results['wage_pct_change'],
+            "moving_average": results['wage_moving_average'],
+            "trend": results['wage_trend'],
+        },
+    }
+    return json_body(response_data)
+
+def render(results, etag, forecast_years=0, level=0.95):
+    """Render the trend, moving average and regression line (and forecast) as an HTML report."""
+    # Wages sorted by year, in ascending order
+    df = results['wages_by_year']
+
+    # Rows of the percentage change table
+    percentage_change_rows = table_rows(
+        [df['year'], df['annual_poverty-level_wage'], results['wage_pct_change']], ['%d', '%.6f', '%.6f'],
+    )
+
+    # Chart URLs; the charts are drawn only when the chart cache misses
+    images = chart_cache.urls(FUNCTION_NAME, charts(results, forecast_years, level), etag)
+
+    forecast_rows = None
+    if forecast_years:
+        # Forecast the wage from the closed-form trend line, with prediction intervals
+        forecast_rows = table_rows(wage_forecast(results, forecast_years, level), ['%d', '%.2f', '%.2f', '%.2f'])
+
+    return REPORT.render(
+        percentage_change_rows=percentage_change_rows, forecast_rows=forecast_rows,
+        forecast_years=forecast_years, level=level, images=images,
+    )
+
+# HTML to display the tables and plots
+REPORT = report_template("""
+    <html>
+    <body>
+        <h1>Analysis of Annual Poverty-Level Wages</h1>
+        <h2>Percentage Change</h2>
+        <table border="1">
+            <tr>
+                <th>year</th>
+                <th>annual_poverty-level_wage</th>
+                <th>percentage_change</th>
+            </tr>
+            {% for chunk in percentage_change_rows %}{{ chunk }}{% endfor %}
+        </table>
+        <h2>Trend Plot</h2>
+        <img src="{{ images['trend_plot'] }}" alt="Trend Plot"/>
+        <h2>Moving Average Plot</h2>
+        <img src="{{ images['moving_avg_plot'] }}" alt="Moving Average Plot"/>
+        <h2>Linear Regression Trend Line Plot</h2>
+        <img src="{{ images['trend_line_plot'] }}" alt="Trend Line Plot"/>
+        {% if forecast_years %}
+        <h2>Forecast for the Next {{ forecast_years }} Years</h2>
+        <table border="1">
+            <tr>
+                <th>Year</th>
+                <th>Forecast</th>
+                <th>Lower ({{ '%.0f' | format(level * 100) }}%)</th>
+                <th>Upper ({{ '%.0f' | format(level * 100) }}%)</th>
+            </tr>
+            {% for chunk in forecast_rows %}{{ chunk }}{% endfor %}
+        </table>
+        <img src="{{ images['forecast_plot'] }}" alt="Forecast Plot"/>
+        {% endif %}
+    </body>
+    </html>
+    """)
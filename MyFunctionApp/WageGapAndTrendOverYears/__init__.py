@@ -1,16 +1,35 @@
 import logging
-import os
-import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
+import numpy as np
 import azure.functions as func
-from azure.storage.blob import BlobServiceClient
-import io
-import base64
+from shared_code.storage import get_container_client
+from shared_code.analytics import analytics
+from shared_code.results import load_result
+from shared_code.chart_cache import chart_cache
+from shared_code.charts import Chart, new_figure
+from shared_code.compression import compressor
+from shared_code.formats import FORMATS, json_body, negotiate
+from shared_code.reports import report_template, table_rows
+from shared_code.plotting import cycle_colors, draw_bars, draw_lines
+from shared_code.schema import EDUCATION_LEVELS, WAGES_BY_EDUCATION
+from shared_code.queries import parse_levels, parse_years
+
+FUNCTION_NAME = "WageGapAndTrendOverYears"
+DATASET = WAGES_BY_EDUCATION.blob_name
+
+# Metrics of the shared analytics core rendered by this function
+METRICS = ['education_tensor', 'attainment_proportions_of_men']
 
 def main(req: func.HttpRequest) -> func.HttpResponse:
     logging.info('Azure HTTP trigger function processed a request.')
 
+    # Output format, from the format parameter or the Accept header
+    try:
+        response_format = negotiate(req)
+    except ValueError:
+        return func.HttpResponse(f"Invalid format. Choose from {list(FORMATS)}.", status_code=400)
+    if response_format is None:
+        return func.HttpResponse(f"Not acceptable. Available formats: {list(FORMATS)}.", status_code=406)
+
     # Check if we received a year parameter
     specific_year = req.params.get('year')
     education_level = req.params.get('education_level')
@@ -24,6 +43,9 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
             specific_year = req_body.get('year')
             education_level = req_body.get('education_level')
 
+    if not specific_year and response_format != 'html':
+        return func.HttpResponse("Please provide a year.", status_code=400)
+
     if not specific_year:
         # If no year parameter is provided, return the HTML form
         html_response = """
@@ -32,10 +54,10 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
             <h1>Select Year and Education Level</h1>
             <form action="" method="get">
                 <label for="year">Year:</label>
-                <input type="text" id="year" name="year" placeholder="e.g., 2020" required>
+                <input type="text" id="year" name="year" placeholder="e.g., 2020, 2010-2020 or 2000,2010" required>
                 <br>
                 <label for="educationLevel">Education Level:</label>
-                <select id="educationLevel" name="education_level">
+                <select id="educationLevel" name="education_level" multiple>
                     <option value="less_than_hs">Less than High School</option>
                     <option value="high_school">High School</option>
                     <option value="some_college">Some College</option>
@@ -50,111 +72,285 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
         """
         return func.HttpResponse(html_response, mimetype="text/html", status_code=200)
 
-    # Validate year and education level
-    if not specific_year.isdigit():
-        return func.HttpResponse("Invalid year. Please provide a valid year.", status_code=400)
-    
-    specific_year = int(specific_year)
-    education_levels = ['less_than_hs', 'high_school', 'some_college', 'bachelors_degree', 'advanced_degree']
-    if education_level not in education_levels:
-        return func.HttpResponse(f"Invalid education level. Choose from {education_levels}.", status_code=400)
+    # Validate years and education levels; both accept several values
+    try:
+        years = parse_years(specific_year)
+    except ValueError:
+        return func.HttpResponse("Invalid year. Please provide a year, a range such as 2010-2020 or a comma-separated list.", status_code=400)
 
     try:
-        # Initialize the BlobServiceClient
-        storage_account_name = os.getenv('AZURE_STORAGE_ACCOUNT_NAME')
-        storage_account_key = os.getenv('AZURE_STORAGE_ACCOUNT_KEY')
-        blob_service_client = BlobServiceClient(
-            account_url=f"https://{storage_account_name}.blob.core.windows.net", 
-            credential=storage_account_key
-        )
-        
-        # Connect to Blob Storage
-        container_client = blob_service_client.get_container_client("sources")
-        blob_client = container_client.get_blob_client("wages_by_education.csv")
-        
-        # Download the CSV from Blob Storage
-        blob_data = blob_client.download_blob().readall()
-        df = pd.read_csv(io.BytesIO(blob_data))
-
-        # Calculate total population and proportions
-        df['total_population'] = df[[f'men_{level}' for level in education_levels]].sum(axis=1)
-        for level in education_levels:
-            df[f'prop_men_{level}'] = df[f'men_{level}'] / df['total_population']
-            df[f'prop_women_{level}'] = df[f'women_{level}'] / df['total_population']
-
-        # Filter data for the selected year
-        year_data = df[df['year'] == specific_year]
-
-        if year_data.empty:
-            return func.HttpResponse(f"No data available for year {specific_year}.", status_code=404)
-
-        # Plot line chart for education level
-        plt.figure(figsize=(12, 6))
-        sns.lineplot(data=df, x='year', y=f'prop_men_{education_level}', label=f'Men with {education_level.replace("_", " ").title()}')
-        sns.lineplot(data=df, x='year', y=f'prop_women_{education_level}', label=f'Women with {education_level.replace("_", " ").title()}')
-
-        plt.title(f'Trends in {education_level.replace("_", " ").title()} Attainment Over Time')
-        plt.xlabel('Year')
-        plt.ylabel('Proportion')
-        plt.legend()
-        plt.grid(True)
-        plt.tight_layout()
-
-        # Save the line chart to an in-memory bytes buffer
-        line_chart_buffer = io.BytesIO()
-        plt.savefig(line_chart_buffer, format='png')
-        line_chart_buffer.seek(0)
-        line_chart_base64 = base64.b64encode(line_chart_buffer.getvalue()).decode('utf-8')
-
-        # Plot bar chart for selected year
-        plt.figure(figsize=(12, 6))
-        for level in education_levels:
-            plt.bar(f'{level} (Men)', year_data[f'prop_men_{level}'].values[0], label=f'Men {level}', alpha=0.7)
-            plt.bar(f'{level} (Women)', year_data[f'prop_women_{level}'].values[0], label=f'Women {level}', alpha=0.5)
-
-        plt.title(f'Education Level Distribution for {specific_year}')
-        plt.xlabel('Education Level')
-        plt.ylabel('Proportion')
-        plt.xticks(rotation=90)
-        plt.legend()
-        plt.tight_layout()
-
-        # Save the bar chart to an in-memory bytes buffer
-        bar_chart_buffer = io.BytesIO()
-        plt.savefig(bar_chart_buffer, format='png')
-        bar_chart_buffer.seek(0)
-        bar_chart_base64 = base64.b64encode(bar_chart_buffer.getvalue()).decode('utf-8')
-
-        # Generate the HTML response
-        html_response = f"""
-        <html>
-        <body>
-            <h1>Charts for Education Levels</h1>
-            <form action="" method="get">
-                <label for="year">Year:</label>
-                <input type="text" id="year" name="year" placeholder="e.g., 2020" required>
-                <br>
-                <label for="educationLevel">Education Level:</label>
-                <select id="educationLevel" name="education_level">
-                    <option value="less_than_hs">Less than High School</option>
-                    <option value="high_school">High School</option>
-                    <option value="some_college">Some College</option>
-                    <option value="bachelors_degree">Bachelor's Degree</option>
-                    <option value="advanced_degree">Advanced Degree</option>
-                </select>
-                <br>
-                <button type="submit">Generate Charts</button>
-            </form>
-            <h2>Trend Chart for {education_level.replace("_", " ").title()}</h2>
-            <img src="data:image/png;base64,{line_chart_base64}" alt="Trend Chart">
-            <h2>Education Level Distribution for {specific_year}</h2>
-            <img src="data:image/png;base64,{bar_chart_base64}" alt="Bar Chart">
-        </body>
-        </html>
-        """
+        education_levels = parse_levels(education_level, EDUCATION_LEVELS)
+    except ValueError:
+        return func.HttpResponse(f"Invalid education level. Choose from {EDUCATION_LEVELS}.", status_code=400)
 
-        return func.HttpResponse(html_response, mimetype="text/html", status_code=200)
+    single = len(years) == 1 and len(education_levels) == 1
+
+    try:
+        # Serve the HTML report precomputed by MaterializeResults, computing it live on a miss;
+        # combined reports for several years or levels are always computed live
+        body = None
+        if single and response_format == 'html':
+            body = load_result(FUNCTION_NAME, DATASET, year=years[0], education_level=education_levels[0])
+        if body is None:
+            # Shared, pooled Blob Storage client (built once per worker process)
+            container_client = get_container_client("sources")
+
+            # Evaluate this analysis' metrics through the shared, memoized analytics core
+            results, etag = analytics.compute(container_client, METRICS)
+            if response_format == 'json':
+                body = render_json(results, years, education_levels)
+            elif response_format == 'svg':
+                report_charts = charts(results, years, education_levels)
+                body = chart_cache.svg_document(FUNCTION_NAME, report_charts, etag) if report_charts else None
+            elif single:
+                body = render(results, etag, years[0], education_levels[0])
+            else:
+                body = render_batch(results, etag, years, education_levels)
+
+            if body is None:
+                return func.HttpResponse(f"No data available for year {specific_year}.", status_code=404)
+
+        # Compressed when the client accepts it (and the body is large enough to be worth it)
+        body, headers = compressor.respond(req, body, FORMATS[response_format], {'Vary': 'Accept'})
+        return func.HttpResponse(body, mimetype=FORMATS[response_format], status_code=200, headers=headers)
 
     except Exception as e:
         logging.error(f"Error occurred: {str(e)}")
         return func.HttpResponse(f"Error occurred: {str(e)}", status_code=500)
+
+def charts(results, years, education_levels):
+    """Charts of the report, in page order; None when the dataset has no row for any of ``years``."""
+    tensor = results['education_tensor']
+    proportions = results['attainment_proportions_of_men']
+    men, women = tensor.group_index('men'), tensor.group_index('women')
+
+    if len(years) == 1 and len(education_levels) == 1:
+        specific_year, education_level = years[0], education_levels[0]
+        row = tensor.row(specific_year)
+        if row is None:
+            return None
+        l = tensor.level_index(education_level)
+        return [
+            Chart('line_chart', draw_line_chart, {
+                'years': tensor.years, 'men_proportions': proportions[:, men, l],
+                'women_proportions': proportions[:, women, l], 'education_level': education_level,
+            }, {'education_level': education_level}),
+            Chart('bar_chart', draw_bar_chart, {
+                'men_values': proportions[row, men], 'women_values': proportions[row, women], 'specific_year': specific_year,
+            }, {'year': specific_year}),
+        ]
+
+    found_years, rows = tensor.rows(years)
+    if not found_years:
+        return None
+    return [chart for education_level in education_levels for chart in level_charts(results, found_years, rows, education_level)]
+
+def level_charts(results, found_years, rows, education_level):
+    """Trend and bar chart of one education level in a report for several years."""
+    tensor = results['education_tensor']
+    proportions = results['attainment_proportions_of_men']
+    men, women = tensor.group_index('men'), tensor.group_index('women')
+    l = tensor.level_index(education_level)
+    title = education_level.replace("_", " ").title()
+    chart_params = {'years': ','.join(str(year) for year in found_years), 'education_level': education_level}
+    return [
+        Chart('selected_years_line_chart', draw_selected_years_line_chart, {
+            'years': tensor.years, 'men_proportions': proportions[:, men, l], 'women_proportions': proportions[:, women, l],
+            'found_years': found_years, 'selected_men': proportions[rows, men, l],
+            'selected_women': proportions[rows, women, l], 'title': title,
+        }, chart_params),
+        Chart('selected_years_bar_chart', draw_selected_years_bar_chart, {
+            'found_years': found_years, 'selected_men': proportions[rows, men, l],
+            'selected_women': proportions[rows, women, l], 'education_level': education_level, 'title': title,
+        }, chart_params),
+    ]
+
+def draw_line_chart(years, men_proportions, women_proportions, education_level):
+    # Plot line chart for education level
+    fig, ax = new_figure(figsize=(12, 6))
+    handles = draw_lines(ax, years, np.column_stack([men_proportions, women_proportions]), [
+        f'Men with {education_level.replace("_", " ").title()}', f'Women with {education_level.replace("_", " ").title()}',
+    ])
+
+    ax.set_title(f'Trends in {education_level.replace("_", " ").title()} Attainment Over Time')
+    ax.set_xlabel('Year')
+    ax.set_ylabel('Proportion')
+    ax.legend(handles=handles)
+    ax.grid(True)
+    fig.tight_layout()
+    return fig
+
+def draw_bar_chart(men_values, women_values, specific_year):
+    # Plot bar chart for selected year
+    fig, ax = new_figure(figsize=(12, 6))
+    for l, level in enumerate(EDUCATION_LEVELS):
+        ax.bar(f'{level} (Men)', men_values[l], label=f'Men {level}', alpha=0.7)
+        ax.bar(f'{level} (Women)', women_values[l], label=f'Women {level}', alpha=0.5)
+
+    ax.set_title(f'Education Level Distribution for {specific_year}')
+    ax.set_xlabel('Education Level')
+    ax.set_ylabel('Proportion')
+    ax.tick_params(axis='x', labelrotation=90)
+    ax.legend()
+    fig.tight_layout()
+    return fig
+
+def draw_selected_years_line_chart(years, men_proportions, women_proportions, found_years, selected_men, selected_women, title):
+    # Trend chart over all years, with the selected years marked
+    fig, ax = new_figure(figsize=(12, 6))
+    handles = draw_lines(ax, years, np.column_stack([men_proportions, women_proportions]), [f'Men with {title}', f'Women with {title}'])
+    ax.scatter(found_years, selected_men, color='black', zorder=3)
+    ax.scatter(found_years, selected_women, color='black', zorder=3)
+    ax.set_title(f'Trends in {title} Attainment Over Time')
+    ax.set_xlabel('Year')
+    ax.set_ylabel('Proportion')
+    ax.legend(handles=handles)
+    ax.grid(True)
+    fig.tight_layout()
+    return fig
+
+def draw_selected_years_bar_chart(found_years, selected_men, selected_women, education_level, title):
+    # Men and women side by side in each selected year
+    positions = np.arange(len(found_years))
+    width = 0.4
+
+    fig, ax = new_figure(figsize=(12, 6))
+    men_color, women_color = cycle_colors(2)
+    handles = [
+        draw_bars(ax, positions, selected_men, width, f'Men {education_level}', men_color, alpha=0.7),
+        draw_bars(ax, positions + width, selected_women, width, f'Women {education_level}', women_color, alpha=0.5),
+    ]
+    ax.set_xticks(positions + width / 2, found_years, rotation=45)
+    ax.set_title(f'{title} Attainment of Men and Women')
+    ax.set_xlabel('Year')
+    ax.set_ylabel('Proportion')
+    ax.legend(handles=handles)
+    fig.tight_layout()
+    return fig
+
+def render_json(results, years, education_levels):
+    """Attainment proportions of men and women in the selected years, the gap and their trends, as JSON.
+
+    Returns None when the dataset has no row for any of ``years``.
+    """
+    tensor = results['education_tensor']
+    proportions = results['attainment_proportions_of_men']
+    men, women = tensor.group_index('men'), tensor.group_index('women')
+
+    found_years, rows = tensor.rows(years)
+    if not found_years:
+        return None
+
+    response_data = {
+        "years": found_years,
+        "missing_years": sorted(set(years) - set(found_years)),
+        "all_years": tensor.years,
+        "education_levels": {},
+    }
+    for education_level in education_levels:
+        l = tensor.level_index(education_level)
+        selected_men, selected_women = proportions[rows, men, l], proportions[rows, women, l]
+        response_data["education_levels"][education_level] = {
+            "men": selected_men,
+            "women": selected_women,
+            "gap": selected_men - selected_women,
+            "trend": {"men": proportions[:, men, l], "women": proportions[:, women, l]},
+        }
+    return json_body(response_data)
+
+def render(results, etag, specific_year, education_level):
+    """Render attainment proportions for men and women for one year and level.
+
+    Returns None when the dataset has no row for ``specific_year``.
+    """
+    report_charts = charts(results, [specific_year], [education_level])
+    if report_charts is None:
+        return None
+
+    # Chart URLs; the charts are drawn only when the chart cache misses
+    images = chart_cache.urls(FUNCTION_NAME, report_charts, etag)
+
+    return REPORT.render(title=education_level.replace("_", " ").title(), specific_year=specific_year, images=images)
+
+def render_batch(results, etag, years, education_levels):
+    """Render attainment proportions for men and women for several years and levels in one report.
+
+    Returns None when the dataset has no row for any of ``years``.
+    """
+    tensor = results['education_tensor']
+    proportions = results['attainment_proportions_of_men']
+    men, women = tensor.group_index('men'), tensor.group_index('women')
+
+    # Rows of the requested years, looked up in the tensor's year index
+    found_years, rows = tensor.rows(years)
+    if not found_years:
+        return None
+    missing_years = sorted(set(years) - set(found_years))
+
+    sections = []
+    for education_level in education_levels:
+        l = tensor.level_index(education_level)
+        selected_men, selected_women = proportions[rows, men, l], proportions[rows, women, l]
+
+        # Chart URLs; the charts are drawn only when the chart cache misses
+        images = chart_cache.urls(FUNCTION_NAME, level_charts(results, found_years, rows, education_level), etag)
+
+        sections.append({
+            'title': education_level.replace("_", " ").title(),
+            'rows': table_rows(
+                [found_years, selected_men, selected_women, selected_men - selected_women], ['%d', '%.4f', '%.4f', '%.4f'],
+            ),
+            'images': images,
+        })
+
+    return BATCH_REPORT.render(found_years=found_years, missing_years=missing_years, sections=sections)
+
+# HTML response for one year and level
+REPORT = report_template("""
+    <html>
+    <body>
+        <h1>Charts for Education Levels</h1>
+        <form action="" method="get">
+            <label for="year">Year:</label>
+            <input type="text" id="year" name="year" placeholder="e.g., 2020, 2010-2020 or 2000,2010" required>
+            <br>
+            <label for="educationLevel">Education Level:</label>
+            <select id="educationLevel" name="education_level" multiple>
+                <option value="less_than_hs">Less than High School</option>
+                <option value="high_school">High School</option>
+                <option value="some_college">Some College</option>
+                <option value="bachelors_degree">Bachelor's Degree</option>
+                <option value="advanced_degree">Advanced Degree</option>
+            </select>
+            <br>
+            <button type="submit">Generate Charts</button>
+        </form>
+        <h2>Trend Chart for {{ title }}</h2>
+        <img src="{{ images['line_chart'] }}" alt="Trend Chart">
+        <h2>Education Level Distribution for {{ specific_year }}</h2>
+        <img src="{{ images['bar_chart'] }}" alt="Bar Chart">
+    </body>
+    </html>
+    """)
+
+# Combined HTML response for several years and levels
+BATCH_REPORT = report_template("""
+    <html>
+    <body>
+        <h1>Charts for Education Levels</h1>
+        <p>Years: {{ found_years | join(', ') }}</p>
+        {% if missing_years %}<p>No data available for: {{ missing_years | join(', ') }}</p>{% endif %}
+        {% for section in sections %}
+        <h2>{{ section.title }}</h2>
+        <table border="1">
+            <tr><th>Year</th><th>Men</th><th>Women</th><th>Gap (Men - Women)</th></tr>
+            {% for chunk in section.rows %}{{ chunk }}{% endfor %}
+        </table>
+        <h3>Trend Chart for {{ section.title }}</h3>
+        <img src="{{ section.images['selected_years_line_chart'] }}" alt="Trend Chart">
+        <h3>Men and Women with {{ section.title }} in the Selected Years</h3>
+        <img src="{{ section.images['selected_years_bar_chart'] }}" alt="Bar Chart">
+        {% endfor %}
+    </body>
+    </html>
+    """)
@@ -1,107 +1,119 @@
 import logging
-import pandas as pd
-import matplotlib.pyplot as plt
 import azure.functions as func
-from azure.storage.blob import BlobServiceClient
-import os
-import io
-import base64
+from shared_code.storage import get_container_client
+from shared_code.analytics import analytics
+from shared_code.results import load_result
+from shared_code.chart_cache import chart_cache
+from shared_code.charts import Chart, new_figure
+from shared_code.compression import compressor
+from shared_code.formats import FORMATS, json_body, negotiate
+from shared_code.reports import report_template
+from shared_code.schema import BRACKETS, POVERTY_WAGES
+
+FUNCTION_NAME = "WageRangesDistribution"
+DATASET = POVERTY_WAGES.blob_name
+
+# Metrics of the shared analytics core rendered by this function
+METRICS = ['bracket_distribution', 'bracket_distribution_percentage', 'total_workers']
 
 def main(req: func.HttpRequest) -> func.HttpResponse:
     logging.info('Azure HTTP trigger function to analyze wage distribution across different poverty wage ranges.')
 
+    # Output format, from the format parameter or the Accept header
     try:
-        # Retrieve storage account credentials
-        storage_account_key = os.getenv('AZURE_STORAGE_ACCOUNT_KEY')
-        storage_account_name = os.getenv('AZURE_STORAGE_ACCOUNT_NAME')
-
-        if not storage_account_key or not storage_account_name:
-            raise Exception("Azure Storage account credentials are missing.")
-
-        # Connect to Blob Storage
-        blob_service_client = BlobServiceClient(account_url=f"https://{storage_account_name}.blob.core.windows.net", credential=storage_account_key)
-        container_client = blob_service_client.get_container_client("sources")
-        blob_client = container_client.get_blob_client("poverty_level_wages.csv")
-        
-        # Download the CSV from Blob Storage
-        blob_data = blob_client.download_blob().readall()
-        df = pd.read_csv(io.BytesIO(blob_data))
-
-        # --- Wage Distribution Calculation ---
-        wage_distribution = df[['0-75%_of_poverty_wages', '75-100%_of_poverty_wages', 
-                                '100-125%_of_poverty_wages', '125-200%_of_poverty_wages', 
-                                '200-300%_of_poverty_wages', '300%+_of_poverty_wages']].sum()
-
-        total_workers = wage_distribution.sum()
-
-        # Normalize the distribution to percentages
-        wage_distribution_percentage = (wage_distribution / total_workers) * 100
-
-        # --- Stacked Bar Chart ---
-        plt.figure(figsize=(10, 6))
-        plt.bar(['0-75%', '75-100%', '100-125%', '125-200%', '200-300%', '300%+'], 
-                wage_distribution_percentage, color=['red', 'orange', 'yellow', 'green', 'blue', 'purple'])
-
-        plt.title('Distribution of Wages Across Different Poverty Wage Ranges')
-        plt.xlabel('Poverty Wage Range')
-        plt.ylabel('Percentage of Workers (%)')
-        plt.tight_layout()
-
-        # Save the bar chart to an in-memory bytes buffer
-        bar_chart_buffer = io.BytesIO()
-        plt.savefig(bar_chart_buffer, format='png')
-        bar_chart_buffer.seek(0)
-
-        # Encode the image to Base64
-        bar_chart_base64 = base64.b64encode(bar_chart_buffer.getvalue()).decode('utf-8')
-
-        # --- Pie Chart ---
-        plt.figure(figsize=(8, 8))
-        plt.pie(wage_distribution_percentage, labels=['0-75%', '75-100%', '100-125%', '125-200%', '200-300%', '300%+'], 
-                autopct='%1.1f%%', colors=['red', 'orange', 'yellow', 'green', 'blue', 'purple'])
-
-        plt.title('Distribution of Wages Across Different Poverty Wage Ranges')
-        plt.tight_layout()
-
-        # Save the pie chart to an in-memory bytes buffer
-        pie_chart_buffer = io.BytesIO()
-        plt.savefig(pie_chart_buffer, format='png')
-        pie_chart_buffer.seek(0)
-
-        # Encode the pie chart to Base64
-        pie_chart_base64 = base64.b64encode(pie_chart_buffer.getvalue()).decode('utf-8')
-
-        # Combine results into JSON
-        response_data = {
-            "wage_distribution": wage_distribution.to_dict(),
-            "total_workers": total_workers,
-            "wage_distribution_percentage": wage_distribution_percentage.to_dict()
-        }
-
-        # HTML response with Base64-encoded images
-        html_response = f"""
-        <html>
-        <body>
-            <h1>Wage Distribution Analysis Across Poverty Wage Ranges</h1>
-            <h2>Wage Distribution (Sum for Each Range):</h2>
-            <ul>
-                <li>0-75%: {wage_distribution['0-75%_of_poverty_wages']}</li>
-                <li>75-100%: {wage_distribution['75-100%_of_poverty_wages']}</li>
-                <li>100-125%: {wage_distribution['100-125%_of_poverty_wages']}</li>
-                <li>125-200%: {wage_distribution['125-200%_of_poverty_wages']}</li>
-                <li>200-300%: {wage_distribution['200-300%_of_poverty_wages']}</li>
-                <li>300%+: {wage_distribution['300%+_of_poverty_wages']}</li>
-            </ul>
-            <h2>Stacked Bar Chart: Wage Distribution</h2>
-            <img src="data:image/png;base64,{bar_chart_base64}" alt="Bar Chart">
-            <h2>Pie Chart: Wage Distribution</h2>
-            <img src="data:image/png;base64,{pie_chart_base64}" alt="Pie Chart">
-        </body>
-        </html>
-        """
-
-        return func.HttpResponse(html_response, mimetype="text/html", status_code=200)
+        response_format = negotiate(req)
+    except ValueError:
+        return func.HttpResponse(f"Invalid format. Choose from {list(FORMATS)}.", status_code=400)
+    if response_format is None:
+        return func.HttpResponse(f"Not acceptable. Available formats: {list(FORMATS)}.", status_code=406)
+
+    try:
+        # Serve the HTML report precomputed by MaterializeResults, computing it live on a miss
+        body = load_result(FUNCTION_NAME, DATASET) if response_format == 'html' else None
+        if body is None:
+            # Shared, pooled Blob Storage client (built once per worker process)
+            container_client = get_container_client("sources")
+
+            # Evaluate this analysis' metrics through the shared, memoized analytics core
+            results, etag = analytics.compute(container_client, METRICS)
+            if response_format == 'json':
+                body = render_json(results)
+            elif response_format == 'svg':
+                body = chart_cache.svg_document(FUNCTION_NAME, charts(results), etag)
+            else:
+                body = render(results, etag)
+
+        # Compressed when the client accepts it (and the body is large enough to be worth it)
+        body, headers = compressor.respond(req, body, FORMATS[response_format], {'Vary': 'Accept'})
+        return func.HttpResponse(body, mimetype=FORMATS[response_format], status_code=200, headers=headers)
 
     except Exception as e:
         logging.error(f"Error occurred: {str(e)}")
         return func.HttpResponse(f"Error occurred: {str(e)}", status_code=500)
+
+def charts(results):
+    """Charts of the report, in page order."""
+    wage_distribution_percentage = results['bracket_distribution_percentage']
+    return [
+        Chart('bar_chart', draw_bar_chart, {'wage_distribution_percentage': wage_distribution_percentage}),
+        Chart('pie_chart', draw_pie_chart, {'wage_distribution_percentage': wage_distribution_percentage}),
+    ]
+
+def draw_bar_chart(wage_distribution_percentage):
+    # --- Stacked Bar Chart ---
+    fig, ax = new_figure(figsize=(10, 6))
+    ax.bar(BRACKETS, 
+            wage_distribution_percentage, color=['red', 'orange', 'yellow', 'green', 'blue', 'purple'])
+
+    ax.set_title('Distribution of Wages Across Different Poverty Wage Ranges')
+    ax.set_xlabel('Poverty Wage Range')
+    ax.set_ylabel('Percentage of Workers (%)')
+    fig.tight_layout()
+    return fig
+
+def draw_pie_chart(wage_distribution_percentage):
+    # --- Pie Chart ---
+    fig, ax = new_figure(figsize=(8, 8))
+    ax.pie(wage_distribution_percentage, labels=BRACKETS, 
+            autopct='%1.1f%%', colors=['red', 'orange', 'yellow', 'green', 'blue', 'purple'])
+
+    ax.set_title('Distribution of Wages Across Different Poverty Wage Ranges')
+    fig.tight_layout()
+    return fig
+
+def render_json(results):
+    """Distribution of workers across poverty wage ranges, as JSON."""
+    response_data = {
+        "wage_distribution": results['bracket_distribution'].to_dict(),
+        "total_workers": results['total_workers'].sum(),
+        "wage_distribution_percentage": results['bracket_distribution_percentage'].to_dict()
+    }
+    return json_body(response_data)
+
+def render(results, etag):
+    """Render the distribution across poverty wage ranges as an HTML report."""
+    # --- Wage Distribution (sum for each range) ---
+    wage_distribution = results['bracket_distribution']
+
+    # Chart URLs; the charts are drawn only when the chart cache misses
+    images = chart_cache.urls(FUNCTION_NAME, charts(results), etag)
+
+    totals = [wage_distribution[f'{bracket}_of_poverty_wages'] for bracket in BRACKETS]
+    return REPORT.render(distribution=zip(BRACKETS, totals), images=images)
+
+# HTML response referencing the chart images
+REPORT = report_template("""
+    <html>
+    <body>
+        <h1>Wage Distribution Analysis Across Poverty Wage Ranges</h1>
+        <h2>Wage Distribution (Sum for Each Range):</h2>
+        <ul>
+            {% for bracket, total in distribution %}<li>{{ bracket }}: {{ '%.2f' | format(total) }}</li>{% endfor %}
+        </ul>
+        <h2>Stacked Bar Chart: Wage Distribution</h2>
+        <img src="{{ images['bar_chart'] }}" alt="Bar Chart">
+        <h2>Pie Chart: Wage Distribution</h2>
+        <img src="{{ images['pie_chart'] }}" alt="Pie Chart">
+    </body>
+    </html>
+    """)
@@ -0,0 +1,455 @@
+"""Shared analytics core: named metrics over the source datasets with declared inputs.
+
+Every metric is registered with the dataset it belongs to and either
+
+* the ``columns`` it reads (a source metric), optionally reduced to per-year totals with
+  ``sum_by='year'``, or
+* the ``inputs`` it is derived from (other metrics of the same dataset).
+
+``analytics.compute`` resolves the requested metrics and everything they depend on, loads
+each source of the dataset once through the dataset cache (the union of the columns read by
+all registered source metrics, so every function shares one projection and one parse), and
+evaluates the graph in dependency order. Results are memoized per dataset version (ETag):
+an intermediate such as the total number of workers per year is computed once and reused
+by every function that needs it until the blob changes.
+
+When the dataset cache reports that the new version only appended rows to the memoized one
+(see ``DatasetCache.appended_to``), metrics that know how to are extended from their
+previous value instead of being recomputed:
+
+* ``rowwise`` metrics, whose value for a set of rows depends only on those rows (the
+  education tensor, its proportions and per-year Gini), are computed for the new rows
+  only and concatenated;
+* metrics with an ``appends`` hook update their sufficient statistics (sums and counts,
+  regression moments, the tail of a rolling window) from the new rows.
+
+Extension is only used while every input was itself extended, so the previous rows are known
+to be unchanged; everything else (including all per-year totals, which are small) is simply
+recomputed from the new inputs.
+
+Memoized values are shared between invocations and must be treated as read-only.
+"""
+import copy
+import logging
+import threading
+
+import numpy as np
+import pandas as pd
+
+from .dataset_cache import dataset_cache
+from .education import EducationTensor, gini, level_ratio
+from .schema import BRACKETS, GENDERS, POVERTY_WAGES, WAGES_BY_EDUCATION
+from .streaming import StreamingAggregate
+from .trend import RegressionMoments
+
+
+def _rows_from(value, start):
+    return value.iloc[start:] if hasattr(value, 'iloc') else value[start:]
+
+
+def _concat_rows(previous, rows):
+    if isinstance(previous, (pd.DataFrame, pd.Series)):
+        return pd.concat([previous, rows])
+    if isinstance(previous, EducationTensor):
+        return previous.concat(rows)
+    return np.concatenate([previous, rows])
+
+
+class Metric:
+    def __init__(self, name, dataset, compute, inputs=(), columns=None, sum_by=None, rowwise=False):
+        self.name = name
+        self.dataset = dataset
+        self.compute = compute
+        self.inputs = tuple(inputs)
+        self.columns = list(columns) if columns is not None else None
+        self.sum_by = sum_by
+        self.append = self._append_rows if rowwise else None
+
+    def _append_rows(self, previous, *inputs):
+        start = len(previous)
+        return _concat_rows(previous, self.compute(*(_rows_from(value, start) for value in inputs)))
+
+    @property
+    def is_source(self):
+        return self.columns is not None
+
+
+METRICS = {}
+
+
+def metric(name, dataset, inputs=(), columns=None, sum_by=None, rowwise=False):
+    """Register the decorated function as metric ``name`` of ``dataset``.
+
+    Source metrics (``columns`` given) are called with the projected frame; derived metrics
+    are called with the values of their ``inputs``, in order.
+    """
+    def register(compute):
+        if name in METRICS:
+            raise ValueError(f"Metric {name} is already registered.")
+        METRICS[name] = Metric(name, dataset, compute, inputs, columns, sum_by, rowwise)
+        return compute
+    return register
+
+
+def appends(name):
+    """Register the decorated function as the incremental update of metric ``name``.
+
+    It is called with the metric's previous value followed by the new values of its inputs
+    (whose leading rows are those the previous value was computed from) and returns the new
+    value, or None to fall back to a full computation.
+    """
+    def register(append):
+        METRICS[name].append = append
+        return append
+    return register
+
+
+def _resolve(names):
+    """The requested metrics and their dependencies, each after all of its inputs."""
+    ordered, visiting, done = [], set(), set()
+
+    def visit(name):
+        if name in done:
+            return
+        if name in visiting:
+            raise ValueError(f"Metric {name} depends on itself.")
+        if name not in METRICS:
+            raise ValueError(f"Unknown metric: {name}")
+        visiting.add(name)
+        for input_name in METRICS[name].inputs:
+            visit(input_name)
+        visiting.discard(name)
+        done.add(name)
+        ordered.append(METRICS[name])
+
+    for name in names:
+        visit(name)
+    return ordered
+
+
+def source_columns(dataset, sum_by=None):
+    """Columns loaded for ``dataset``: everything read by its source metrics with this ``sum_by``."""
+    columns = []
+    for registered in METRICS.values():
+        if registered.dataset == dataset and registered.is_source and registered.sum_by == sum_by:
+            if sum_by is not None and sum_by not in columns:
+                columns.append(sum_by)
+            columns.extend(column for column in registered.columns if column not in columns)
+    return columns
+
+
+class _Version:
+    def __init__(self, etag):
+        self.etag = etag
+        self.values = {}
+
+
+class AnalyticsEngine:
+    def __init__(self, cache=dataset_cache):
+        self._cache = cache
+        self._versions = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+        self._counters = {'computed': 0, 'reused': 0, 'extended': 0}
+
+    def _key_lock(self, key):
+        with self._lock:
+            return self._locks.setdefault(key, threading.Lock())
+
+    def compute(self, container_client, names):
+        """Return ``({name: value}, etag)`` for the requested metrics of one dataset.
+
+        Raises ValueError for unknown metrics or when the metrics span several datasets.
+        """
+        metrics = _resolve(names)
+        datasets = {m.dataset for m in metrics}
+        if len(datasets) != 1:
+            raise ValueError(f"Metrics must belong to exactly one dataset, got {sorted(datasets)}.")
+        blob_name = datasets.pop()
+        key = (container_client.container_name, blob_name)
+
+        with self._key_lock(key):
+            # One cached load per source (raw rows, per-year totals) of the dataset
+            frames, etags, appended_to = {}, set(), {}
+            for sum_by in {m.sum_by for m in metrics if m.is_source}:
+                columns = source_columns(blob_name, sum_by)
+                frames[sum_by], etag = self._cache.get_with_etag(container_client, blob_name, columns=columns, sum_by=sum_by)
+                etags.add(etag)
+                appended_to[sum_by] = self._cache.appended_to(container_client, blob_name, etag, columns, sum_by)
+
+            previous = version = self._versions.get(key)
+            if len(etags) > 1:
+                # The blob changed between the loads; compute from what was loaded without memoizing
+                logging.warning(f"{blob_name} changed while loading; metrics are not memoized for this request.")
+                version = _Version(None)
+            elif version is None or version.etag not in etags:
+                version = self._versions[key] = _Version(etags.pop())
+
+            # The raw rows only grew since the memoized version: extend its values where possible
+            if previous is version or previous is None or appended_to.get(None) != previous.etag:
+                previous = None
+
+            computed, extended = 0, set()
+            for m in metrics:
+                if m.name in version.values:
+                    continue
+                if m.is_source:
+                    inputs = [frames[m.sum_by][m.columns]]
+                    extendable = m.sum_by is None
+                else:
+                    inputs = [version.values[name] for name in m.inputs]
+                    extendable = all(name in extended for name in m.inputs)
+
+                value = None
+                if previous is not None and extendable and m.append is not None and m.name in previous.values:
+                    value = m.append(previous.values[m.name], *inputs)
+                if value is None:
+                    value = m.compute(*inputs)
+                else:
+                    extended.add(m.name)
+                version.values[m.name] = value
+                computed += 1
+
+            with self._lock:
+                self._counters['computed'] += computed
+                self._counters['extended'] += len(extended)
+                self._counters['reused'] += len(metrics) - computed
+            return {name: version.values[name] for name in names}, version.etag
+
+    def stats(self):
+        """Counters of metric evaluations (``extended`` of them incrementally) and of memo hits."""
+        with self._lock:
+            stats = dict(self._counters)
+            stats['datasets'] = len(self._versions)
+        return stats
+
+
+# Shared by every function running in this worker process
+analytics = AnalyticsEngine()
+
+
+# --- poverty_level_wages.csv ---
+
+_BRACKET_COLUMNS = POVERTY_WAGES.columns('brackets')
+
+
+_WAGE = 'annual_poverty-level_wage'
+POVERTY_TREND_COLUMNS = POVERTY_WAGES.columns('annual_wage', 'gender_shares', 'race_shares')
+_MOVING_AVERAGE_WINDOW = 3
+
+
+def _unchanged_rows(previous, frame):
+    """Update of a source metric that is the projected frame itself."""
+    return frame
+
+
+def _column_moments(frame):
+    aggregate = StreamingAggregate()
+    aggregate.update(frame)
+    return aggregate
+
+
+def _extend_column_moments(previous, frame):
+    aggregate = copy.copy(previous)
+    aggregate.update(frame.iloc[previous.rows:])
+    return aggregate
+
+
+@metric('wages_by_year', POVERTY_WAGES.blob_name, columns=POVERTY_WAGES.columns('year', 'annual_wage'))
+def _wages_by_year(frame):
+    return frame.sort_values(by='year').reset_index(drop=True)
+
+
+@appends('wages_by_year')
+def _append_wages_by_year(previous, frame):
+    # Appended years normally come after all known years; anything else needs a full re-sort
+    rows = frame.iloc[len(previous):]
+    if len(previous) and rows['year'].min() <= previous['year'].max():
+        return None
+    return pd.concat([previous, rows.sort_values(by='year')], ignore_index=True)
+
+
+@metric('wage_pct_change', POVERTY_WAGES.blob_name, inputs=['wages_by_year'])
+def _wage_pct_change(wages):
+    return wages[_WAGE].pct_change() * 100
+
+
+@appends('wage_pct_change')
+def _append_wage_pct_change(previous, wages):
+    if not len(previous):
+        return None
+    # Continue from the last known wage
+    return pd.concat([previous, _wage_pct_change(wages.iloc[len(previous) - 1:]).iloc[1:]])
+
+
+@metric('wage_moving_average', POVERTY_WAGES.blob_name, inputs=['wages_by_year'])
+def _wage_moving_average(wages):
+    return wages[_WAGE].rolling(window=_MOVING_AVERAGE_WINDOW).mean()
+
+
+@appends('wage_moving_average')
+def _append_wage_moving_average(previous, wages):
+    tail = _MOVING_AVERAGE_WINDOW - 1
+    if len(previous) < tail:
+        return None
+    # The window of the first new years reaches back into the last known ones
+    return pd.concat([previous, _wage_moving_average(wages.iloc[len(previous) - tail:]).iloc[tail:]])
+
+
+@metric('poverty_series', POVERTY_WAGES.blob_name,
+        columns=POVERTY_WAGES.columns('year', 'annual_wage', 'gender_shares', 'race_shares'))
+def _poverty_series(frame):
+    return frame
+
+
+appends('poverty_series')(_unchanged_rows)
+
+
+@metric('poverty_trend_moments', POVERTY_WAGES.blob_name, inputs=['poverty_series'])
+def _poverty_trend_moments(frame):
+    """Regression moments against year of the wage and of every share column."""
+    series = POVERTY_TREND_COLUMNS
+    return RegressionMoments.of(frame['year'], frame[series], columns=series)
+
+
+@appends('poverty_trend_moments')
+def _append_poverty_trend_moments(previous, frame):
+    rows = frame.iloc[previous.rows:]
+    return previous.extended(rows['year'], rows[previous.columns])
+
+
+@metric('wage_trend', POVERTY_WAGES.blob_name, inputs=['poverty_trend_moments', 'wages_by_year'])
+def _wage_trend(moments, wages):
+    """Least-squares trend line of the wage, evaluated at every year."""
+    return moments.predict(wages['year'])[:, moments.columns.index(_WAGE)]
+
+
+@metric('gender_shares', POVERTY_WAGES.blob_name, columns=POVERTY_WAGES.columns('gender_shares'))
+def _gender_shares(frame):
+    return frame
+
+
+appends('gender_shares')(_unchanged_rows)
+
+
+@metric('gender_share_moments', POVERTY_WAGES.blob_name, inputs=['gender_shares'])
+def _gender_share_moments(shares):
+    return _column_moments(shares)
+
+
+appends('gender_share_moments')(_extend_column_moments)
+
+
+@metric('gender_share_summary', POVERTY_WAGES.blob_name, inputs=['gender_shares', 'gender_share_moments'])
+def _gender_share_summary(shares, moments):
+    """Mean and median of each gender's share, indexed by statistic.
+
+    Medians have no running form, so they are taken over the (already loaded) shares.
+    """
+    return pd.DataFrame({'mean': moments.means(), 'median': shares.median()}).T
+
+
+@metric('race_shares', POVERTY_WAGES.blob_name, columns=POVERTY_WAGES.columns('year', 'race_shares'))
+def _race_shares(frame):
+    return frame
+
+
+appends('race_shares')(_unchanged_rows)
+
+
+@metric('race_share_moments', POVERTY_WAGES.blob_name, inputs=['race_shares'])
+def _race_share_moments(shares):
+    return _column_moments(shares[POVERTY_WAGES.columns('race_shares')])
+
+
+@appends('race_share_moments')
+def _append_race_share_moments(previous, shares):
+    return _extend_column_moments(previous, shares[POVERTY_WAGES.columns('race_shares')])
+
+
+@metric('race_share_means', POVERTY_WAGES.blob_name, inputs=['race_share_moments'])
+def _race_share_means(moments):
+    return moments.means()
+
+
+@metric('bracket_totals_by_year', POVERTY_WAGES.blob_name, columns=POVERTY_WAGES.columns('year', 'brackets'), sum_by='year')
+def _bracket_totals_by_year(frame):
+    return frame
+
+
+@metric('total_workers', POVERTY_WAGES.blob_name, inputs=['bracket_totals_by_year'])
+def _total_workers(totals):
+    """Workers across all brackets, per year."""
+    return totals[_BRACKET_COLUMNS].sum(axis=1)
+
+
+@metric('share_above_300', POVERTY_WAGES.blob_name, inputs=['bracket_totals_by_year', 'total_workers'])
+def _share_above_300(totals, total_workers):
+    return totals['300%+_of_poverty_wages'] / total_workers
+
+
+@metric('bracket_distribution', POVERTY_WAGES.blob_name, inputs=['bracket_totals_by_year'])
+def _bracket_distribution(totals):
+    """Workers per bracket over all years."""
+    return totals[_BRACKET_COLUMNS].sum()
+
+
+@metric('bracket_distribution_percentage', POVERTY_WAGES.blob_name, inputs=['bracket_distribution', 'total_workers'])
+def _bracket_distribution_percentage(distribution, total_workers):
+    return (distribution / total_workers.sum()) * 100
+
+
+@metric('gender_bracket_totals_by_year', POVERTY_WAGES.blob_name,
+        columns=POVERTY_WAGES.columns('year', 'gender_brackets'), sum_by='year')
+def _gender_bracket_totals_by_year(frame):
+    return frame
+
+
+@metric('gender_bracket_totals', POVERTY_WAGES.blob_name, inputs=['gender_bracket_totals_by_year'])
+def _gender_bracket_totals(totals):
+    """Workers per bracket over all years, one row per bracket and one column per gender."""
+    sums = totals[POVERTY_WAGES.columns('gender_brackets')].sum().to_numpy().reshape(len(GENDERS), len(BRACKETS))
+    return pd.DataFrame(sums.T, index=BRACKETS, columns=[gender.title() for gender in GENDERS])
+
+
+# --- wages_by_education.csv ---
+
+@metric('education_tensor', WAGES_BY_EDUCATION.blob_name, columns=WAGES_BY_EDUCATION.all_columns(), rowwise=True)
+def _education_tensor(frame):
+    return EducationTensor.from_frame(frame)
+
+
+@metric('attainment_proportions', WAGES_BY_EDUCATION.blob_name, inputs=['education_tensor'], rowwise=True)
+def _attainment_proportions(tensor):
+    """Proportions of the total population of all groups."""
+    return tensor.proportions()
+
+
+@metric('attainment_proportions_of_men', WAGES_BY_EDUCATION.blob_name, inputs=['education_tensor'], rowwise=True)
+def _attainment_proportions_of_men(tensor):
+    """Proportions of the men's total population."""
+    return tensor.proportions(total_groups=['men'])
+
+
+@metric('attainment_gini', WAGES_BY_EDUCATION.blob_name, inputs=['attainment_proportions'], rowwise=True)
+def _attainment_gini(proportions):
+    return gini(proportions)
+
+
+@metric('education_trend_moments', WAGES_BY_EDUCATION.blob_name, inputs=['education_tensor'])
+def _education_trend_moments(tensor):
+    """Regression moments against year of every group and education level column."""
+    columns = [f'{group}_{level}' for group in tensor.groups for level in tensor.levels]
+    return RegressionMoments.of(tensor.years, tensor.values.reshape(len(tensor), -1), columns=columns)
+
+
+@appends('education_trend_moments')
+def _append_education_trend_moments(previous, tensor):
+    rows = tensor[previous.rows:]
+    return previous.extended(rows.years, rows.values.reshape(len(rows), -1))
+
+
+@metric('bachelors_to_less_than_hs', WAGES_BY_EDUCATION.blob_name, inputs=['education_tensor', 'attainment_proportions'],
+        rowwise=True)
+def _bachelors_to_less_than_hs(tensor, proportions):
+    return level_ratio(tensor, proportions)
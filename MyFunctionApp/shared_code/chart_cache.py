@@ -0,0 +1,237 @@
+"""Process-wide cache of rendered charts.
+
+Charts are keyed by (function, chart id, query parameters, source ETag, format): the same
+request against the same version of the source blob draws the same chart, so it is only
+plotted and encoded once per worker until the blob changes. A new ETag simply misses, and the charts of
+older versions age out of the cache.
+
+Entries are evicted least recently used first once their total size exceeds
+CHART_CACHE_MAX_BYTES (default 32 MiB; 0 disables the cache). When CHART_CACHE_SPILL_DIR is
+set (e.g. ``/tmp/chart_cache``), evicted charts are written there and read back on a later
+miss instead of being drawn again; the spill directory is shared by the workers on an
+instance and bounded by CHART_CACHE_SPILL_MAX_BYTES (default 256 MiB).
+
+The HTML reports reference their charts by URL instead of inlining them: ``urls`` names each
+PNG by its content hash (``charts/<hash>.png``, relative to the function's URL, or under
+CHART_URL_PREFIX when set, e.g. a CDN endpoint), stores it in the results container once and
+ChartImages serves it with an immutable Cache-Control, so browsers and CDNs only ever
+download a chart once.
+
+The charts of a response that miss the cache are drawn together, on the render pool when
+it is enabled (see render_pool.py).
+"""
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+from .charts import stack_svg
+from .render_pool import render_pool
+from .results import save_chart
+
+
+class _Rendered:
+    def __init__(self, content):
+        self.content = content
+        self.digest = hashlib.sha256(content).hexdigest()[:32]
+        self.size = len(content)
+
+
+class ChartCache:
+    def __init__(self, max_bytes=None, spill_dir=None, spill_max_bytes=None, url_prefix=None):
+        if max_bytes is None:
+            max_bytes = int(os.getenv('CHART_CACHE_MAX_BYTES', str(32 * 1024 * 1024)))
+        if spill_dir is None:
+            spill_dir = os.getenv('CHART_CACHE_SPILL_DIR', '')
+        if spill_max_bytes is None:
+            spill_max_bytes = int(os.getenv('CHART_CACHE_SPILL_MAX_BYTES', str(256 * 1024 * 1024)))
+        if url_prefix is None:
+            url_prefix = os.getenv('CHART_URL_PREFIX', 'charts/')
+        self.max_bytes = max_bytes
+        self.spill_dir = spill_dir or None
+        self.spill_max_bytes = spill_max_bytes
+        self.url_prefix = url_prefix
+        self._entries = OrderedDict()
+        # Cached PNGs by content hash, and the hashes already stored in the results container
+        self._digests = {}
+        self._published = set()
+        self._bytes = 0
+        self._spilled = OrderedDict()
+        self._spilled_bytes = 0
+        self._lock = threading.Lock()
+        self._counters = {'hits': 0, 'spill_hits': 0, 'misses': 0, 'evictions': 0, 'spills': 0}
+
+    @staticmethod
+    def key(function_name, chart, etag, fmt):
+        params = tuple(sorted((str(k), str(v)) for k, v in chart.params.items()))
+        return (function_name, chart.chart_id, params, etag, fmt)
+
+    def png(self, function_name, chart, etag):
+        """PNG bytes of ``chart`` (see charts.py); it is only drawn on a miss."""
+        return self._rendered(function_name, chart, etag, 'png').content
+
+    def svg(self, function_name, chart, etag):
+        """SVG document of ``chart``; it is only drawn on a miss."""
+        return self._rendered(function_name, chart, etag, 'svg').content
+
+    def urls(self, function_name, charts, etag):
+        """``{chart id: URL}`` of the PNGs of ``charts``, for referencing from an HTML report.
+
+        Each PNG is stored in the results container under its content hash the first time
+        this process renders it, so that any instance can serve it.
+        """
+        urls = {}
+        for chart, rendered in zip(charts, self._rendered_all(function_name, charts, etag, 'png')):
+            self._publish(rendered)
+            urls[chart.chart_id] = f"{self.url_prefix}{rendered.digest}.png"
+        return urls
+
+    def svg_document(self, function_name, charts, etag):
+        """One SVG document with ``charts`` stacked vertically."""
+        return stack_svg([rendered.content for rendered in self._rendered_all(function_name, charts, etag, 'svg')])
+
+    def find(self, digest):
+        """PNG bytes with content hash ``digest`` if this process has them cached, else None."""
+        with self._lock:
+            key = self._digests.get(digest)
+            rendered = self._entries.get(key) if key is not None else None
+            return rendered.content if rendered is not None and rendered.digest == digest else None
+
+    def _publish(self, rendered):
+        if rendered.digest in self._published:
+            return
+        try:
+            save_chart(rendered.digest, rendered.content)
+        except Exception as e:
+            # Still served from this worker's cache; another request will try again
+            logging.warning(f"Could not store chart {rendered.digest}: {str(e)}")
+            return
+        with self._lock:
+            self._published.add(rendered.digest)
+
+    def _rendered(self, function_name, chart, etag, fmt):
+        return self._rendered_all(function_name, [chart], etag, fmt)[0]
+
+    def _rendered_all(self, function_name, charts, etag, fmt):
+        """Rendered ``charts``, in order; the ones that miss the cache are drawn together."""
+        keys = [self.key(function_name, chart, etag, fmt) for chart in charts]
+        rendered = [self._lookup(key) for key in keys]
+        missing = [i for i, found in enumerate(rendered) if found is None]
+        if missing:
+            self._count('misses', len(missing))
+            contents = render_pool.render([charts[i] for i in missing], fmt)
+            for i, content in zip(missing, contents):
+                rendered[i] = _Rendered(content)
+                self._store(keys[i], rendered[i])
+        return rendered
+
+    def _lookup(self, key):
+        """The cached (or spilled) rendering of ``key``, or None."""
+        with self._lock:
+            rendered = self._entries.get(key)
+            if rendered is not None:
+                self._entries.move_to_end(key)
+                self._counters['hits'] += 1
+                return rendered
+
+        content = self._read_spilled(key)
+        if content is None:
+            return None
+        self._count('spill_hits')
+        rendered = _Rendered(content)
+        self._store(key, rendered)
+        return rendered
+
+    def _count(self, counter, amount=1):
+        with self._lock:
+            self._counters[counter] += amount
+
+    def _store(self, key, rendered):
+        with self._lock:
+            if rendered.size > self.max_bytes:
+                # Too large to keep in memory at all
+                if self.spill_dir:
+                    self._spill(key, rendered.content)
+                return
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous.size
+            self._entries[key] = rendered
+            self._bytes += rendered.size
+            if key[-1] == 'png':
+                self._digests[rendered.digest] = key
+            self._evict()
+
+    def _evict(self):
+        """Drop least recently used charts until the cache fits (called with the lock held)."""
+        while self._bytes > self.max_bytes and self._entries:
+            key, rendered = self._entries.popitem(last=False)
+            self._bytes -= rendered.size
+            if self._digests.get(rendered.digest) == key:
+                del self._digests[rendered.digest]
+            self._counters['evictions'] += 1
+            if self.spill_dir:
+                self._spill(key, rendered.content)
+
+    def _spill_path(self, key):
+        return os.path.join(self.spill_dir, hashlib.sha256(repr(key).encode('utf-8')).hexdigest() + '.' + key[-1])
+
+    def _spill(self, key, content):
+        """Write an evicted chart to the spill directory (called with the lock held)."""
+        if len(content) > self.spill_max_bytes:
+            return
+        path = self._spill_path(key)
+        if path in self._spilled:
+            # Read back from the spill directory earlier, and still there
+            self._spilled.move_to_end(path)
+            return
+        try:
+            os.makedirs(self.spill_dir, exist_ok=True)
+            temporary_path = f"{path}.{os.getpid()}.tmp"
+            with open(temporary_path, 'wb') as spill_file:
+                spill_file.write(content)
+            os.replace(temporary_path, path)
+        except OSError as e:
+            logging.warning(f"Could not spill chart to {self.spill_dir}: {str(e)}")
+            return
+        self._counters['spills'] += 1
+        self._spilled_bytes += len(content)
+        self._spilled[path] = len(content)
+        while self._spilled_bytes > self.spill_max_bytes and self._spilled:
+            old_path, size = self._spilled.popitem(last=False)
+            self._spilled_bytes -= size
+            try:
+                os.remove(old_path)
+            except OSError:
+                pass
+
+    def _read_spilled(self, key):
+        if not self.spill_dir:
+            return None
+        try:
+            with open(self._spill_path(key), 'rb') as spill_file:
+                return spill_file.read()
+        except OSError:
+            return None
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._digests.clear()
+            self._bytes = 0
+
+    def stats(self):
+        """Counters of cache hits, spill hits, misses (charts drawn) and evictions, and the cache size."""
+        with self._lock:
+            stats = dict(self._counters)
+            stats['entries'] = len(self._entries)
+            stats['bytes'] = self._bytes
+            stats['spilled_bytes'] = self._spilled_bytes
+        total = stats['hits'] + stats['spill_hits'] + stats['misses']
+        stats['hit_rate'] = (stats['hits'] + stats['spill_hits']) / total if total else 0.0
+        return stats
+
+
+# Shared by every function running in this worker process
+chart_cache = ChartCache()
@@ -0,0 +1,90 @@
+"""Chart rendering shared by every function.
+
+Charts are drawn on ``matplotlib.figure.Figure`` objects with their own Agg canvas instead
+of through pyplot. pyplot keeps every figure it creates in a global registry until it is
+explicitly closed, so warm workers accumulated figures (and memory) across invocations, and
+concurrent invocations drew on each other's "current" figure. A Figure created here is not
+registered anywhere: it is freed once the caller drops it, and it can be rendered from any
+thread.
+
+Each function describes its charts as ``Chart`` objects: a module-level draw function and
+the data it plots. The same description is rendered as PNG for the HTML reports and as SVG
+for ``format=svg``, and only when the chart cache (see chart_cache.py) misses. The draw
+functions are plain module-level functions of their data, so the charts of a request can be
+drawn in other processes as well (see render_pool.py).
+"""
+import io
+import re
+
+import matplotlib
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+
+class Chart:
+    """One chart of a response: ``draw(**data)`` returns its Figure.
+
+    ``params`` are the request parameters the chart depends on; together with the chart id
+    and the source ETag they identify the rendered chart in the cache.
+    """
+
+    def __init__(self, chart_id, draw, data, params=None):
+        self.chart_id = chart_id
+        self.draw = draw
+        self.data = data
+        self.params = params or {}
+
+
+def new_figure(figsize):
+    """``(fig, ax)``: a figure with a single Axes, rendered by Agg."""
+    fig = Figure(figsize=figsize)
+    FigureCanvasAgg(fig)
+    return fig, fig.add_subplot()
+
+
+def figure_png(fig):
+    """Encode ``fig`` as PNG."""
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format='png')
+    return buffer.getvalue()
+
+
+def figure_svg(fig):
+    """Encode ``fig`` as SVG, with text kept as text rather than glyph outlines.
+
+    Element ids are salted with a fixed string instead of a random one, so the same chart
+    encodes to the same bytes in every process.
+    """
+    buffer = io.BytesIO()
+    with matplotlib.rc_context({'svg.fonttype': 'none', 'svg.hashsalt': 'charts'}):
+        fig.savefig(buffer, format='svg', metadata={'Date': None})
+    return buffer.getvalue()
+
+
+# Encoders of the formats charts are rendered in
+ENCODERS = {'png': figure_png, 'svg': figure_svg}
+
+
+def render_chart(draw, data, fmt):
+    """``draw(**data)`` encoded as ``fmt``: the task run by the render pool's processes."""
+    return ENCODERS[fmt](draw(**data))
+
+
+_SVG_ROOT = re.compile(rb'<svg\b[^>]*\bviewBox="0 0 ([\d.]+) ([\d.]+)"[^>]*>')
+
+
+def stack_svg(documents):
+    """Combine SVG documents into one, stacked vertically in the given order."""
+    width, offset, parts = 0.0, 0.0, []
+    for document in documents:
+        root = _SVG_ROOT.search(document)
+        chart_width, chart_height = float(root.group(1)), float(root.group(2))
+        parts.append(f'<svg x="0" y="{offset:g}" width="{chart_width:g}" height="{chart_height:g}" '
+                     f'viewBox="0 0 {chart_width:g} {chart_height:g}">'.encode('utf-8'))
+        parts.append(document[root.end():])
+        width = max(width, chart_width)
+        offset += chart_height
+    header = (f'<?xml version="1.0" encoding="utf-8" standalone="no"?>\n'
+              f'<svg xmlns="http://www.w3.org/2000/svg" xmlns:xlink="http://www.w3.org/1999/xlink" version="1.1" '
+              f'width="{width:g}pt" height="{offset:g}pt" viewBox="0 0 {width:g} {offset:g}">\n')
+    return header.encode('utf-8') + b'\n'.join(parts) + b'\n</svg>\n'
@@ -0,0 +1,70 @@
+"""Parquet mirror of the CSV blobs in the "sources" container.
+
+The ColumnarMirror blob trigger writes ``<name>.parquet`` to COLUMNAR_CONTAINER whenever a
+source CSV changes, stored with the compact dtypes from schema.py and tagged with the ETag
+of the CSV it was converted from. Readers ask for just the columns they need; a mirror
+whose ``source_etag`` does not match the current CSV is treated as missing so callers fall
+back to the CSV.
+"""
+import io
+import logging
+import os
+
+import pandas as pd
+from azure.core import MatchConditions
+from azure.core.exceptions import ResourceModifiedError, ResourceNotFoundError
+
+from .schema import schema_for
+from .storage import get_container_client
+
+COLUMNAR_CONTAINER = os.getenv('COLUMNAR_CONTAINER', 'sources-columnar')
+
+
+def columnar_blob_name(blob_name):
+    return os.path.splitext(blob_name)[0] + '.parquet'
+
+
+def write_mirror(source_container, blob_name):
+    """Convert ``blob_name`` to Parquet and upload it next to the other mirrors.
+
+    Returns the ETag of the CSV that was converted.
+    """
+    downloader = source_container.get_blob_client(blob_name).download_blob()
+    source_etag = downloader.properties.etag
+    schema = schema_for(blob_name)
+    df = pd.read_csv(io.BytesIO(downloader.readall()), dtype=schema.dtypes() if schema is not None else None)
+
+    buffer = io.BytesIO()
+    df.to_parquet(buffer, index=False)
+
+    target = get_container_client(COLUMNAR_CONTAINER).get_blob_client(columnar_blob_name(blob_name))
+    target.upload_blob(buffer.getvalue(), overwrite=True, metadata={'source_etag': source_etag})
+    logging.info(f"Wrote columnar mirror of {blob_name} ({len(df)} rows, source etag {source_etag}).")
+    return source_etag
+
+
+def read_mirror(blob_name, columns, source_etag):
+    """Load ``columns`` from the Parquet mirror of ``blob_name``.
+
+    Returns None when there is no mirror or it was built from a different version of the
+    CSV than ``source_etag``.
+    """
+    blob_client = get_container_client(COLUMNAR_CONTAINER).get_blob_client(columnar_blob_name(blob_name))
+    try:
+        # Only the metadata is fetched until the mirror is known to be current
+        properties = blob_client.get_blob_properties()
+    except ResourceNotFoundError:
+        return None
+
+    if properties.metadata.get('source_etag') != source_etag:
+        logging.info(f"Columnar mirror of {blob_name} is stale; falling back to the CSV.")
+        return None
+
+    try:
+        # The version whose metadata was checked, unless the mirror was rewritten since
+        downloader = blob_client.download_blob(etag=properties.etag, match_condition=MatchConditions.IfNotModified)
+    except (ResourceNotFoundError, ResourceModifiedError):
+        logging.info(f"Columnar mirror of {blob_name} changed while reading it; falling back to the CSV.")
+        return None
+
+    return pd.read_parquet(io.BytesIO(downloader.readall()), columns=list(columns))
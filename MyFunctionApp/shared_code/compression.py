@@ -0,0 +1,141 @@
+"""Content-Encoding negotiation for the responses of the HTTP functions.
+
+Text responses (HTML reports, JSON and SVG) of at least COMPRESSION_MIN_BYTES (default 1024)
+are compressed with the best encoding the request's Accept-Encoding header allows: brotli
+(``br``) when the Brotli package is installed, else gzip. Responses to clients that accept
+neither, and images (PNGs are compressed already), are sent as they are.
+
+Configuration is read from the environment:
+
+* COMPRESSION_MIN_BYTES - smallest body worth compressing (default 1024).
+* COMPRESSION_GZIP_LEVEL - gzip level, 1-9 (default 6).
+* COMPRESSION_BROTLI_QUALITY - brotli quality, 0-11 (default 5).
+* COMPRESSION_CACHE_MAX_BYTES - size of the cache of compressed bodies (default 16 MiB; 0
+  disables the cache).
+
+A function returns the same body for the same query until its source blob changes, and the
+reports precomputed by MaterializeResults are served verbatim, so the same bodies would be
+compressed over and over. Compressed bodies are cached per worker process instead, keyed by
+the content hash of the uncompressed body and the encoding, and evicted least recently used
+first.
+"""
+import gzip
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+from .formats import parse_accept
+
+try:
+    import brotli
+except ImportError:
+    # Optional: without it only gzip is offered
+    brotli = None
+
+# Media types worth compressing
+COMPRESSIBLE = {'text/html', 'text/plain', 'application/json', 'image/svg+xml'}
+
+
+class Compressor:
+    def __init__(self, min_bytes=None, gzip_level=None, brotli_quality=None, cache_max_bytes=None):
+        if min_bytes is None:
+            min_bytes = int(os.getenv('COMPRESSION_MIN_BYTES', '1024'))
+        if gzip_level is None:
+            gzip_level = int(os.getenv('COMPRESSION_GZIP_LEVEL', '6'))
+        if brotli_quality is None:
+            brotli_quality = int(os.getenv('COMPRESSION_BROTLI_QUALITY', '5'))
+        if cache_max_bytes is None:
+            cache_max_bytes = int(os.getenv('COMPRESSION_CACHE_MAX_BYTES', str(16 * 1024 * 1024)))
+        self.min_bytes = min_bytes
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.cache_max_bytes = cache_max_bytes
+        # Encodings offered, in order of preference
+        self.encodings = (['br'] if brotli is not None else []) + ['gzip']
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._counters = {'hits': 0, 'misses': 0, 'evictions': 0, 'bytes_in': 0, 'bytes_out': 0}
+
+    def respond(self, req, body, mimetype, headers=None):
+        """``(body, headers)`` of the response to ``req``, compressed if the client accepts it."""
+        headers = dict(headers or {})
+        if mimetype not in COMPRESSIBLE:
+            return body, headers
+
+        # Caches must not serve a compressed body to a client that did not ask for one
+        vary = headers.get('Vary')
+        headers['Vary'] = f"{vary}, Accept-Encoding" if vary else 'Accept-Encoding'
+
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        if len(body) < self.min_bytes:
+            return body, headers
+        encoding = self.encoding(req.headers.get('Accept-Encoding'))
+        if encoding is None:
+            return body, headers
+
+        headers['Content-Encoding'] = encoding
+        return self.compress(body, encoding), headers
+
+    def encoding(self, accept_encoding):
+        """The encoding to use for an Accept-Encoding header, or None for none."""
+        if not accept_encoding:
+            return None
+        qualities = {}
+        for coding, q in parse_accept(accept_encoding):
+            qualities.setdefault(coding, q)
+        best, best_q = None, 0.0
+        for coding in self.encodings:
+            q = qualities.get(coding, qualities.get('*', 0.0))
+            if q > best_q:
+                best, best_q = coding, q
+        return best
+
+    def compress(self, body, encoding):
+        """``body`` compressed with ``encoding``; compressed only once while it stays cached."""
+        key = (hashlib.sha256(body).digest(), encoding)
+        with self._lock:
+            compressed = self._entries.get(key)
+            if compressed is not None:
+                self._entries.move_to_end(key)
+                self._counters['hits'] += 1
+                return compressed
+
+        if encoding == 'br':
+            compressed = brotli.compress(body, quality=self.brotli_quality)
+        else:
+            # No timestamp, so that the same body always compresses to the same bytes
+            compressed = gzip.compress(body, compresslevel=self.gzip_level, mtime=0)
+
+        with self._lock:
+            self._counters['misses'] += 1
+            self._counters['bytes_in'] += len(body)
+            self._counters['bytes_out'] += len(compressed)
+            if len(compressed) <= self.cache_max_bytes and key not in self._entries:
+                self._entries[key] = compressed
+                self._bytes += len(compressed)
+                while self._bytes > self.cache_max_bytes and self._entries:
+                    _, evicted = self._entries.popitem(last=False)
+                    self._bytes -= len(evicted)
+                    self._counters['evictions'] += 1
+        return compressed
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        """Counters of cache hits, misses (bodies compressed) and evictions, and the cache size."""
+        with self._lock:
+            stats = dict(self._counters)
+            stats['entries'] = len(self._entries)
+            stats['bytes'] = self._bytes
+        stats['ratio'] = stats['bytes_out'] / stats['bytes_in'] if stats['bytes_in'] else 0.0
+        return stats
+
+
+# Shared by every function running in this worker process
+compressor = Compressor()
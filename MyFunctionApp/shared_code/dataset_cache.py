@@ -0,0 +1,351 @@
+"""Process-wide cache of the parsed source datasets.
+
+The parsed DataFrame for each blob is kept across warm invocations of every function in the
+worker. Once the revalidation interval has elapsed the next caller issues a conditional
+download (If-None-Match with the cached ETag); the blob is only transferred and re-parsed
+when the service reports that it actually changed.
+
+Functions that only need a few columns pass them as ``columns``; those projections are
+loaded from the Parquet mirror (see columnar.py) when it is current, and from the CSV with
+``usecols`` otherwise, and are cached separately.
+
+Callers that only need per-year totals pass ``sum_by='year'``; blobs at least
+DATASET_STREAMING_THRESHOLD_BYTES in size (default 64 MiB) are then aggregated while
+streaming (see streaming.py) so the full file is never held in memory.
+
+Datasets registered in schema.py are parsed with their compact dtypes and validated once
+per version.
+
+The source CSVs grow by appending rows for new years. When a projected or reduced entry is
+found to be stale and the blob only grew, the cache downloads and parses just the appended
+bytes and extends the cached frame (or adds the new rows to the per-year totals) instead of
+re-reading the whole file. A change counts as an append when the blob is larger than the
+cached version and the last bytes of that version are still in place; entries remember the
+header line and a tail of the file for this check, and the ETag they were extended from so
+that callers (see analytics.py) can update their own results incrementally too. Set
+DATASET_INCREMENTAL_APPENDS=false to always reload changed blobs in full.
+
+``current_etag`` tells callers which version of a blob is current, to the same interval,
+without loading it; results.py checks materialized reports against it.
+
+The revalidation interval is read from DATASET_CACHE_REVALIDATE_SECONDS (default 60).
+"""
+import io
+import logging
+import os
+import threading
+import time
+
+import pandas as pd
+from azure.core import MatchConditions
+from azure.core.exceptions import HttpResponseError, ResourceNotModifiedError
+
+from .columnar import read_mirror
+from .schema import schema_for
+from .streaming import aggregate_blob
+
+
+# Bytes at the end of a cached version that must be unchanged for a change to be an append
+TAIL_BYTES = 64 * 1024
+# Enough of the start of a blob to contain its header line
+HEADER_BYTES = 64 * 1024
+
+
+def _is_not_modified(error):
+    return isinstance(error, ResourceNotModifiedError) or getattr(error, 'status_code', None) == 304
+
+
+class _Fingerprint:
+    """Size, header line and last bytes of the version of a blob an entry was loaded from."""
+
+    def __init__(self, size, header, tail):
+        self.size = size
+        self.header = header
+        self.tail = tail
+
+    @classmethod
+    def of(cls, data):
+        return cls(len(data), data[:data.find(b'\n') + 1], data[-TAIL_BYTES:])
+
+
+class _CacheEntry:
+    def __init__(self, frame, etag, checked_at, fingerprint=None, base_etag=None):
+        self.frame = frame
+        self.etag = etag
+        self.checked_at = checked_at
+        self.fingerprint = fingerprint
+        self.base_etag = base_etag
+
+
+class DatasetCache:
+    def __init__(self, revalidate_seconds=None, streaming_threshold=None, incremental=None, clock=time.monotonic):
+        if revalidate_seconds is None:
+            revalidate_seconds = float(os.getenv('DATASET_CACHE_REVALIDATE_SECONDS', '60'))
+        if streaming_threshold is None:
+            streaming_threshold = int(os.getenv('DATASET_STREAMING_THRESHOLD_BYTES', str(64 * 1024 * 1024)))
+        if incremental is None:
+            incremental = os.getenv('DATASET_INCREMENTAL_APPENDS', 'true').lower() == 'true'
+        self.revalidate_seconds = revalidate_seconds
+        self.streaming_threshold = streaming_threshold
+        self.incremental = incremental
+        self._clock = clock
+        self._entries = {}
+        # (container, blob) -> (etag, checked_at) of the blobs whose ETag alone was asked for
+        self._etags = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+        self._counters = {'hits': 0, 'misses': 0, 'revalidations': 0, 'columnar_loads': 0, 'streamed_loads': 0,
+                          'appended_loads': 0}
+
+    def _key_lock(self, key):
+        with self._lock:
+            return self._locks.setdefault(key, threading.Lock())
+
+    def _count(self, counter):
+        with self._lock:
+            self._counters[counter] += 1
+
+    def get(self, container_client, blob_name, columns=None, sum_by=None):
+        """Return the parsed CSV stored in ``blob_name``, downloading it only when needed.
+
+        When ``columns`` is given only those columns are loaded, from the Parquet mirror if
+        it is current and from the CSV otherwise. When ``sum_by`` names a column, the caller
+        only needs the per-group totals of the other columns; blobs larger than the streaming
+        threshold are then reduced chunk by chunk instead of being loaded whole.
+
+        Callers receive a shallow copy, so adding derived columns does not leak into the
+        cached frame seen by other invocations.
+        """
+        return self.get_with_etag(container_client, blob_name, columns, sum_by)[0]
+
+    def get_with_etag(self, container_client, blob_name, columns=None, sum_by=None):
+        """Like ``get``, but returns ``(frame, etag)`` with the ETag of the version returned."""
+        if columns is not None:
+            columns = tuple(columns)
+        key = (container_client.container_name, blob_name, columns, sum_by)
+
+        # One lock per dataset so concurrent invocations don't all download the same file
+        with self._key_lock(key):
+            entry = self._entries.get(key)
+            now = self._clock()
+
+            if entry is not None and now - entry.checked_at < self.revalidate_seconds:
+                self._count('hits')
+                return entry.frame.copy(deep=False), entry.etag
+
+            blob_client = container_client.get_blob_client(blob_name)
+            try:
+                if entry is None:
+                    loaded = self._load(blob_client, columns, sum_by)
+                elif columns is None and sum_by is None:
+                    downloader = blob_client.download_blob(etag=entry.etag, match_condition=MatchConditions.IfModified)
+                    loaded = self._parsed(blob_client, downloader)
+                else:
+                    # Projected and reduced entries revalidate with a conditional HEAD so that a
+                    # changed CSV can still be served from its Parquet mirror or streamed, or
+                    # extended with just the appended rows
+                    properties = blob_client.get_blob_properties(etag=entry.etag, match_condition=MatchConditions.IfModified)
+                    loaded = self._append(blob_client, entry, columns, sum_by, properties)
+                    if loaded is None:
+                        loaded = self._load(blob_client, columns, sum_by, properties)
+            except HttpResponseError as e:
+                if entry is None or not _is_not_modified(e):
+                    raise
+                # The service answered 304: the cached frame is still current
+                entry.checked_at = now
+                self._count('revalidations')
+                return entry.frame.copy(deep=False), entry.etag
+
+            entry = loaded
+            entry.checked_at = now
+            self._entries[key] = entry
+            self._count('misses')
+            logging.info(f"Dataset cache loaded {blob_name} (etag {entry.etag}).")
+            return entry.frame.copy(deep=False), entry.etag
+
+    def _load(self, blob_client, columns, sum_by, properties=None):
+        """Load a version of the blob from scratch; returns an entry that is not yet stored."""
+        if columns is None and sum_by is None:
+            return self._parsed(blob_client, blob_client.download_blob())
+
+        schema = schema_for(blob_client.blob_name)
+        dtype = schema.dtypes(columns) if schema is not None else None
+
+        if properties is None:
+            properties = blob_client.get_blob_properties()
+
+        if sum_by is not None and properties.size >= self.streaming_threshold:
+            aggregate, etag = aggregate_blob(blob_client, columns, group_by=sum_by, dtype=dtype)
+            self._count('streamed_loads')
+            frame = self._validated(schema, aggregate.group_totals.reset_index(), etag, columns)
+            return _CacheEntry(frame, etag, None, self._fingerprint(blob_client, etag))
+
+        frame = read_mirror(blob_client.blob_name, columns, properties.etag) if columns is not None else None
+        if frame is not None:
+            etag = properties.etag
+            if dtype is not None:
+                frame = frame.astype(dtype)
+            fingerprint = self._fingerprint(blob_client, etag)
+            self._count('columnar_loads')
+        else:
+            downloader = blob_client.download_blob()
+            data = downloader.readall()
+            usecols = list(columns) if columns is not None else None
+            frame = pd.read_csv(io.BytesIO(data), usecols=usecols, dtype=dtype)
+            etag = downloader.properties.etag
+            fingerprint = _Fingerprint.of(data) if self.incremental else None
+
+        if sum_by is not None:
+            frame = frame.groupby(sum_by, sort=False, as_index=False).sum()
+        return _CacheEntry(self._validated(schema, frame, etag, columns), etag, None, fingerprint)
+
+    def _parsed(self, blob_client, downloader):
+        """Entry of the whole CSV downloaded by ``downloader``, parsed with the schema's dtypes and validated."""
+        schema = schema_for(blob_client.blob_name)
+        dtype = schema.dtypes() if schema is not None else None
+        frame, etag = pd.read_csv(io.BytesIO(downloader.readall()), dtype=dtype), downloader.properties.etag
+        return _CacheEntry(self._validated(schema, frame, etag, None), etag, None)
+
+    def _fingerprint(self, blob_client, etag):
+        """Fingerprint of a version that was not downloaded in full, from ranged reads."""
+        if not self.incremental:
+            return None
+        try:
+            condition = {'etag': etag, 'match_condition': MatchConditions.IfNotModified}
+            size = blob_client.get_blob_properties(**condition).size
+            head = blob_client.download_blob(offset=0, length=min(HEADER_BYTES, size), **condition).readall()
+            tail = blob_client.download_blob(offset=max(size - TAIL_BYTES, 0), **condition).readall()
+        except HttpResponseError as e:
+            # Changed again in the meantime: the next revalidation reloads it in full
+            logging.warning(f"Could not fingerprint {blob_client.blob_name}: {str(e)}")
+            return None
+        return _Fingerprint(size, head[:head.find(b'\n') + 1], tail)
+
+    def _append(self, blob_client, entry, columns, sum_by, properties):
+        """Extend ``entry`` with the rows appended since it was loaded.
+
+        Returns None when the change is not a pure append (or incremental loading is off), in
+        which case the caller reloads the blob in full.
+        """
+        fingerprint = entry.fingerprint
+        if not self.incremental or fingerprint is None or not fingerprint.header:
+            return None
+        appended_size = properties.size - fingerprint.size
+        if appended_size <= 0 or appended_size >= self.streaming_threshold or not fingerprint.tail.endswith(b'\n'):
+            return None
+
+        # Read the old tail together with the new bytes and check the tail is still in place
+        try:
+            downloader = blob_client.download_blob(
+                offset=fingerprint.size - len(fingerprint.tail),
+                length=len(fingerprint.tail) + appended_size,
+                etag=properties.etag,
+                match_condition=MatchConditions.IfNotModified
+            )
+            data = downloader.readall()
+        except HttpResponseError:
+            return None
+        if not data.startswith(fingerprint.tail):
+            return None
+        appended = data[len(fingerprint.tail):]
+
+        schema = schema_for(blob_client.blob_name)
+        dtype = schema.dtypes(columns) if schema is not None else None
+        usecols = list(columns) if columns is not None else None
+        rows = pd.read_csv(io.BytesIO(fingerprint.header + appended), usecols=usecols, dtype=dtype)
+
+        frame = pd.concat([entry.frame, rows], ignore_index=True)
+        if sum_by is not None:
+            # The first appended year may already have rows in the cached totals
+            frame = frame.groupby(sum_by, sort=False, as_index=False).sum()
+
+        self._count('appended_loads')
+        logging.info(f"Dataset cache appended {len(rows)} rows to {blob_client.blob_name} (etag {properties.etag}).")
+        etag = properties.etag
+        fingerprint = _Fingerprint(properties.size, fingerprint.header, (fingerprint.tail + appended)[-TAIL_BYTES:])
+        return _CacheEntry(self._validated(schema, frame, etag, columns), etag, None, fingerprint, base_etag=entry.etag)
+
+    def _validated(self, schema, frame, etag, columns):
+        if schema is not None:
+            schema.validate(frame, etag, columns)
+        return frame
+
+    def appended_to(self, container_client, blob_name, etag, columns=None, sum_by=None):
+        """ETag of the version that the cached ``etag`` version was built from by appending rows.
+
+        Returns None when that entry was loaded in full (or is no longer cached). The frame of
+        an appended raw-row entry starts with exactly the rows of its base version.
+        """
+        if columns is not None:
+            columns = tuple(columns)
+        with self._lock:
+            entry = self._entries.get((container_client.container_name, blob_name, columns, sum_by))
+        if entry is None or entry.etag != etag:
+            return None
+        return entry.base_etag
+
+    def expire(self, container_client, blob_name):
+        """Make the next request for ``blob_name`` revalidate it, keeping the cached frames.
+
+        Unlike ``invalidate``, a changed blob can then still be extended incrementally.
+        """
+        with self._lock:
+            self._etags.pop((container_client.container_name, blob_name), None)
+            for key, entry in self._entries.items():
+                if key[:2] == (container_client.container_name, blob_name):
+                    entry.checked_at = float('-inf')
+
+    def etag(self, container_client, blob_name):
+        """Newest ETag seen for ``blob_name`` across its cached projections, or None."""
+        with self._lock:
+            entries = [entry for key, entry in self._entries.items()
+                       if key[:2] == (container_client.container_name, blob_name)]
+        if not entries:
+            return None
+        return max(entries, key=lambda entry: entry.checked_at).etag
+
+    def current_etag(self, container_client, blob_name):
+        """ETag of the current version of ``blob_name``, as of the revalidation interval.
+
+        A cached projection checked within the interval answers without a request; otherwise
+        the blob's properties are fetched (no download) and their ETag remembered for the
+        interval.
+        """
+        key = (container_client.container_name, blob_name)
+        now = self._clock()
+        with self._lock:
+            fresh = [entry for entry_key, entry in self._entries.items()
+                     if entry_key[:2] == key and now - entry.checked_at < self.revalidate_seconds]
+            known = self._etags.get(key)
+        if fresh:
+            return max(fresh, key=lambda entry: entry.checked_at).etag
+        if known is not None and now - known[1] < self.revalidate_seconds:
+            return known[0]
+        etag = container_client.get_blob_client(blob_name).get_blob_properties().etag
+        with self._lock:
+            self._etags[key] = (etag, now)
+        return etag
+
+    def invalidate(self, container_client=None, blob_name=None):
+        """Drop the cached projections of one dataset, or everything when called without arguments."""
+        with self._lock:
+            if container_client is None:
+                self._entries.clear()
+                self._etags.clear()
+                return
+            self._etags.pop((container_client.container_name, blob_name), None)
+            for key in [key for key in self._entries if key[:2] == (container_client.container_name, blob_name)]:
+                del self._entries[key]
+
+    def stats(self):
+        """Hit/miss/revalidation counters plus the share of requests served without a download."""
+        with self._lock:
+            stats = dict(self._counters)
+        total = stats['hits'] + stats['misses'] + stats['revalidations']
+        stats['hit_rate'] = (stats['hits'] + stats['revalidations']) / total if total else 0.0
+        stats['entries'] = len(self._entries)
+        return stats
+
+
+# Shared by every function running in this worker process
+dataset_cache = DatasetCache()
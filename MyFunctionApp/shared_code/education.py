@@ -0,0 +1,82 @@
+"""wages_by_education as a dense year x group x education_level array.
+
+The 25 ``{group}_{level}`` columns are reshaped once into an ``(years, groups, levels)``
+ndarray so that proportions, Gini coefficients and level ratios are computed for every
+group and every year with whole-array NumPy operations instead of per-column copies and a
+Python loop over years.
+"""
+import numpy as np
+
+from .schema import DEMOGRAPHIC_GROUPS, EDUCATION_LEVELS
+
+
+class EducationTensor:
+    def __init__(self, years, groups, values):
+        self.years = years
+        self.groups = list(groups)
+        self.levels = list(EDUCATION_LEVELS)
+        self.values = values
+        self._year_rows = {int(year): row for row, year in enumerate(years)}
+
+    def __len__(self):
+        return len(self.years)
+
+    def __getitem__(self, rows):
+        """The tensor restricted to a slice of its years."""
+        return EducationTensor(self.years[rows], self.groups, self.values[rows])
+
+    def concat(self, other):
+        """This tensor followed by the years of ``other`` (which must have the same groups)."""
+        if other.groups != self.groups:
+            raise ValueError(f"Cannot concatenate tensors of groups {self.groups} and {other.groups}.")
+        return EducationTensor(np.concatenate([self.years, other.years]), self.groups,
+                               np.concatenate([self.values, other.values]))
+
+    @classmethod
+    def from_frame(cls, df, groups=DEMOGRAPHIC_GROUPS):
+        """Build the tensor from the ``{group}_{level}`` columns of ``df`` (rows stay in file order)."""
+        groups = [group for group in groups if f'{group}_{EDUCATION_LEVELS[0]}' in df.columns]
+        columns = [f'{group}_{level}' for group in groups for level in EDUCATION_LEVELS]
+        values = df[columns].to_numpy(dtype=np.float64).reshape(len(df), len(groups), len(EDUCATION_LEVELS))
+        return cls(df['year'].to_numpy(), groups, values)
+
+    def group_index(self, group):
+        return self.groups.index(group)
+
+    def level_index(self, level):
+        return self.levels.index(level)
+
+    def row(self, year):
+        """Row of ``year``, or None when the dataset has no data for it."""
+        return self._year_rows.get(int(year))
+
+    def rows(self, years):
+        """``(found_years, rows)`` for the years of ``years`` present in the dataset, in order."""
+        found = [int(year) for year in years if int(year) in self._year_rows]
+        return found, [self._year_rows[year] for year in found]
+
+    def proportions(self, total_groups=None):
+        """Each value divided by its year's total over ``total_groups`` (all groups by default)."""
+        if total_groups is None:
+            totals = self.values.sum(axis=(1, 2))
+        else:
+            indexes = [self.group_index(group) for group in total_groups]
+            totals = self.values[:, indexes, :].sum(axis=(1, 2))
+        return self.values / totals[:, None, None]
+
+
+def gini(proportions):
+    """Gini coefficient along the last axis, for any number of leading axes.
+
+    Equivalent to integrating the Lorenz curve with the trapezoidal rule: with ``n`` values
+    the area under the curve is ``(2 * sum(cumulative) - 1) / (2 * n)``.
+    """
+    n = proportions.shape[-1]
+    sorted_proportions = np.sort(proportions, axis=-1)
+    cumulative = np.cumsum(sorted_proportions, axis=-1) / sorted_proportions.sum(axis=-1, keepdims=True)
+    return 1 - (2 * cumulative.sum(axis=-1) - 1) / n
+
+
+def level_ratio(tensor, proportions, numerator='bachelors_degree', denominator='less_than_hs'):
+    """Ratio of two education levels for every year and group, shape ``(years, groups)``."""
+    return proportions[:, :, tensor.level_index(numerator)] / proportions[:, :, tensor.level_index(denominator)]
@@ -0,0 +1,103 @@
+"""Response formats of the HTTP functions.
+
+Every function answers in one of three formats:
+
+* ``html`` - the report, referencing its PNG charts by URL (the default, and what
+  MaterializeResults precomputes);
+* ``json`` - the numbers behind the report (series and summary statistics), computed without
+  drawing anything;
+* ``svg`` - the report's charts as one vector image, stacked vertically.
+
+The format is chosen by the ``format`` query parameter, or else from the Accept header, so
+browsers keep getting HTML while ``Accept: application/json`` clients get data.
+"""
+import json
+import math
+
+import numpy as np
+import pandas as pd
+
+FORMATS = {
+    'html': 'text/html',
+    'json': 'application/json',
+    'svg': 'image/svg+xml',
+}
+
+# Media types (and wildcards) of the Accept header that select each format
+_MEDIA_TYPES = {
+    'text/html': 'html',
+    'application/xhtml+xml': 'html',
+    'text/*': 'html',
+    'application/json': 'json',
+    'application/*': 'json',
+    'image/svg+xml': 'svg',
+    'image/*': 'svg',
+}
+
+
+def parse_accept(accept):
+    """``(value, q)`` pairs of an Accept or Accept-Encoding header, most preferred first."""
+    ranges = []
+    for position, part in enumerate(accept.split(',')):
+        media_type, *params = [item.strip() for item in part.split(';')]
+        q = 1.0
+        for param in params:
+            name, _, value = param.partition('=')
+            if name.strip() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if media_type:
+            ranges.append((media_type.lower(), q, position))
+    ranges.sort(key=lambda item: (-item[1], item[2]))
+    return [(media_type, q) for media_type, q, _ in ranges]
+
+
+def negotiate(req, default='html'):
+    """The response format requested by ``req``.
+
+    An explicit ``format`` parameter wins and raises ValueError when it is not one of
+    FORMATS. Otherwise the Accept header is honoured; None means nothing it accepts is
+    available (406).
+    """
+    requested = req.params.get('format')
+    if requested:
+        if requested not in FORMATS:
+            raise ValueError(f"Invalid format: {requested}")
+        return requested
+
+    accept = req.headers.get('Accept')
+    if not accept:
+        return default
+    for media_type, q in parse_accept(accept):
+        if q <= 0:
+            continue
+        if media_type == '*/*':
+            return default
+        if media_type in _MEDIA_TYPES:
+            return _MEDIA_TYPES[media_type]
+    return None
+
+
+def _plain(value):
+    """``value`` with NumPy/pandas containers and scalars turned into JSON types, NaN into None."""
+    if isinstance(value, dict):
+        return {str(key): _plain(item) for key, item in value.items()}
+    if isinstance(value, (pd.Series, pd.Index)):
+        value = value.to_numpy()
+    if isinstance(value, (np.ndarray, list, tuple)):
+        return [_plain(item) for item in value]
+    if isinstance(value, np.float32):
+        # Shortest decimal form of the float32 (872.6, not 872.5999755859375)
+        value = float(str(value))
+    elif isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    return value
+
+
+def json_body(data):
+    """Serialize a response dict of NumPy/pandas values as JSON (NaN becomes null)."""
+    return json.dumps(_plain(data))
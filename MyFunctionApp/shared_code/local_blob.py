@@ -0,0 +1,105 @@
+"""Filesystem-backed stand-in for the parts of the Blob Storage client API used by this app.
+
+A container is a directory and a blob is a file inside it. ETags are derived from the
+file's modification time and size, and conditional downloads honour ``etag`` /
+``match_condition`` the same way the real service does, so code written against
+``ContainerClient`` / ``BlobClient`` can be exercised locally without Azure or Azurite.
+Blob metadata is kept in a ``<blob>.metadata.json`` file next to the blob.
+"""
+import json
+import os
+
+from azure.core import MatchConditions
+from azure.core.exceptions import ResourceExistsError, ResourceModifiedError, ResourceNotFoundError, ResourceNotModifiedError
+
+
+class LocalBlobProperties:
+    def __init__(self, name, etag, size, metadata=None):
+        self.name = name
+        self.etag = etag
+        self.size = size
+        self.metadata = metadata or {}
+
+
+class LocalBlobDownloader:
+    def __init__(self, data, properties):
+        self._data = data
+        self.properties = properties
+        self.size = len(data)
+
+    def readall(self):
+        return self._data
+
+    def chunks(self, chunk_size=4 * 1024 * 1024):
+        for start in range(0, len(self._data), chunk_size):
+            yield self._data[start:start + chunk_size]
+
+    def content_as_text(self, encoding='UTF-8'):
+        return self._data.decode(encoding)
+
+
+class LocalBlobClient:
+    def __init__(self, container_name, blob_name, path):
+        self.container_name = container_name
+        self.blob_name = blob_name
+        self._path = path
+
+    def _etag(self):
+        try:
+            stat = os.stat(self._path)
+        except FileNotFoundError:
+            raise ResourceNotFoundError(f"The specified blob does not exist: {self.blob_name}")
+        return f'"0x{stat.st_mtime_ns:X}{stat.st_size:X}"', stat.st_size
+
+    def _metadata(self):
+        try:
+            with open(self._path + '.metadata.json') as metadata_file:
+                return json.load(metadata_file)
+        except FileNotFoundError:
+            return {}
+
+    def _check_condition(self, current_etag, etag, match_condition):
+        if etag is None or match_condition is None:
+            return
+        if match_condition == MatchConditions.IfModified and current_etag == etag:
+            raise ResourceNotModifiedError(f"Blob {self.blob_name} has not been modified.")
+        if match_condition == MatchConditions.IfNotModified and current_etag != etag:
+            raise ResourceModifiedError(f"Blob {self.blob_name} has been modified.")
+
+    def get_blob_properties(self, etag=None, match_condition=None, **kwargs):
+        current_etag, size = self._etag()
+        self._check_condition(current_etag, etag, match_condition)
+        return LocalBlobProperties(self.blob_name, current_etag, size, self._metadata())
+
+    def download_blob(self, offset=None, length=None, etag=None, match_condition=None, **kwargs):
+        current_etag, size = self._etag()
+        self._check_condition(current_etag, etag, match_condition)
+        with open(self._path, 'rb') as blob_file:
+            # Ranged downloads return just the requested bytes, like the service does
+            blob_file.seek(offset or 0)
+            data = blob_file.read() if length is None else blob_file.read(length)
+        return LocalBlobDownloader(data, LocalBlobProperties(self.blob_name, current_etag, size, self._metadata()))
+
+    def upload_blob(self, data, overwrite=False, metadata=None, **kwargs):
+        if not overwrite and os.path.exists(self._path):
+            raise ResourceExistsError(f"The specified blob already exists: {self.blob_name}")
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        elif hasattr(data, 'read'):
+            data = data.read()
+        os.makedirs(os.path.dirname(self._path), exist_ok=True)
+        with open(self._path, 'wb') as blob_file:
+            blob_file.write(data)
+        with open(self._path + '.metadata.json', 'w') as metadata_file:
+            json.dump(metadata or {}, metadata_file)
+        etag, _ = self._etag()
+        return {'etag': etag}
+
+
+class LocalContainerClient:
+    def __init__(self, root, container_name):
+        self.container_name = container_name
+        self._directory = os.path.join(root, container_name)
+
+    def get_blob_client(self, blob):
+        return LocalBlobClient(self.container_name, blob, os.path.join(self._directory, blob))
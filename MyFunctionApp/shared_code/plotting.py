@@ -0,0 +1,127 @@
+"""Lightweight line and bar drawing for precomputed series.
+
+Every series the functions plot already has one value per x (one per year), so seaborn's
+per-call grouping, aggregation and estimator machinery only added overhead. ``draw_lines``
+adds all the series of a chart to the Axes as a single collection of polylines and
+``draw_bars`` adds each bar series as a single PolyCollection, instead of one artist per line
+or per bar.
+Both return legend handles for ``ax.legend(handles=...)``.
+
+Series with more points than the Axes is wide in pixels are downsampled with
+Largest-Triangle-Three-Buckets (``lttb``) first: the extra points could not be told apart on
+the chart, and LTTB keeps the peaks and troughs that a plain stride would skip.
+"""
+import matplotlib as mpl
+import numpy as np
+from matplotlib.collections import PolyCollection
+from matplotlib.lines import Line2D
+from matplotlib.patches import Patch
+
+
+def cycle_colors(count):
+    """The first ``count`` colors of the default property cycle, repeated as needed."""
+    colors = mpl.rcParams['axes.prop_cycle'].by_key()['color']
+    return [colors[i % len(colors)] for i in range(count)]
+
+
+def lttb(x, y, threshold):
+    """Indices of the ``threshold`` points of each column of ``y`` kept by LTTB.
+
+    ``x`` has shape ``(n,)`` and ``y`` shape ``(n, k)``; the result has shape
+    ``(threshold, k)`` (or ``(n, k)`` when there are no more than ``threshold`` points).
+    Every column is downsampled in the same pass over the buckets.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    n, k = y.shape
+    if threshold >= n or threshold < 3:
+        return np.repeat(np.arange(n)[:, None], k, axis=1)
+
+    # The first and last points are always kept; the others fall into threshold - 2 buckets
+    every = (n - 2) / (threshold - 2)
+    edges = np.floor(np.arange(threshold - 1) * every).astype(np.intp) + 1
+    edges[-1] = n - 1
+
+    columns = np.arange(k)
+    indices = np.empty((threshold, k), dtype=np.intp)
+    indices[0] = 0
+    indices[-1] = n - 1
+    selected = np.zeros(k, dtype=np.intp)
+    for b in range(threshold - 2):
+        start, end = edges[b], edges[b + 1]
+        # Average of the next bucket (just the last point for the last bucket)
+        next_end = edges[b + 2] if b + 2 < len(edges) else n
+        average_x = x[end:next_end].mean()
+        average_y = y[end:next_end].mean(axis=0)
+
+        # Keep the point forming the largest triangle with the previously kept point and that average
+        previous_x, previous_y = x[selected], y[selected, columns]
+        area = np.abs((previous_x - average_x) * (y[start:end] - previous_y)
+                      - (previous_x - x[start:end, None]) * (average_y - previous_y))
+        selected = start + area.argmax(axis=0)
+        indices[b + 1] = selected
+    return indices
+
+
+def _max_points(ax):
+    """One point per pixel of the Axes' width."""
+    return max(int(ax.bbox.width), 3)
+
+
+def draw_lines(ax, x, ys, labels, colors=None, linewidth=None, max_points=None):
+    """Draw each column of ``ys`` against ``x`` as one collection of polylines on ``ax``.
+
+    Non-finite values are left out (the line connects the remaining points) and series longer
+    than ``max_points`` (the Axes' width in pixels by default) are downsampled with LTTB.
+    Returns the legend handles.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    ys = np.asarray(ys, dtype=np.float64)
+    if ys.ndim == 1:
+        ys = ys[:, None]
+    order = np.argsort(x, kind='stable')
+    x, ys = x[order], ys[order]
+    if colors is None:
+        colors = cycle_colors(ys.shape[1])
+    if linewidth is None:
+        linewidth = mpl.rcParams['lines.linewidth']
+    if max_points is None:
+        max_points = _max_points(ax)
+
+    finite = np.isfinite(ys)
+    if finite.all():
+        # The common case: every series downsampled in one pass
+        indices = lttb(x, ys, max_points)
+        segments = [np.column_stack([x[indices[:, j]], ys[indices[:, j], j]]) for j in range(ys.shape[1])]
+    else:
+        segments = []
+        for j in range(ys.shape[1]):
+            keep = finite[:, j]
+            series_x, series_y = x[keep], ys[keep, j]
+            kept = lttb(series_x, series_y[:, None], max_points)[:, 0]
+            segments.append(np.column_stack([series_x[kept], series_y[kept]]))
+
+    # Open, unfilled polygons draw like a LineCollection, but legend(loc='best') avoids them
+    lines = PolyCollection(segments, closed=False, facecolors='none', edgecolors=colors, linewidths=linewidth)
+    ax.add_collection(lines)
+    ax.autoscale_view()
+    return [Line2D([], [], color=color, linewidth=linewidth, label=label) for color, label in zip(colors, labels)]
+
+
+def draw_bars(ax, positions, heights, width, label, color, alpha=1.0):
+    """Draw one bar series as a single PolyCollection on ``ax``; returns its legend handle."""
+    positions = np.asarray(positions, dtype=np.float64)
+    heights = np.asarray(heights, dtype=np.float64)
+    left, right = positions - width / 2, positions + width / 2
+    zeros = np.zeros_like(heights)
+    vertices = np.stack([
+        np.column_stack([left, zeros]), np.column_stack([left, heights]),
+        np.column_stack([right, heights]), np.column_stack([right, zeros]),
+    ], axis=1)
+    bars = PolyCollection(vertices, facecolors=color, edgecolors='none', alpha=alpha)
+    # Like ax.bar: no margin below the baseline
+    bars.sticky_edges.y.append(0)
+    ax.add_collection(bars)
+    ax.update_datalim([(positions.min() - width / 2, 0), (positions.max() + width / 2, np.nanmax(heights, initial=0))])
+    ax.autoscale_view()
+    return Patch(facecolor=color, alpha=alpha, label=label)
@@ -0,0 +1,48 @@
+"""Parsing of the ``year`` and ``education_level`` parameters of the parameterised functions.
+
+``year`` accepts a single year, an inclusive range (``2010-2020``) or a comma-separated list
+of both (``2000,2005,2010-2012``); ``education_level`` accepts one level or a comma-separated
+list. Repeated query parameters arrive joined with commas, and a JSON body may give either
+parameter as a list.
+"""
+MAX_YEARS = 100
+
+
+def _parts(value):
+    if isinstance(value, (list, tuple)):
+        value = ','.join(str(part) for part in value)
+    return [part.strip() for part in str(value).split(',') if part.strip()]
+
+
+def parse_years(value):
+    """Sorted, distinct years named by ``value``.
+
+    Raises ValueError when a part is not a year or range, or when more than MAX_YEARS years
+    are requested.
+    """
+    years = set()
+    for part in _parts(value):
+        first, _, last = part.partition('-')
+        if not first.strip().isdigit() or (last and not last.strip().isdigit()):
+            raise ValueError(f"Invalid year: {part}")
+        first = int(first)
+        last = int(last) if last else first
+        if last < first or len(years) + last - first + 1 > MAX_YEARS:
+            raise ValueError(f"Invalid year range: {part}")
+        years.update(range(first, last + 1))
+    if not years:
+        raise ValueError("No year given")
+    if len(years) > MAX_YEARS:
+        raise ValueError(f"At most {MAX_YEARS} years can be requested at once")
+    return sorted(years)
+
+
+def parse_levels(value, levels):
+    """Distinct education levels named by ``value``, in request order.
+
+    Raises ValueError when ``value`` is empty or names a level that is not in ``levels``.
+    """
+    requested = list(dict.fromkeys(_parts(value) if value is not None else []))
+    if not requested or any(level not in levels for level in requested):
+        raise ValueError(f"Invalid education level: {value}")
+    return requested
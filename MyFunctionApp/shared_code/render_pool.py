@@ -0,0 +1,160 @@
+"""Process pool that draws the independent charts of a request concurrently.
+
+matplotlib holds the GIL while it draws and encodes a figure, so the two to four charts of
+a report drawn in one worker process take the sum of their times. With the pool enabled,
+all but one of a request's charts are sent to the pool's processes while the calling
+process draws the remaining one, so on a multi-core host the request takes about as long
+as its slowest chart.
+
+The pool is started on first use and kept for the life of the worker process. Its
+processes load matplotlib's Agg renderer and fonts when they start, and charts are drawn
+in-process until all of them have started, so no request waits for the pool to warm up. A task is a chart's draw function, sent as its module and name, and its
+data; its result is the encoded PNG or SVG.
+
+Configuration is read from the environment:
+
+* RENDER_POOL_SIZE - number of rendering processes (default: the number of CPUs, up to 4,
+  on hosts with more than one CPU, else 0). 0 draws every chart in-process.
+* RENDER_POOL_TIMEOUT - seconds to wait for a chart from the pool (default 60).
+
+Charts the pool fails to return are drawn in-process instead, so the pool only changes how
+fast charts are drawn. A crashed or stuck pool is replaced, up to MAX_RESTARTS times per
+worker process before the pool is disabled; any other failure disables it at once.
+"""
+import importlib
+import importlib.util
+import logging
+import multiprocessing
+import os
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from .charts import figure_png, new_figure, render_chart
+
+
+MAX_RESTARTS = 3
+
+
+def _default_size():
+    cpus = os.cpu_count() or 1
+    return min(cpus, 4) if cpus > 1 else 0
+
+
+def _warm_up():
+    """Initializer of the pool's processes: draw a small chart to load Agg and the fonts."""
+    fig, ax = new_figure(figsize=(2, 2))
+    ax.plot([0, 1], [0, 1], marker='o', label='warm-up')
+    ax.set_title('warm-up')
+    ax.legend()
+    figure_png(fig)
+
+
+def _draw_function(module_name, module_file, name):
+    """The draw function ``name`` of ``module_name``, imported in this process if need be."""
+    module = sys.modules.get(module_name)
+    if module is None:
+        try:
+            module = importlib.import_module(module_name)
+        except ImportError:
+            # Function modules the host imported under a package of its own (``__app__``)
+            spec = importlib.util.spec_from_file_location(module_name, module_file)
+            module = importlib.util.module_from_spec(spec)
+            sys.modules[module_name] = module
+            spec.loader.exec_module(module)
+    return getattr(module, name)
+
+
+def _render(module_name, module_file, name, data, fmt):
+    """Task run by the pool's processes."""
+    return render_chart(_draw_function(module_name, module_file, name), data, fmt)
+
+
+def _task(chart, fmt):
+    draw = chart.draw
+    return (draw.__module__, getattr(sys.modules.get(draw.__module__), '__file__', None), draw.__name__, chart.data, fmt)
+
+
+class RenderPool:
+    def __init__(self, size=None, timeout=None):
+        if size is None:
+            size = int(os.getenv('RENDER_POOL_SIZE', str(_default_size())))
+        if timeout is None:
+            timeout = float(os.getenv('RENDER_POOL_TIMEOUT', '60'))
+        self.size = size
+        self.timeout = timeout
+        self._executor = None
+        self._starting = []
+        self._restarts = 0
+        self._disabled = size <= 0
+        self._lock = threading.Lock()
+        self._counters = {'pooled': 0, 'in_process': 0, 'fallbacks': 0}
+
+    def render(self, charts, fmt):
+        """Encoded ``fmt`` bytes of each of ``charts`` (see charts.py), in order."""
+        executor = self._get_executor() if len(charts) > 1 else None
+        if executor is None:
+            self._count('in_process', len(charts))
+            return [render_chart(chart.draw, chart.data, fmt) for chart in charts]
+
+        futures = [executor.submit(_render, *_task(chart, fmt)) for chart in charts[1:]]
+
+        # The calling process draws the first chart meanwhile
+        self._count('in_process')
+        rendered = [render_chart(charts[0].draw, charts[0].data, fmt)]
+        for chart, future in zip(charts[1:], futures):
+            try:
+                rendered.append(future.result(timeout=self.timeout))
+                self._count('pooled')
+            except Exception as e:
+                self._failed(executor, e)
+                logging.warning(f"Rendering {chart.chart_id} in-process after the render pool failed: {str(e) or type(e).__name__}")
+                self._count('fallbacks')
+                rendered.append(render_chart(chart.draw, chart.data, fmt))
+        return rendered
+
+    def _get_executor(self):
+        with self._lock:
+            if self._disabled:
+                return None
+            if self._executor is None:
+                # Fresh interpreters rather than forks of a multi-threaded worker process
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.size,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_warm_up,
+                )
+                # Start every process now, rather than one per chart as they are needed
+                self._starting = [self._executor.submit(os.getpid) for _ in range(self.size)]
+                logging.info(f"Starting render pool with {self.size} process(es).")
+            if not all(future.done() for future in self._starting):
+                return None
+            return self._executor
+
+    def _failed(self, executor, error):
+        """Replace a broken or stuck pool, or disable it (see the module docstring)."""
+        with self._lock:
+            if self._executor is not executor:
+                return
+            self._restarts += 1
+            if not isinstance(error, (BrokenProcessPool, TimeoutError)) or self._restarts > MAX_RESTARTS:
+                logging.warning("Disabled the render pool; charts are drawn in-process.")
+                self._disabled = True
+            self._executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def _count(self, counter, amount=1):
+        with self._lock:
+            self._counters[counter] += amount
+
+    def stats(self):
+        """Numbers of charts drawn by the pool, in-process, and in-process after a pool failure."""
+        with self._lock:
+            stats = dict(self._counters)
+        stats['size'] = 0 if self._disabled else self.size
+        return stats
+
+
+# Shared by every function running in this worker process
+render_pool = RenderPool()
@@ -0,0 +1,52 @@
+"""HTML reports of the HTTP functions.
+
+Every report is a Jinja2 template compiled once, when its function module is imported
+(``report_template``), rather than an f-string formatted from scratch on every request.
+Values are HTML-escaped unless they are markup, such as the rows from ``table_rows``.
+
+Data tables are formatted a column at a time rather than a row at a time: text columns are
+escaped and missing values replaced a whole column at once, and the columns are stacked into
+one array. The rows are then produced in chunks of CHUNK_ROWS, each formatted by a single
+printf-style operation (the row format repeated once per row), and the templates write the
+chunks out one after another.
+"""
+import numpy as np
+from jinja2 import Environment, StrictUndefined
+from markupsafe import Markup, escape
+
+# Rows of a table formatted at a time
+CHUNK_ROWS = 1000
+
+_environment = Environment(autoescape=True, undefined=StrictUndefined)
+
+
+def report_template(source):
+    """The compiled Jinja2 template of the report ``source``."""
+    return _environment.from_string(source)
+
+
+def table_rows(columns, formats, na_rep='NaN', chunk_rows=CHUNK_ROWS):
+    """The ``<tr>`` rows of a table of ``columns``, each formatted with its printf-style format.
+
+    Text is HTML-escaped and non-finite numbers are shown as ``na_rep``. Yields the rows as
+    markup, ``chunk_rows`` rows at a time.
+    """
+    columns = [np.asarray(column) for column in columns]
+    formats = list(formats)
+    for j, column in enumerate(columns):
+        if column.dtype.kind in 'OSU':
+            # Text columns (labels) are short; escape them cell by cell
+            columns[j] = np.array([str(escape(formats[j] % cell)) for cell in column.tolist()], dtype=object)
+            formats[j] = '%s'
+        elif column.dtype.kind == 'f' and not np.isfinite(column).all():
+            columns[j] = np.where(np.isfinite(column), np.char.mod(formats[j], column), na_rep)
+            formats[j] = '%s'
+    if any(column.dtype.kind in 'OU' for column in columns):
+        # Keep the numbers as numbers next to the text columns
+        columns = [column.astype(object) for column in columns]
+
+    table = np.column_stack(columns)
+    row_format = '<tr><td>' + '</td><td>'.join(formats) + '</td></tr>'
+    for start in range(0, len(table), chunk_rows):
+        chunk = table[start:start + chunk_rows]
+        yield Markup((row_format * len(chunk)) % tuple(chunk.ravel().tolist()))
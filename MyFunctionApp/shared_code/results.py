@@ -0,0 +1,141 @@
+"""Precomputed function responses stored in the "results" container.
+
+MaterializeResults renders every endpoint (and every parameter combination of the
+parameterised ones) whenever a source blob changes and saves the output here. The HTTP
+functions look up their response with ``load_result`` first and only compute it live when
+nothing has been materialized for the current version of their dataset: a result whose
+``source_etag`` metadata is not the dataset's current ETag (a materialization that failed or
+has not finished since the source changed) is not served.
+
+Rendered chart PNGs are stored here as well, under ``charts/<content hash>.png``, and served
+by ChartImages. A chart blob never changes once written; charts of old source versions are
+left for a lifecycle rule on the ``charts/`` prefix to delete.
+
+A request that runs several functions (BatchAnalyses) reads all the results they will look
+up at once, concurrently, with ``prefetched_results``.
+"""
+import contextvars
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from azure.core.exceptions import HttpResponseError, ResourceExistsError, ResourceNotFoundError
+from azure.storage.blob import ContentSettings
+
+from .dataset_cache import dataset_cache
+from .storage import get_container_client
+
+RESULTS_CONTAINER = os.getenv('RESULTS_CONTAINER', 'results')
+
+# Chart URLs name their content, so the charts can be cached for good
+CHART_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+# Results read at most at once by ``prefetched_results``
+PREFETCH_THREADS = 8
+
+# ``(body, source_etag)`` read ahead by ``prefetched_results``, by blob name (None: not materialized)
+_prefetched = contextvars.ContextVar('prefetched_results', default=None)
+
+
+def result_blob_name(function_name, **params):
+    """``<function>/index.html``, or ``<function>/<key>=<value>/....html`` for parameterised results."""
+    if not params:
+        return f"{function_name}/index.html"
+    parts = [f"{key}={params[key]}" for key in sorted(params)]
+    return f"{function_name}/{'/'.join(parts)}.html"
+
+
+def load_result(function_name, dataset, **params):
+    """Return the materialized response body, or None if there is none to serve.
+
+    ``dataset`` is the source blob the function reads; a result materialized from another
+    version of it is not served.
+    """
+    blob_name = result_blob_name(function_name, **params)
+    prefetched = _prefetched.get()
+    if prefetched is not None and blob_name in prefetched:
+        stored = prefetched[blob_name]
+    else:
+        stored = _read_result(blob_name)
+    if stored is None:
+        return None
+
+    body, source_etag = stored
+    try:
+        current_etag = dataset_cache.current_etag(get_container_client("sources"), dataset)
+    except HttpResponseError as e:
+        logging.warning(f"Could not check {dataset} for materialized result {blob_name}: {str(e)}")
+        return None
+    if source_etag != current_etag:
+        logging.info(f"Materialized result {blob_name} is stale ({dataset} is now {current_etag}).")
+        return None
+    return body
+
+
+def _read_result(blob_name):
+    """``(body, source_etag)`` of a materialized result, or None."""
+    blob_client = get_container_client(RESULTS_CONTAINER).get_blob_client(blob_name)
+    try:
+        downloader = blob_client.download_blob()
+        return downloader.readall().decode('utf-8'), downloader.properties.metadata.get('source_etag')
+    except ResourceNotFoundError:
+        return None
+    except HttpResponseError as e:
+        logging.warning(f"Could not read materialized result {blob_name}: {str(e)}")
+        return None
+
+
+@contextmanager
+def prefetched_results(keys):
+    """Read the results of ``keys``, ``(function_name, params)`` pairs, concurrently up front;
+    ``load_result`` serves them from memory until the block exits."""
+    blob_names = list(dict.fromkeys(result_blob_name(function_name, **params) for function_name, params in keys))
+    stored = {}
+    if blob_names:
+        with ThreadPoolExecutor(max_workers=min(PREFETCH_THREADS, len(blob_names))) as executor:
+            stored = dict(zip(blob_names, executor.map(_read_result, blob_names)))
+    token = _prefetched.set(stored)
+    try:
+        yield
+    finally:
+        _prefetched.reset(token)
+
+
+def save_result(function_name, body, source_etag, **params):
+    blob_client = get_container_client(RESULTS_CONTAINER).get_blob_client(result_blob_name(function_name, **params))
+    blob_client.upload_blob(
+        body.encode('utf-8'),
+        overwrite=True,
+        metadata={'source_etag': source_etag},
+        content_settings=ContentSettings(content_type='text/html')
+    )
+
+
+def chart_blob_name(digest):
+    return f"charts/{digest}.png"
+
+
+def save_chart(digest, png):
+    """Store a rendered chart under its content hash (a no-op when it is already stored)."""
+    blob_client = get_container_client(RESULTS_CONTAINER).get_blob_client(chart_blob_name(digest))
+    try:
+        blob_client.upload_blob(
+            png,
+            overwrite=False,
+            content_settings=ContentSettings(content_type='image/png', cache_control=CHART_CACHE_CONTROL)
+        )
+    except ResourceExistsError:
+        pass
+
+
+def load_chart(digest):
+    """PNG bytes of the chart stored under ``digest``, or None."""
+    blob_client = get_container_client(RESULTS_CONTAINER).get_blob_client(chart_blob_name(digest))
+    try:
+        return blob_client.download_blob().readall()
+    except ResourceNotFoundError:
+        return None
+    except HttpResponseError as e:
+        logging.warning(f"Could not read chart {digest}: {str(e)}")
+        return None
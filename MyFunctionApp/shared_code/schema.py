@@ -0,0 +1,89 @@
+"""Column layout of the source datasets.
+
+Each dataset is described as named column groups (brackets, demographics, education levels,
+...) so functions can ask for exactly the groups they use instead of repeating column lists.
+Columns are parsed with compact dtypes: ``year`` as int16 and every measure as float32.
+"""
+import threading
+
+import numpy as np
+
+BRACKETS = ['0-75%', '75-100%', '100-125%', '125-200%', '200-300%', '300%+']
+GENDERS = ['men', 'women']
+RACES = ['white', 'black', 'hispanic']
+DEMOGRAPHIC_GROUPS = GENDERS + RACES
+EDUCATION_LEVELS = ['less_than_hs', 'high_school', 'some_college', 'bachelors_degree', 'advanced_degree']
+
+YEAR_DTYPE = np.int16
+MEASURE_DTYPE = np.float32
+
+
+class DatasetSchema:
+    def __init__(self, blob_name, groups):
+        self.blob_name = blob_name
+        self.groups = groups
+        self._validated = set()
+        self._lock = threading.Lock()
+
+    def columns(self, *group_names):
+        """Columns of the given groups, in order and without duplicates."""
+        columns = []
+        for group_name in group_names:
+            for column in self.groups[group_name]:
+                if column not in columns:
+                    columns.append(column)
+        return columns
+
+    def all_columns(self):
+        return self.columns(*self.groups)
+
+    def dtypes(self, columns=None):
+        """Compact dtype for each of ``columns`` (all schema columns by default)."""
+        if columns is None:
+            columns = self.all_columns()
+        return {column: YEAR_DTYPE if column == 'year' else MEASURE_DTYPE for column in columns}
+
+    def validate(self, frame, version, columns=None):
+        """Check a loaded frame against the schema, once per dataset version and projection.
+
+        Raises ValueError when a requested column is missing or a schema column is not numeric.
+        """
+        columns = list(frame.columns) if columns is None else list(columns)
+        key = (version, tuple(columns))
+        if key in self._validated:
+            return
+
+        missing = [column for column in columns if column not in frame.columns]
+        if missing:
+            raise ValueError(f"Missing required columns in {self.blob_name}: {missing}")
+        known = self.all_columns()
+        non_numeric = [column for column in frame.columns
+                       if column in known and not np.issubdtype(frame[column].dtype, np.number)]
+        if non_numeric:
+            raise ValueError(f"Non-numeric columns in {self.blob_name}: {non_numeric}")
+
+        with self._lock:
+            self._validated.add(key)
+
+
+POVERTY_WAGES = DatasetSchema('poverty_level_wages.csv', {
+    'year': ['year'],
+    'annual_wage': ['annual_poverty-level_wage'],
+    'brackets': [f'{bracket}_of_poverty_wages' for bracket in BRACKETS],
+    'gender_brackets': [f'{gender}_{bracket}_of_poverty_wages' for gender in GENDERS for bracket in BRACKETS],
+    'gender_shares': [f'{gender}_share_below_poverty_wages' for gender in GENDERS],
+    'race_shares': [f'{race}_share_below_poverty_wages' for race in RACES],
+})
+
+WAGES_BY_EDUCATION = DatasetSchema('wages_by_education.csv', {
+    'year': ['year'],
+    'gender_education': [f'{gender}_{level}' for gender in GENDERS for level in EDUCATION_LEVELS],
+    'race_education': [f'{race}_{level}' for race in RACES for level in EDUCATION_LEVELS],
+})
+
+SCHEMAS = {schema.blob_name: schema for schema in [POVERTY_WAGES, WAGES_BY_EDUCATION]}
+
+
+def schema_for(blob_name):
+    """Schema registered for ``blob_name``, or None for blobs without one."""
+    return SCHEMAS.get(blob_name)
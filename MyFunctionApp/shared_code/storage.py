@@ -0,0 +1,105 @@
+"""Blob Storage access shared by every function in the app.
+
+A single BlobServiceClient is built per worker process and reused by all invocations, so
+its HTTP connection pool (and TLS sessions) and its credential, including any azure-identity
+access token, survive across requests.
+
+Configuration is read from the environment:
+
+* AZURE_STORAGE_CONNECTION_STRING - used as-is when set (e.g. ``UseDevelopmentStorage=true``
+  for Azurite).
+* AZURE_STORAGE_ACCOUNT_NAME / AZURE_STORAGE_ACCOUNT_KEY - account key authentication. When
+  only the account name is set, DefaultAzureCredential (managed identity, CLI, ...) is used.
+* LOCAL_BLOB_ROOT - serve containers from sub-directories of this path instead of Azure
+  (see local_blob.py).
+* BLOB_POOL_MAXSIZE, BLOB_CONNECTION_TIMEOUT, BLOB_READ_TIMEOUT - transport tuning.
+"""
+import logging
+import os
+import threading
+
+import requests
+from azure.core.pipeline.transport import RequestsTransport
+from azure.storage.blob import BlobServiceClient
+
+from .local_blob import LocalContainerClient
+
+_lock = threading.Lock()
+_service_client = None
+_credential = None
+_container_clients = {}
+
+
+def _build_transport():
+    pool_maxsize = int(os.getenv('BLOB_POOL_MAXSIZE', '20'))
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=pool_maxsize)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return RequestsTransport(
+        session=session,
+        session_owner=False,
+        connection_timeout=float(os.getenv('BLOB_CONNECTION_TIMEOUT', '10')),
+        read_timeout=float(os.getenv('BLOB_READ_TIMEOUT', '60')),
+    )
+
+
+def get_credential():
+    """Credential for the storage account, created once per process.
+
+    Token credentials cache their access token internally, so keeping one instance alive
+    means a token is only requested again when it is about to expire.
+    """
+    global _credential
+    with _lock:
+        if _credential is None:
+            storage_account_key = os.getenv('AZURE_STORAGE_ACCOUNT_KEY')
+            if storage_account_key:
+                _credential = storage_account_key
+            else:
+                from azure.identity import DefaultAzureCredential
+                _credential = DefaultAzureCredential()
+        return _credential
+
+
+def get_blob_service_client():
+    """Process-wide BlobServiceClient with a pooled, keep-alive transport."""
+    global _service_client
+    if _service_client is not None:
+        return _service_client
+
+    connection_string = os.getenv('AZURE_STORAGE_CONNECTION_STRING')
+    storage_account_name = os.getenv('AZURE_STORAGE_ACCOUNT_NAME')
+    if not connection_string and not storage_account_name:
+        raise ValueError("Storage account credentials not found in environment variables.")
+
+    credential = None if connection_string else get_credential()
+    with _lock:
+        if _service_client is None:
+            if connection_string:
+                client = BlobServiceClient.from_connection_string(connection_string, transport=_build_transport())
+            else:
+                client = BlobServiceClient(
+                    account_url=f"https://{storage_account_name}.blob.core.windows.net",
+                    credential=credential,
+                    transport=_build_transport()
+                )
+            logging.info(f"Created shared BlobServiceClient for {client.account_name}.")
+            _service_client = client
+        return _service_client
+
+
+def get_container_client(container_name):
+    """Container client backed by the shared service client (or by LOCAL_BLOB_ROOT)."""
+    client = _container_clients.get(container_name)
+    if client is not None:
+        return client
+
+    local_root = os.getenv('LOCAL_BLOB_ROOT')
+    if local_root:
+        client = LocalContainerClient(local_root, container_name)
+    else:
+        client = get_blob_service_client().get_container_client(container_name)
+
+    with _lock:
+        return _container_clients.setdefault(container_name, client)
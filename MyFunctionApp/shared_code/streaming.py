@@ -0,0 +1,91 @@
+"""Bounded-memory ingestion of large CSV blobs.
+
+The blob is downloaded chunk by chunk and fed to ``pd.read_csv(chunksize=...)``. Only running
+aggregates are kept between chunks (per-group totals, or column sums and counts when there
+are no groups), so peak memory depends on the chunk size and the number of groups rather
+than on the file size.
+
+The number of rows parsed per chunk is read from DATASET_STREAMING_CHUNK_ROWS (default 100000).
+"""
+import io
+import os
+
+import pandas as pd
+
+
+class BlobChunkReader(io.RawIOBase):
+    """Read-only file object over the chunks of a blob download."""
+
+    def __init__(self, downloader):
+        self._chunks = downloader.chunks()
+        self._buffer = memoryview(b'')
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while not self._buffer:
+            try:
+                self._buffer = memoryview(next(self._chunks))
+            except StopIteration:
+                return 0
+        n = min(len(b), len(self._buffer))
+        b[:n] = self._buffer[:n]
+        self._buffer = self._buffer[n:]
+        return n
+
+
+class StreamingAggregate:
+    """Running per-group totals over a sequence of chunks, or column sums and non-null counts
+    when ``group_by`` is not given."""
+
+    def __init__(self, group_by=None):
+        self.group_by = group_by
+        self.rows = 0
+        self.sums = None
+        self.counts = None
+        self.group_totals = None
+
+    def update(self, chunk):
+        values = chunk.drop(columns=[self.group_by]) if self.group_by else chunk
+        # Accumulate in float64 even when the columns are parsed as float32
+        values = values.select_dtypes('number').astype('float64')
+        self.rows += len(chunk)
+
+        if self.group_by:
+            totals = values.groupby(chunk[self.group_by], sort=False).sum()
+            if self.group_totals is not None:
+                # Groups may span chunks, so fold the new partial totals into the running ones
+                totals = pd.concat([self.group_totals, totals]).groupby(level=0, sort=False).sum()
+            self.group_totals = totals
+        elif self.sums is None:
+            self.sums, self.counts = values.sum(), values.count()
+        else:
+            self.sums = self.sums.add(values.sum(), fill_value=0)
+            self.counts = self.counts.add(values.count(), fill_value=0)
+
+    def means(self):
+        return self.sums / self.counts
+
+
+def iter_csv_chunks(blob_client, columns=None, chunk_rows=None, dtype=None):
+    """Yield ``(chunk, etag)`` pairs for the CSV in ``blob_client`` without holding the whole file."""
+    if chunk_rows is None:
+        chunk_rows = int(os.getenv('DATASET_STREAMING_CHUNK_ROWS', '100000'))
+
+    downloader = blob_client.download_blob()
+    etag = downloader.properties.etag
+    stream = io.BufferedReader(BlobChunkReader(downloader))
+    usecols = list(columns) if columns is not None else None
+    with pd.read_csv(stream, usecols=usecols, dtype=dtype, chunksize=chunk_rows) as reader:
+        for chunk in reader:
+            yield chunk, etag
+
+
+def aggregate_blob(blob_client, columns=None, group_by=None, chunk_rows=None, dtype=None):
+    """Stream the CSV in ``blob_client`` into a StreamingAggregate; returns ``(aggregate, etag)``."""
+    aggregate = StreamingAggregate(group_by)
+    etag = None
+    for chunk, etag in iter_csv_chunks(blob_client, columns, chunk_rows, dtype):
+        aggregate.update(chunk)
+    return aggregate, etag
@@ -0,0 +1,177 @@
+"""Closed-form least-squares trend lines and forecasts from running moments.
+
+A straight-line fit of y on x only needs the count and the sums of x, y, x*x, x*y and y*y
+of the data, so ``RegressionMoments`` keeps just those, for any number of series sharing the
+same x (one column of ``y`` per series), and can be extended with appended observations
+without revisiting the earlier ones. Missing values (NaN) are skipped per series. x is
+shifted by the first x seen to keep the sums small, and the closed-form solution well
+conditioned, for calendar years.
+
+Forecasts come with prediction intervals from the Student t distribution of the residuals,
+computed with the standard library (no SciPy or scikit-learn needed).
+"""
+import math
+from statistics import NormalDist
+
+import numpy as np
+
+
+def t_cdf(t, df):
+    """Student's t distribution function at ``t`` for whole ``df`` >= 1.
+
+    Closed form for integer degrees of freedom (Abramowitz & Stegun 26.7.3-4), a finite
+    series in cos(theta) with tan(theta) = t / sqrt(df).
+    """
+    df = np.asarray(df, dtype=np.int64)
+    theta = np.arctan(t / np.sqrt(df))
+    cos2 = np.cos(theta) ** 2
+    odd = df % 2 == 1
+    term = np.where(odd, np.sin(theta) * np.cos(theta), np.sin(theta))
+    last = (df - 2 - odd) // 2
+    series = np.where(last >= 0, term, 0.0)
+    for k in range(1, int(np.max(last, initial=0)) + 1):
+        term = term * np.where(odd, 2 * k / (2 * k + 1), (2 * k - 1) / (2 * k)) * cos2
+        series = series + np.where(k <= last, term, 0.0)
+    return 0.5 + np.where(odd, (theta + series) / np.pi, series / 2)
+
+
+def t_pdf(t, df):
+    """Student's t density at ``t`` with ``df`` degrees of freedom."""
+    df = np.asarray(df, dtype=np.float64)
+    log_norm = np.vectorize(math.lgamma)((df + 1) / 2) - np.vectorize(math.lgamma)(df / 2)
+    return np.exp(log_norm) / np.sqrt(df * np.pi) * (1 + t * t / df) ** (-(df + 1) / 2)
+
+
+def t_quantile(p, df):
+    """Quantile ``p`` of Student's t distribution with whole ``df`` >= 1 degrees of freedom.
+
+    Exact closed forms for 1 and 2 degrees of freedom. From 3 on, a Cornish-Fisher expansion
+    around the normal quantile (within 1% at 3 degrees of freedom) polished by Newton steps
+    on ``t_cdf``.
+    """
+    z = NormalDist().inv_cdf(p)
+    df = np.asarray(df, dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        q = np.select([df == 1, df == 2],
+                      [np.tan(np.pi * (p - 0.5)), (2 * p - 1) / np.sqrt(2 * p * (1 - p))],
+                      z
+                      + (z ** 3 + z) / (4 * df)
+                      + (5 * z ** 5 + 16 * z ** 3 + 3 * z) / (96 * df ** 2)
+                      + (3 * z ** 7 + 19 * z ** 5 + 17 * z ** 3 - 15 * z) / (384 * df ** 3)
+                      + (79 * z ** 9 + 776 * z ** 7 + 1482 * z ** 5 - 1920 * z ** 3 - 945 * z) / (92160 * df ** 4))
+    for _ in range(3):
+        q = np.where(df >= 3, q - (t_cdf(q, df) - p) / t_pdf(q, df), q)
+    return q
+
+
+class RegressionMoments:
+    def __init__(self, origin, columns=None, rows=0, n=0, sx=0.0, sy=0.0, sxx=0.0, sxy=0.0, syy=0.0):
+        self.origin = origin
+        self.columns = columns
+        self.rows = rows
+        self.n = n
+        self.sx = sx
+        self.sy = sy
+        self.sxx = sxx
+        self.sxy = sxy
+        self.syy = syy
+
+    @classmethod
+    def of(cls, x, y, columns=None):
+        """Moments of ``y`` (one series, or one column per series) against ``x``."""
+        x = np.asarray(x, dtype=np.float64)
+        return cls(float(x[0]) if len(x) else 0.0, list(columns) if columns is not None else None).extended(x, y)
+
+    def extended(self, x, y):
+        """Moments of the current observations plus ``(x, y)``; ``self`` is left unchanged."""
+        x = np.asarray(x, dtype=np.float64) - self.origin
+        y = np.asarray(y, dtype=np.float64)
+        if y.ndim == 2:
+            x = x[:, None]
+        observed = ~np.isnan(y)
+        x_observed = np.where(observed, x, 0.0)
+        y = np.where(observed, y, 0.0)
+        return RegressionMoments(
+            self.origin,
+            self.columns,
+            self.rows + len(y),
+            self.n + observed.sum(axis=0),
+            self.sx + x_observed.sum(axis=0),
+            self.sy + y.sum(axis=0),
+            self.sxx + (x_observed * x_observed).sum(axis=0),
+            self.sxy + (x_observed * y).sum(axis=0),
+            self.syy + (y * y).sum(axis=0),
+        )
+
+    def _centered(self):
+        """Centered sums of squares Sxx, Sxy and Syy."""
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return (self.sxx - self.sx * self.sx / self.n,
+                    self.sxy - self.sx * self.sy / self.n,
+                    self.syy - self.sy * self.sy / self.n)
+
+    def fit(self):
+        """``(slope, intercept)`` of the least-squares line of each series, intercept at x = 0.
+
+        Series whose x values do not vary (fewer than two distinct points) get NaN.
+        """
+        sxx, sxy, _ = self._centered()
+        with np.errstate(divide='ignore', invalid='ignore'):
+            slope = np.where(sxx > 0, sxy / sxx, np.nan)
+            intercept = (self.sy - slope * self.sx) / self.n - slope * self.origin
+        return slope, intercept
+
+    def residual_std(self):
+        """Standard deviation of the residuals around each line (n - 2 degrees of freedom)."""
+        sxx, sxy, syy = self._centered()
+        with np.errstate(divide='ignore', invalid='ignore'):
+            residual_ss = np.maximum(syy - np.where(sxx > 0, sxy * sxy / sxx, np.nan), 0.0)
+            return np.where(self.n > 2, np.sqrt(residual_ss / (self.n - 2)), np.nan)
+
+    def predict(self, x):
+        """Value of each line at ``x``; shape ``(len(x),)`` or ``(len(x), series)``."""
+        slope, intercept = self.fit()
+        x = np.asarray(x, dtype=np.float64)
+        if np.ndim(slope):
+            x = x[:, None]
+        return intercept + slope * x
+
+    def forecast(self, x, level=0.95):
+        """``(prediction, lower, upper)`` at ``x``, with ``level`` prediction intervals."""
+        prediction = self.predict(x)
+        sxx, _, _ = self._centered()
+        x = np.asarray(x, dtype=np.float64)
+        if np.ndim(sxx):
+            x = x[:, None]
+        mean_x = self.sx / self.n + self.origin
+        with np.errstate(divide='ignore', invalid='ignore'):
+            spread = self.residual_std() * np.sqrt(1 + 1 / self.n + (x - mean_x) ** 2 / sxx)
+            margin = t_quantile(0.5 + level / 2, np.maximum(self.n - 2, 1)) * spread
+        return prediction, prediction - margin, prediction + margin
+
+    def summary(self, x=(), level=0.95):
+        """JSON-ready description of each series' trend, with a forecast at ``x``."""
+        slope, intercept = (np.atleast_1d(value) for value in self.fit())
+        residual_std = np.atleast_1d(self.residual_std())
+        n = np.atleast_1d(self.n)
+        x = np.asarray(x, dtype=np.float64)
+        prediction, lower, upper = (np.asarray(value).reshape(len(x), len(slope)) for value in self.forecast(x, level))
+        columns = self.columns if self.columns is not None else list(range(len(slope)))
+
+        def number(value):
+            return None if np.isnan(value) else float(value)
+
+        return {
+            column: {
+                'slope': number(slope[i]),
+                'intercept': number(intercept[i]),
+                'residual_std': number(residual_std[i]),
+                'observations': int(n[i]),
+                'forecast': [
+                    {'year': int(x[j]), 'prediction': number(prediction[j, i]),
+                     'lower': number(lower[j, i]), 'upper': number(upper[j, i])}
+                    for j in range(len(x))
+                ],
+            }
+            for i, column in enumerate(columns)
+        }
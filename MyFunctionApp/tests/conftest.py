@@ -0,0 +1,43 @@
+"""Shared fixtures: the source datasets as synthetic CSVs in a local_blob.py container.
+
+Run from MyFunctionApp with ``python -m pytest tests``.
+"""
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from shared_code import storage  # noqa: E402
+
+
+def csv_rows(schema, years, seed=0):
+    """CSV lines (without header) of ``schema`` with one row per year of random measures."""
+    rng = np.random.default_rng(seed)
+    columns = schema.all_columns()
+    lines = []
+    for year in years:
+        values = [str(year)] + [f'{value:.3f}' for value in rng.uniform(0.1, 100, len(columns) - 1)]
+        lines.append(','.join(values) + '\n')
+    return ''.join(lines)
+
+
+def write_csv(container_client, schema, years, seed=0, append=False):
+    """Write (or append) rows for ``years`` to the blob of ``schema``; returns its path."""
+    path = os.path.join(container_client._directory, schema.blob_name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'a' if append else 'w') as csv_file:
+        if not append:
+            csv_file.write(','.join(schema.all_columns()) + '\n')
+        csv_file.write(csv_rows(schema, years, seed))
+    return path
+
+
+@pytest.fixture
+def sources(tmp_path, monkeypatch):
+    """An empty "sources" container; every container is served from ``tmp_path`` (local_blob.py)."""
+    monkeypatch.setenv('LOCAL_BLOB_ROOT', str(tmp_path))
+    monkeypatch.setattr(storage, '_container_clients', {})
+    return storage.get_container_client('sources')
@@ -0,0 +1,54 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from shared_code.analytics import METRICS, AnalyticsEngine
+from shared_code.dataset_cache import DatasetCache
+from shared_code.schema import POVERTY_WAGES, WAGES_BY_EDUCATION
+
+from conftest import write_csv
+
+
+def assert_same(value, expected, name):
+    """``value`` equals ``expected`` up to float32 rounding, whatever kind of result they are."""
+    if isinstance(expected, pd.DataFrame):
+        pd.testing.assert_frame_equal(value.reset_index(drop=True), expected.reset_index(drop=True),
+                                      check_dtype=False, rtol=1e-4, obj=name)
+    elif isinstance(expected, pd.Series):
+        pd.testing.assert_series_equal(value.reset_index(drop=True), expected.reset_index(drop=True),
+                                       check_dtype=False, rtol=1e-4, obj=name)
+    elif isinstance(expected, (np.ndarray, float, int, np.generic)):
+        np.testing.assert_allclose(value, expected, rtol=1e-4, err_msg=name)
+    elif isinstance(expected, dict):
+        assert value.keys() == expected.keys(), name
+        for key in expected:
+            assert_same(value[key], expected[key], f'{name}[{key}]')
+    elif isinstance(expected, (list, tuple)):
+        assert len(value) == len(expected), name
+        for i, (item, expected_item) in enumerate(zip(value, expected)):
+            assert_same(item, expected_item, f'{name}[{i}]')
+    elif hasattr(expected, '__dict__'):
+        assert_same(vars(value), vars(expected), name)
+    else:
+        assert value == expected, name
+
+
+@pytest.mark.parametrize('schema', [POVERTY_WAGES, WAGES_BY_EDUCATION])
+def test_appended_rows_extend_metrics_like_a_fresh_computation(sources, schema):
+    names = [name for name, registered in METRICS.items() if registered.dataset == schema.blob_name]
+    cache = DatasetCache(revalidate_seconds=0, incremental=True)
+    engine = AnalyticsEngine(cache)
+    write_csv(sources, schema, range(1980, 2010))
+    engine.compute(sources, names)
+
+    write_csv(sources, schema, range(2010, 2015), seed=1, append=True)
+    extended, etag = engine.compute(sources, names)
+
+    # The new version was read as an append and some metrics were extended, not recomputed
+    assert cache.stats()['appended_loads'] > 0
+    assert engine.stats()['extended'] > 0
+
+    fresh, fresh_etag = AnalyticsEngine(DatasetCache(incremental=False)).compute(sources, names)
+    assert fresh_etag == etag
+    for name in names:
+        assert_same(extended[name], fresh[name], name)
@@ -0,0 +1,70 @@
+import importlib
+import json
+
+import azure.functions as func
+import pytest
+
+import BatchAnalyses
+from shared_code.analytics import METRICS, analytics
+from shared_code.dataset_cache import dataset_cache
+from shared_code.results import save_result
+from shared_code.schema import POVERTY_WAGES, WAGES_BY_EDUCATION
+
+from conftest import write_csv
+
+
+@pytest.fixture
+def computed(sources, monkeypatch):
+    """Datasets the metrics were computed for, in order, over freshly written sources."""
+    dataset_cache.invalidate()
+    for schema in (POVERTY_WAGES, WAGES_BY_EDUCATION):
+        write_csv(sources, schema, range(2000, 2010))
+    datasets = []
+    compute = analytics.compute
+
+    def recording_compute(container_client, metrics, *args, **kwargs):
+        results, etag = compute(container_client, metrics, *args, **kwargs)
+        datasets.extend(sorted({METRICS[name].dataset for name in metrics}))
+        return results, etag
+
+    monkeypatch.setattr(analytics, 'compute', recording_compute)
+    yield datasets
+    dataset_cache.invalidate()
+
+
+def materialize(sources, function_name):
+    dataset = importlib.import_module(function_name).DATASET
+    etag = sources.get_blob_client(dataset).get_blob_properties().etag
+    save_result(function_name, f'<html><body><p>{function_name} materialized</p></body></html>', etag)
+
+
+def batch(*names):
+    body = json.dumps({'analyses': list(names)}).encode()
+    return BatchAnalyses.main(func.HttpRequest(method='POST', url='/api/BatchAnalyses', params={'format': 'html'},
+                                               headers={'Content-Type': 'application/json'}, body=body))
+
+
+def test_materialized_batch_computes_nothing(sources, computed):
+    materialize(sources, 'DisparitiesMvsW')
+    materialize(sources, 'WageInequality')
+    response = batch('DisparitiesMvsW', 'WageInequality')
+    assert response.status_code == 200
+    assert b'DisparitiesMvsW materialized' in response.get_body()
+    assert b'WageInequality materialized' in response.get_body()
+    assert computed == []
+
+
+def test_only_datasets_of_live_analyses_are_computed(sources, computed):
+    materialize(sources, 'DisparitiesMvsW')
+    response = batch('DisparitiesMvsW', 'WageInequality')
+    assert response.status_code == 200
+    assert b'DisparitiesMvsW materialized' in response.get_body()
+    assert set(computed) == {WAGES_BY_EDUCATION.blob_name}
+
+    # A report of an older version of its dataset is computed live too
+    computed.clear()
+    write_csv(sources, POVERTY_WAGES, range(2000, 2011), seed=1)
+    dataset_cache.expire(sources, POVERTY_WAGES.blob_name)
+    response = batch('DisparitiesMvsW')
+    assert b'DisparitiesMvsW materialized' not in response.get_body()
+    assert set(computed) == {POVERTY_WAGES.blob_name}
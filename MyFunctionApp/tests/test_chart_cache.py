@@ -0,0 +1,74 @@
+import hashlib
+
+import pytest
+
+from shared_code.chart_cache import ChartCache
+from shared_code.charts import Chart
+from shared_code.render_pool import render_pool
+from shared_code.results import RESULTS_CONTAINER
+from shared_code.storage import get_container_client
+
+
+@pytest.fixture
+def drawn(monkeypatch):
+    """Ids of the charts drawn; a chart "draws" to its data, which is bytes."""
+    drawn = []
+
+    def render(charts, fmt):
+        drawn.extend(chart.chart_id for chart in charts)
+        return [chart.data for chart in charts]
+
+    monkeypatch.setattr(render_pool, 'render', render)
+    return drawn
+
+
+def chart(chart_id, size=100):
+    return Chart(chart_id, draw=None, data=bytes([len(chart_id)]) * size)
+
+
+def test_least_recently_used_charts_are_evicted_past_the_cap(drawn):
+    cache = ChartCache(max_bytes=250, spill_dir='')
+    for chart_id in ('a', 'bb', 'ccc'):
+        cache.png('Fn', chart(chart_id), '"v1"')
+    stats = cache.stats()
+    assert (stats['entries'], stats['bytes'], stats['evictions']) == (2, 200, 1)
+
+    # 'bb' and 'ccc' are still cached; 'a' is drawn again
+    cache.png('Fn', chart('bb'), '"v1"')
+    cache.png('Fn', chart('a'), '"v1"')
+    assert drawn == ['a', 'bb', 'ccc', 'a']
+    # Too large to cache at all
+    cache.png('Fn', chart('big', size=300), '"v1"')
+    assert cache.stats()['bytes'] <= 250
+
+
+def test_evicted_chart_is_reloaded_from_the_spill_directory(drawn, tmp_path):
+    cache = ChartCache(max_bytes=250, spill_dir=str(tmp_path / 'spill'))
+    first = cache.png('Fn', chart('a'), '"v1"')
+    cache.png('Fn', chart('bb'), '"v1"')
+    cache.png('Fn', chart('ccc'), '"v1"')
+    assert cache.stats()['spills'] == 1
+
+    assert cache.png('Fn', chart('a'), '"v1"') == first
+    assert drawn == ['a', 'bb', 'ccc']
+    assert cache.stats()['spill_hits'] == 1
+
+    # Another worker on the instance reads it from the shared directory too
+    other = ChartCache(max_bytes=250, spill_dir=str(tmp_path / 'spill'))
+    assert other.png('Fn', chart('a'), '"v1"') == first
+    assert drawn == ['a', 'bb', 'ccc']
+
+
+def test_chart_urls_name_their_content(sources, drawn):
+    charts = [chart('a'), chart('bb')]
+    urls = ChartCache(url_prefix='charts/').urls('Fn', charts, '"v1"')
+    digest = hashlib.sha256(charts[0].data).hexdigest()[:32]
+    assert urls['a'] == f'charts/{digest}.png'
+
+    # The same charts of the same version get the same URLs in any process
+    assert ChartCache(url_prefix='charts/').urls('Fn', charts, '"v1"') == urls
+    assert urls['bb'] != urls['a']
+
+    # And the PNG is stored under that name for ChartImages to serve
+    stored = get_container_client(RESULTS_CONTAINER).get_blob_client(f'charts/{digest}.png')
+    assert stored.download_blob().readall() == charts[0].data
@@ -0,0 +1,45 @@
+import pytest
+
+from shared_code.columnar import read_mirror, write_mirror
+from shared_code.local_blob import LocalBlobClient
+from shared_code.schema import POVERTY_WAGES
+
+from conftest import write_csv
+
+BLOB = POVERTY_WAGES.blob_name
+COLUMNS = POVERTY_WAGES.columns('year', 'annual_wage')
+
+
+@pytest.fixture
+def downloads(monkeypatch):
+    """Names of the blobs whose content was downloaded."""
+    downloaded = []
+    download_blob = LocalBlobClient.download_blob
+
+    def counting_download_blob(self, *args, **kwargs):
+        downloaded.append(self.blob_name)
+        return download_blob(self, *args, **kwargs)
+
+    monkeypatch.setattr(LocalBlobClient, 'download_blob', counting_download_blob)
+    return downloaded
+
+
+def test_current_mirror_is_read(sources, downloads):
+    write_csv(sources, POVERTY_WAGES, range(2000, 2010))
+    source_etag = write_mirror(sources, BLOB)
+    downloads.clear()
+
+    frame = read_mirror(BLOB, COLUMNS, source_etag)
+    assert list(frame.columns) == COLUMNS
+    assert list(frame['year']) == list(range(2000, 2010))
+    assert downloads == ['poverty_level_wages.parquet']
+
+
+def test_stale_or_missing_mirror_is_not_downloaded(sources, downloads):
+    assert read_mirror(BLOB, COLUMNS, '"any"') is None
+
+    write_csv(sources, POVERTY_WAGES, range(2000, 2010))
+    write_mirror(sources, BLOB)
+    downloads.clear()
+    assert read_mirror(BLOB, COLUMNS, '"another version"') is None
+    assert downloads == []
@@ -0,0 +1,75 @@
+import gzip
+
+import azure.functions as func
+import pytest
+
+from shared_code.compression import Compressor
+
+BODY = ('<html><body>' + '<p>Annual wage by year</p>' * 200 + '</body></html>').encode()
+
+
+def decompress(body, encoding):
+    if encoding == 'br':
+        return pytest.importorskip('brotli').decompress(body)
+    return gzip.decompress(body)
+
+
+def request(accept_encoding=None):
+    headers = {'Accept-Encoding': accept_encoding} if accept_encoding is not None else {}
+    return func.HttpRequest(method='GET', url='/api/Fn', params={}, headers=headers, body=b'')
+
+
+@pytest.fixture
+def compressor():
+    return Compressor(min_bytes=1024, cache_max_bytes=1024 * 1024)
+
+
+@pytest.mark.parametrize('accept_encoding, expected', [
+    ('gzip', 'gzip'),
+    ('br', 'br'),
+    ('gzip, br', 'br'),
+    ('br;q=0.5, gzip', 'gzip'),
+    ('br;q=0, gzip', 'gzip'),
+    ('*', 'br'),
+    ('*, br;q=0', 'gzip'),
+    ('identity', None),
+    ('gzip;q=0', None),
+    ('gzip;q=0, br;q=0', None),
+    ('', None),
+    (None, None),
+])
+def test_encoding_is_negotiated(compressor, accept_encoding, expected):
+    if expected == 'br':
+        pytest.importorskip('brotli')
+    body, headers = compressor.respond(request(accept_encoding), BODY, 'text/html', {'Vary': 'Accept'})
+    assert headers['Vary'] == 'Accept, Accept-Encoding'
+    assert headers.get('Content-Encoding') == expected
+    assert (decompress(body, expected) if expected else body) == BODY
+
+
+def test_gzip_only_without_brotli(compressor, monkeypatch):
+    monkeypatch.setattr(compressor, 'encodings', ['gzip'])
+    body, headers = compressor.respond(request('br, gzip'), BODY, 'text/html')
+    assert headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(body) == BODY
+    assert compressor.respond(request('br'), BODY, 'text/html')[1].get('Content-Encoding') is None
+
+
+def test_small_and_binary_bodies_are_sent_as_they_are(compressor):
+    body, headers = compressor.respond(request('gzip'), b'{"year": []}', 'application/json')
+    assert body == b'{"year": []}'
+    assert 'Content-Encoding' not in headers and headers['Vary'] == 'Accept-Encoding'
+
+    png = b'\x89PNG' + bytes(4096)
+    assert compressor.respond(request('gzip'), png, 'image/png') == (png, {})
+
+
+def test_compressed_bodies_are_cached_per_encoding(compressor):
+    encodings = ['gzip', 'br'] if 'br' in compressor.encodings else ['gzip']
+    for encoding in encodings:
+        first, _ = compressor.respond(request(encoding), BODY, 'text/html')
+        again, _ = compressor.respond(request(encoding), BODY.decode(), 'text/html')
+        assert again is first
+        assert decompress(first, encoding) == BODY
+    stats = compressor.stats()
+    assert (stats['misses'], stats['hits'], stats['entries']) == (len(encodings), len(encodings), len(encodings))
@@ -0,0 +1,104 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from shared_code.dataset_cache import DatasetCache
+from shared_code.schema import MEASURE_DTYPE, POVERTY_WAGES, YEAR_DTYPE
+
+from conftest import write_csv
+
+BLOB = POVERTY_WAGES.blob_name
+
+
+def assert_schema_dtypes(frame):
+    assert frame['year'].dtype == YEAR_DTYPE
+    measures = [column for column in frame.columns if column != 'year']
+    assert all(frame[column].dtype == MEASURE_DTYPE for column in measures)
+
+
+def test_changed_blob_is_reparsed_with_schema_dtypes(sources):
+    cache = DatasetCache(revalidate_seconds=0)
+    write_csv(sources, POVERTY_WAGES, range(2000, 2010))
+    frame, etag = cache.get_with_etag(sources, BLOB)
+    assert_schema_dtypes(frame)
+
+    write_csv(sources, POVERTY_WAGES, range(1990, 2015), seed=1)
+    frame, new_etag = cache.get_with_etag(sources, BLOB)
+    assert new_etag != etag
+    assert list(frame['year']) == list(range(1990, 2015))
+    assert_schema_dtypes(frame)
+
+
+def test_changed_blob_is_validated(sources):
+    cache = DatasetCache(revalidate_seconds=0)
+    write_csv(sources, POVERTY_WAGES, range(2000, 2010))
+    frame, etag = cache.get_with_etag(sources, BLOB)
+
+    # A measure that is not a number
+    path = write_csv(sources, POVERTY_WAGES, range(2000, 2010))
+    with open(path) as csv_file:
+        text = csv_file.read()
+    with open(path, 'w') as csv_file:
+        csv_file.write(text.replace('\n2005,', '\n2005,n/a-', 1))
+    with pytest.raises(ValueError):
+        cache.get_with_etag(sources, BLOB)
+
+    # Nothing malformed was cached: the corrected upload is loaded on the next request
+    write_csv(sources, POVERTY_WAGES, range(2000, 2012))
+    frame, _ = cache.get_with_etag(sources, BLOB)
+    assert len(frame) == 12
+    assert not np.isnan(frame.to_numpy(dtype=float)).any()
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.mark.parametrize('columns', [None, POVERTY_WAGES.columns('year', 'annual_wage')])
+def test_unchanged_blob_is_served_from_the_cache(sources, columns):
+    clock = Clock()
+    cache = DatasetCache(revalidate_seconds=60, clock=clock)
+    write_csv(sources, POVERTY_WAGES, range(2000, 2010))
+    frame, etag = cache.get_with_etag(sources, BLOB, columns=columns)
+
+    # Within the revalidation interval: no request to the blob at all
+    clock.now = 30
+    hit, hit_etag = cache.get_with_etag(sources, BLOB, columns=columns)
+    # After it: a conditional request that finds the same ETag
+    clock.now = 90
+    revalidated, revalidated_etag = cache.get_with_etag(sources, BLOB, columns=columns)
+
+    assert hit_etag == revalidated_etag == etag
+    assert hit.equals(frame) and revalidated.equals(frame)
+    stats = cache.stats()
+    assert (stats['misses'], stats['hits'], stats['revalidations']) == (1, 1, 1)
+
+
+def test_cached_frame_is_not_changed_by_callers(sources):
+    cache = DatasetCache(revalidate_seconds=60)
+    write_csv(sources, POVERTY_WAGES, range(2000, 2010))
+    frame = cache.get(sources, BLOB)
+    frame['derived'] = 1.0
+    assert 'derived' not in cache.get(sources, BLOB).columns
+
+
+def test_streamed_totals_match_a_full_load(sources, monkeypatch):
+    # Two rows per year, in chunks of 7 rows, so that years span chunks
+    write_csv(sources, POVERTY_WAGES, range(1980, 2010))
+    write_csv(sources, POVERTY_WAGES, range(1980, 2010), seed=1, append=True)
+    monkeypatch.setenv('DATASET_STREAMING_CHUNK_ROWS', '7')
+    columns = POVERTY_WAGES.columns('year', 'brackets')
+
+    streaming = DatasetCache(streaming_threshold=1)
+    streamed, etag = streaming.get_with_etag(sources, BLOB, columns=columns, sum_by='year')
+    loaded, loaded_etag = DatasetCache().get_with_etag(sources, BLOB, columns=columns, sum_by='year')
+
+    assert streaming.stats()['streamed_loads'] == 1
+    assert etag == loaded_etag
+    assert len(streamed) == 30
+    pd.testing.assert_frame_equal(streamed.sort_values('year').reset_index(drop=True),
+                                  loaded.sort_values('year').reset_index(drop=True), check_dtype=False, rtol=1e-5)
@@ -0,0 +1,84 @@
+import importlib
+
+import azure.functions as func
+import pytest
+
+from shared_code.queries import MAX_YEARS, parse_levels, parse_years
+from shared_code.schema import EDUCATION_LEVELS
+
+PARAMETERISED_FUNCTIONS = ['EducationImpactForDG', 'WageGapAndTrendOverYears']
+
+
+@pytest.mark.parametrize('value, years', [
+    ('2020', [2020]),
+    (' 2020 ', [2020]),
+    (2020, [2020]),
+    ('2010-2013', [2010, 2011, 2012, 2013]),
+    ('2010 - 2012', [2010, 2011, 2012]),
+    ('2012-2012', [2012]),
+    ('2000,2005,2010-2012', [2000, 2005, 2010, 2011, 2012]),
+    ('2010-2012,2000', [2000, 2010, 2011, 2012]),
+    ('2011,2010-2012,2011', [2010, 2011, 2012]),
+    ('2010,,2011,', [2010, 2011]),
+    (['2000', 2005, '2010-2011'], [2000, 2005, 2010, 2011]),
+    (f'1900-{1900 + MAX_YEARS - 1}', list(range(1900, 1900 + MAX_YEARS))),
+    (f'1900-{1900 + MAX_YEARS - 2},1900,{1900 + MAX_YEARS - 1}', list(range(1900, 1900 + MAX_YEARS))),
+])
+def test_parse_years(value, years):
+    assert parse_years(value) == years
+
+
+@pytest.mark.parametrize('value, message', [
+    ('', "No year given"),
+    (' , ', "No year given"),
+    ([], "No year given"),
+    ('twenty', "Invalid year: twenty"),
+    ('2020.5', "Invalid year: 2020.5"),
+    ('-2020', "Invalid year: -2020"),
+    ('2010-20x', "Invalid year: 2010-20x"),
+    ('2010-2012-2014', "Invalid year: 2010-2012-2014"),
+    ('2020-2010', "Invalid year range: 2020-2010"),
+    (f'1900-{1900 + MAX_YEARS}', f"Invalid year range: 1900-{1900 + MAX_YEARS}"),
+    ('0-999999999', "Invalid year range: 0-999999999"),
+    pytest.param(','.join(str(1900 + i) for i in range(MAX_YEARS + 1)), f"Invalid year range: {1900 + MAX_YEARS}",
+                 id='more than MAX_YEARS listed'),
+])
+def test_parse_years_rejects(value, message):
+    with pytest.raises(ValueError) as error:
+        parse_years(value)
+    assert str(error.value) == message
+
+
+@pytest.mark.parametrize('value, levels', [
+    ('high_school', ['high_school']),
+    ('high_school,advanced_degree', ['high_school', 'advanced_degree']),
+    ('advanced_degree, high_school', ['advanced_degree', 'high_school']),
+    ('high_school,high_school', ['high_school']),
+    (['less_than_hs', 'some_college'], ['less_than_hs', 'some_college']),
+    (','.join(EDUCATION_LEVELS), EDUCATION_LEVELS),
+])
+def test_parse_levels(value, levels):
+    assert parse_levels(value, EDUCATION_LEVELS) == levels
+
+
+@pytest.mark.parametrize('value', [None, '', ' , ', [], 'phd', 'high_school,phd', 'High_School'])
+def test_parse_levels_rejects(value):
+    with pytest.raises(ValueError, match="Invalid education level"):
+        parse_levels(value, EDUCATION_LEVELS)
+
+
+@pytest.mark.parametrize('function_name', PARAMETERISED_FUNCTIONS)
+@pytest.mark.parametrize('params, message', [
+    ({'year': '2020-2010', 'education_level': 'high_school'}, "Invalid year."),
+    ({'year': 'twenty', 'education_level': 'high_school'}, "Invalid year."),
+    ({'year': f'1900-{1900 + MAX_YEARS}', 'education_level': 'high_school'}, "Invalid year."),
+    ({'year': '2020', 'education_level': 'phd'}, "Invalid education level."),
+    ({'year': '2020'}, "Invalid education level."),
+    ({'year': '2020', 'format': 'json'}, "Invalid education level."),
+    ({'format': 'json'}, "Please provide a year."),
+])
+def test_invalid_parameters_are_a_bad_request(function_name, params, message):
+    module = importlib.import_module(function_name)
+    response = module.main(func.HttpRequest(method='GET', url=f'/api/{function_name}', params=params, body=b''))
+    assert response.status_code == 400
+    assert response.get_body().decode('utf-8').startswith(message)
@@ -0,0 +1,58 @@
+"""Repeated rendering leaves no pyplot figures behind and does not grow the process.
+
+A reduced form of benchmarks/render_memory.py: every request draws all of its charts
+in-process (chart cache and render pool off), against synthetic sources.
+"""
+import gc
+import importlib
+import os
+
+import azure.functions as func
+import matplotlib.pyplot as plt
+import pytest
+
+from shared_code.chart_cache import chart_cache
+from shared_code.render_pool import render_pool
+from shared_code.schema import POVERTY_WAGES, WAGES_BY_EDUCATION
+
+from conftest import write_csv
+
+WARMUP = 10
+ITERATIONS = 15
+# Allowed RSS growth over the highest RSS seen during warm-up
+TOLERANCE_MIB = 20
+
+ENDPOINTS = {
+    'DisparitiesMvsW': {},
+    'EducationImpactForDG': {'year': '2020', 'education_level': 'high_school'},
+}
+
+
+def rss_mib():
+    with open('/proc/self/statm') as statm:
+        return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+
+
+@pytest.mark.skipif(not os.path.exists('/proc/self/statm'), reason='needs /proc to read the resident set size')
+@pytest.mark.parametrize('name', list(ENDPOINTS))
+def test_repeated_rendering_does_not_leak(sources, monkeypatch, name):
+    for schema in (POVERTY_WAGES, WAGES_BY_EDUCATION):
+        write_csv(sources, schema, range(1973, 2023))
+    monkeypatch.setattr(chart_cache, 'max_bytes', 0)
+    monkeypatch.setattr(render_pool, '_disabled', True)
+    module = importlib.import_module(name)
+    request = func.HttpRequest(method='GET', url=f'http://localhost/api/{name}', params=ENDPOINTS[name], body=b'')
+
+    baseline = 0.0
+    for _ in range(WARMUP):
+        assert module.main(request).status_code == 200
+        gc.collect()
+        baseline = max(baseline, rss_mib())
+
+    for _ in range(ITERATIONS):
+        response = module.main(request)
+        assert response.status_code == 200, response.get_body()[:200]
+        assert plt.get_fignums() == []
+        # Retained memory, not the garbage awaiting the next collection
+        gc.collect()
+        assert rss_mib() - baseline <= TOLERANCE_MIB
@@ -0,0 +1,61 @@
+import pytest
+
+from shared_code.dataset_cache import dataset_cache
+from shared_code.local_blob import LocalBlobClient
+from shared_code.results import load_result, prefetched_results, save_result
+from shared_code.schema import POVERTY_WAGES, WAGES_BY_EDUCATION
+
+from conftest import write_csv
+
+POVERTY = POVERTY_WAGES.blob_name
+EDUCATION = WAGES_BY_EDUCATION.blob_name
+
+
+@pytest.fixture
+def current(sources):
+    """Current ETag of each source dataset, freshly written, with nothing cached about them."""
+    dataset_cache.invalidate()
+    etags = {}
+    for schema in (POVERTY_WAGES, WAGES_BY_EDUCATION):
+        write_csv(sources, schema, range(2000, 2010))
+        etags[schema.blob_name] = sources.get_blob_client(schema.blob_name).get_blob_properties().etag
+    yield etags
+    dataset_cache.invalidate()
+
+
+def test_prefetched_results_are_read_once(current, monkeypatch):
+    save_result('DisparitiesMvsW', '<html>report</html>', current[POVERTY])
+    save_result('EducationImpactForDG', '<html>2020</html>', current[EDUCATION], year=2020, education_level='high_school')
+    downloaded = []
+    download_blob = LocalBlobClient.download_blob
+
+    def counting_download_blob(self, *args, **kwargs):
+        downloaded.append(self.blob_name)
+        return download_blob(self, *args, **kwargs)
+
+    monkeypatch.setattr(LocalBlobClient, 'download_blob', counting_download_blob)
+    keys = [('DisparitiesMvsW', {}), ('EducationImpactForDG', {'year': 2020, 'education_level': 'high_school'}),
+            ('WageInequality', {}), ('DisparitiesMvsW', {})]
+    with prefetched_results(keys):
+        assert len(downloaded) == 3
+        assert load_result('DisparitiesMvsW', POVERTY) == '<html>report</html>'
+        assert load_result('EducationImpactForDG', EDUCATION, year=2020, education_level='high_school') == '<html>2020</html>'
+        # Not materialized: still not read again
+        assert load_result('WageInequality', POVERTY) is None
+        assert len(downloaded) == 3
+
+    # Read from storage again once the block exits
+    assert load_result('DisparitiesMvsW', POVERTY) == '<html>report</html>'
+    assert len(downloaded) == 4
+
+
+def test_result_of_another_source_version_is_not_served(sources, current):
+    save_result('DisparitiesMvsW', '<html>report</html>', current[POVERTY])
+    assert load_result('DisparitiesMvsW', POVERTY) == '<html>report</html>'
+
+    # The source changed and the result was not materialized again
+    write_csv(sources, POVERTY_WAGES, range(2000, 2011), seed=1)
+    dataset_cache.expire(sources, POVERTY)
+    assert load_result('DisparitiesMvsW', POVERTY) is None
+    with prefetched_results([('DisparitiesMvsW', {})]):
+        assert load_result('DisparitiesMvsW', POVERTY) is None
@@ -0,0 +1,31 @@
+import numpy as np
+import pytest
+
+from shared_code.trend import RegressionMoments, t_quantile
+
+# Two-sided 95% and 99% critical values from a printed t table
+T_TABLE = [
+    (0.975, 1, 12.706), (0.975, 2, 4.303), (0.975, 3, 3.182), (0.975, 4, 2.776),
+    (0.975, 5, 2.571), (0.975, 10, 2.228), (0.975, 30, 2.042), (0.975, 120, 1.980),
+    (0.995, 1, 63.657), (0.995, 2, 9.925), (0.995, 3, 5.841), (0.995, 10, 3.169),
+]
+
+
+@pytest.mark.parametrize('p, df, expected', T_TABLE)
+def test_t_quantile_matches_the_table(p, df, expected):
+    assert float(t_quantile(p, df)) == pytest.approx(expected, abs=1e-3)
+
+
+def test_t_quantile_per_series_degrees_of_freedom():
+    expected = [value for p, _, value in T_TABLE if p == 0.975]
+    degrees = [df for p, df, _ in T_TABLE if p == 0.975]
+    np.testing.assert_allclose(t_quantile(0.975, degrees), expected, atol=1e-3)
+
+
+def test_forecast_interval_with_one_degree_of_freedom():
+    x = np.array([2000.0, 2001.0, 2002.0])
+    moments = RegressionMoments.of(x, np.array([1.0, 3.0, 2.0]))
+    prediction, lower, upper = moments.forecast([2003.0])
+    spread = moments.residual_std() * np.sqrt(1 + 1 / 3 + (2003 - 2001) ** 2 / 2)
+    np.testing.assert_allclose(upper - prediction, 12.706 * spread, rtol=1e-4)
+    np.testing.assert_allclose(prediction - lower, 12.706 * spread, rtol=1e-4)
@@ -0,0 +1,112 @@
+"""Latency of the dashboard's calls to the functions with and without hedged requests.
+
+Starts the function stub (function_stub.py) with a slow tail of --tail-rate calls taking
+--tail-latency seconds, then loads --pages pages of the ten endpoints with my_flask_app's
+client, after --warmup pages that give it the latencies it hedges at. Reports the latency of
+the calls and of the pages (all ten calls), and the calls the stub received per page, with
+hedging off and on, and in batch mode. Hedging at the p95 only cuts the tail of an endpoint
+with less than 5% of slow calls, and it needs enough calls to tell them apart: a page loads
+each endpoint once. The batch mode loads each page with one call to the stub's
+BatchAnalyses, which is never hedged: one call per page, but a slow batch holds up every
+panel of its page.
+
+It then makes one of the functions fail and reports how many calls reached it over the same
+pages, with the circuit breaker off and on (with a --cooldown of one second).
+
+    python benchmarks/dashboard_hedging.py
+    python benchmarks/dashboard_hedging.py --pages 300 --tail-rate 0.01 --tail-latency 2
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+import requests
+
+from function_stub import FUNCTIONS, start_stub
+
+DASHBOARD = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'my_flask_app')
+
+
+def percentiles(values):
+    """p50, p95, p99 and max of ``values`` in milliseconds."""
+    cuts = statistics.quantiles(values, n=100, method='inclusive')
+    return [v * 1000 for v in (cuts[49], cuts[94], cuts[98], max(values))]
+
+
+def load(client, urls, pages):
+    """Call and page latencies in seconds, and the errors, over ``pages`` pages."""
+    calls, page_times, errors = [], [], 0
+    for _ in range(pages):
+        start = time.monotonic()
+        panels = client.fetch_all(urls)
+        page_times.append(time.monotonic() - start)
+        calls += [p['elapsed'] for p in panels if p['elapsed'] is not None]
+        errors += sum(p['error'] is not None for p in panels)
+    return calls, page_times, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--pages', type=int, default=200, help='pages measured per mode')
+    parser.add_argument('--warmup', type=int, default=50,
+                        help='pages loaded before measuring (hedging needs DASHBOARD_HEDGE_MIN_SAMPLES of them)')
+    parser.add_argument('--latency', type=float, default=0.05, help='usual seconds per call')
+    parser.add_argument('--tail-rate', type=float, default=0.02, help='fraction of the calls that are slow')
+    parser.add_argument('--tail-latency', type=float, default=1.0, help='seconds per slow call')
+    parser.add_argument('--cooldown', type=float, default=1.0, help='seconds an open breaker skips the endpoint')
+    args = parser.parse_args()
+
+    sys.path.insert(0, DASHBOARD)
+    import client
+    import health
+
+    stub, base = start_stub(['--latency', str(args.latency), '--tail-rate', str(args.tail_rate),
+                             '--tail-latency', str(args.tail_latency)])
+    try:
+        urls = [f'{base}/api/{name}?' for name in FUNCTIONS]
+        print(f"{args.pages} pages of {len(urls)} calls; {args.tail_rate:.0%} of the calls take {args.tail_latency:g} s")
+        print(f"  {'':8s} {'call p50':>9s} {'p95':>7s} {'p99':>7s} {'max':>7s}   {'page p50':>9s} {'p99':>7s} {'max':>7s}"
+              f"   {'calls/page':>10s} {'errors':>6s}")
+        quantile = health.HEDGE_QUANTILE or 0.95
+        batch_url = f'{base}/api/BatchAnalyses'
+        for mode, hedge_quantile, batch in (('unhedged', 0, ''), ('hedged', quantile, ''), ('batch', quantile, batch_url)):
+            health.HEDGE_QUANTILE = hedge_quantile
+            client.BATCH_URL = batch
+            health.latencies.clear()
+            load(client, urls, args.warmup)
+            requests.get(f'{base}/stats?reset=1')
+            calls, page_times, errors = load(client, urls, args.pages)
+            received = sum(requests.get(f'{base}/stats').json().values())
+            call_p = percentiles(calls)
+            page_p = percentiles(page_times)
+            print(f"  {mode:8s} {call_p[0]:9.0f} {call_p[1]:7.0f} {call_p[2]:7.0f} {call_p[3]:7.0f}"
+                  f"   {page_p[0]:9.0f} {page_p[2]:7.0f} {page_p[3]:7.0f}"
+                  f"   {received / args.pages:10.2f} {errors:6d}", flush=True)
+    finally:
+        client.BATCH_URL = ''
+        stub.kill()
+
+    failing = FUNCTIONS[-1]
+    stub, base = start_stub(['--latency', str(args.latency), '--fail', failing])
+    try:
+        urls = [f'{base}/api/{name}?' for name in FUNCTIONS]
+        print(f"{args.pages} pages with {failing} failing; breaker opens after "
+              f"{health.BREAKER_FAILURES} failures for {args.cooldown:g} s")
+        for mode, failures in (('no breaker', 0), ('breaker', health.BREAKER_FAILURES or 5)):
+            health.breakers.failures = failures
+            health.breakers.cooldown = args.cooldown
+            health.breakers.clear()
+            requests.get(f'{base}/stats?reset=1')
+            start = time.monotonic()
+            load(client, urls, args.pages)
+            elapsed = time.monotonic() - start
+            received = requests.get(f'{base}/stats').json().get(failing, 0)
+            print(f"  {mode:10s} {received:5d} calls to {failing} in {elapsed:.1f} s", flush=True)
+    finally:
+        stub.kill()
+
+
+if __name__ == '__main__':
+    main()
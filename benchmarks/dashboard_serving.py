@@ -0,0 +1,133 @@
+"""Throughput and latency of the dashboard page under gunicorn, per worker model.
+
+Starts the function stub (function_stub.py), each of whose ten endpoints answers after
+--latency seconds, then for each worker class serves my_flask_app with its gunicorn
+configuration (gunicorn.conf.py, --workers workers) and loads ``/`` from --concurrency
+clients at once for --duration seconds, every page calling the ten endpoints (the panel cache
+is off unless --ttl is given). Reports requests/sec, p50 and p99 latency of the full page,
+and failed requests.
+
+    python benchmarks/dashboard_serving.py
+    python benchmarks/dashboard_serving.py --classes gthread gevent --concurrency 1 16 64 --duration 20
+"""
+import argparse
+import os
+import shutil
+import signal
+import socket
+import statistics
+import subprocess
+import tempfile
+import threading
+import time
+from importlib.util import find_spec
+
+import requests
+
+from function_stub import start_stub
+
+DASHBOARD = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'my_flask_app')
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def serve(worker_class, args, stub_url):
+    """Start gunicorn with the dashboard's configuration; returns (process, base URL)."""
+    port = free_port()
+    env = dict(
+        os.environ,
+        GUNICORN_WORKER_CLASS=worker_class,
+        GUNICORN_WORKERS=str(args.workers),
+        PORT=str(port),
+        DASHBOARD_FUNCTION_APP_URL=stub_url,
+        DASHBOARD_TTL=str(args.ttl),
+        DASHBOARD_CACHE_PATH=os.path.join(args.tmp, f'{worker_class}.sqlite3'),
+    )
+    process = subprocess.Popen(
+        [shutil.which('gunicorn') or 'gunicorn', '-c', os.path.join(DASHBOARD, 'gunicorn.conf.py'),
+         '--bind', f'127.0.0.1:{port}', '--access-logfile', os.devnull, '--log-level', 'warning'],
+        env=env,
+    )
+    base = f'http://127.0.0.1:{port}'
+    for _ in range(200):
+        try:
+            requests.get(f'{base}/panels', timeout=30)
+            return process, base
+        except requests.ConnectionError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError(f'gunicorn ({worker_class}) did not start')
+
+
+def load(url, concurrency, duration):
+    """Latencies in seconds of the pages loaded, and the failures, by ``concurrency`` clients."""
+    latencies, failures = [], []
+    end = time.monotonic() + duration
+
+    def client():
+        session = requests.Session()
+        while time.monotonic() < end:
+            start = time.monotonic()
+            try:
+                response = session.get(url, timeout=60)
+                ok = response.status_code == 200 and response.text.rstrip().endswith('</html>')
+            except requests.RequestException:
+                ok = False
+            (latencies if ok else failures).append(time.monotonic() - start)
+
+    clients = [threading.Thread(target=client) for _ in range(concurrency)]
+    for thread in clients:
+        thread.start()
+    for thread in clients:
+        thread.join()
+    return latencies, failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--classes', nargs='+', default=['sync', 'gthread', 'gevent'], help='worker classes compared')
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn worker processes')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 16, 64], help='clients loading pages at once')
+    parser.add_argument('--duration', type=float, default=10, help='seconds of load per measurement')
+    parser.add_argument('--latency', type=float, default=0.1, help='seconds per call to a function endpoint')
+    parser.add_argument('--ttl', type=float, default=0, help='DASHBOARD_TTL of the panel cache (0: every page calls the endpoints)')
+    args = parser.parse_args()
+
+    if 'gevent' in args.classes and find_spec('gevent') is None:
+        print('gevent is not installed; skipping the gevent workers')
+        args.classes.remove('gevent')
+
+    stub, stub_url = start_stub(['--latency', str(args.latency)])
+    # The panel caches of the servers
+    args.tmp = tempfile.mkdtemp(prefix='dashboard_serving_')
+    try:
+        print(f"{args.workers} workers; every endpoint answers in {args.latency:g} s; {args.duration:g} s per measurement")
+        print(f"  {'workers':8s} {'clients':>7s} {'req/s':>8s} {'p50 ms':>8s} {'p99 ms':>8s} {'failed':>6s}")
+        for worker_class in args.classes:
+            server, base = serve(worker_class, args, stub_url)
+            try:
+                # Warm the connection pools and thread pools of every worker
+                load(f'{base}/', args.workers * 2, 1)
+                for concurrency in args.concurrency:
+                    latencies, failures = load(f'{base}/', concurrency, args.duration)
+                    if len(latencies) > 1:
+                        cuts = statistics.quantiles(latencies, n=100, method='inclusive')
+                        p50, p99 = cuts[49] * 1000, cuts[98] * 1000
+                    else:
+                        p50 = p99 = float('nan')
+                    print(f"  {worker_class:8s} {concurrency:7d} {len(latencies) / args.duration:8.1f}"
+                          f" {p50:8.0f} {p99:8.0f} {len(failures):6d}", flush=True)
+            finally:
+                server.send_signal(signal.SIGTERM)
+                server.wait(timeout=30)
+    finally:
+        stub.kill()
+        shutil.rmtree(args.tmp, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,159 @@
+"""Local stand-in for the function app: the ten dashboard endpoints, with injected delays and errors.
+
+Every ``/api/<function>`` request (any query string) is answered after ``--latency`` seconds,
+give or take ``--jitter`` of it, with a small JSON body. ``--tail-rate`` of the calls take
+``--tail-latency`` seconds instead, like a cold start or a slow instance; ``--error-rate`` of
+them fail with a 500, and the functions named by ``--fail`` always do. ``GET /stats`` returns
+the calls received per function (``/stats?reset=1`` also resets them).
+
+``POST /api/BatchAnalyses`` with ``{"analyses": [...]}`` stands in for the batch function: one
+call with the same latency, tail and errors, plus ``--batch-latency`` seconds per analysis,
+answering with an outcome per analysis (a 500 one for the functions named by ``--fail``).
+
+    python benchmarks/function_stub.py --port 8765
+    python benchmarks/function_stub.py --port 8765 --tail-rate 0.05 --tail-latency 2 --fail WageInequality
+
+``start_stub(args)`` runs it in a subprocess for the other benchmarks.
+"""
+import argparse
+import json
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import requests
+
+FUNCTIONS = [
+    'DisparitiesMvsW', 'EarningAboveLevel', 'EducationImpactForDG', 'HourlyWagesCompMvsW',
+    'PercentageChangeOverYears', 'RaceBasedEarning', 'TrendingWagesOverYears',
+    'WageGapAndTrendOverYears', 'WageInequality', 'WageRangesDistribution',
+]
+
+
+def handler(args):
+    calls = {}
+    lock = threading.Lock()
+    rng = random.Random(args.seed)
+    # About the size of a function's JSON output
+    body = json.dumps({'year': list(range(1973, 2023)), 'value': [round(0.5 + i / 100, 4) for i in range(50)]})
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            path = urlsplit(self.path)
+            name = path.path.rstrip('/').rsplit('/', 1)[-1]
+            if path.path == '/stats':
+                with lock:
+                    self.send(200, json.dumps(calls))
+                    if parse_qs(path.query).get('reset'):
+                        calls.clear()
+                return
+            if name not in FUNCTIONS:
+                self.send(404, json.dumps({'error': f"No function {name}"}))
+                return
+            failed = self.wait(name)
+            if failed:
+                self.send(500, json.dumps({'error': 'Injected failure'}))
+            else:
+                self.send(200, body)
+
+        def do_POST(self):
+            name = urlsplit(self.path).path.rstrip('/').rsplit('/', 1)[-1]
+            # Read in full even when it is refused, so the connection can be kept alive
+            data = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            if name != 'BatchAnalyses':
+                self.send(404, json.dumps({'error': f"No batch function {name}"}))
+                return
+            try:
+                analyses = json.loads(data)['analyses']
+                names = [analysis['name'] if isinstance(analysis, dict) else analysis.split('?')[0]
+                         for analysis in analyses]
+            except (ValueError, KeyError, TypeError, AttributeError):
+                self.send(400, json.dumps({'error': 'Invalid batch'}))
+                return
+            if any(analysis not in FUNCTIONS for analysis in names):
+                self.send(400, json.dumps({'error': 'Unknown analysis'}))
+                return
+            failed = self.wait(name, len(names) * args.batch_latency)
+            if failed:
+                self.send(500, json.dumps({'error': 'Injected failure'}))
+                return
+            outcomes = [
+                '{"name": %s, "status": 500, "error": "Injected failure"}' % json.dumps(analysis)
+                if analysis in args.fail else '{"name": %s, "status": 200, "data": %s}' % (json.dumps(analysis), body)
+                for analysis in names
+            ]
+            self.send(200, '{"analyses": [' + ', '.join(outcomes) + ']}')
+
+        def wait(self, name, extra=0.0):
+            """Count a call to ``name`` and sleep through its latency; returns whether it fails."""
+            with lock:
+                calls[name] = calls.get(name, 0) + 1
+                slow = rng.random() < args.tail_rate
+                failed = name in args.fail or rng.random() < args.error_rate
+                jitter = rng.uniform(-args.jitter, args.jitter)
+            time.sleep((args.tail_latency if slow else args.latency * (1 + jitter)) + extra)
+            return failed
+
+        def send(self, status, text):
+            data = text.encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+def parser():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.05, help='usual seconds per call')
+    parser.add_argument('--jitter', type=float, default=0.2, help='spread of the usual latency, as a fraction of it')
+    parser.add_argument('--tail-rate', type=float, default=0.0, help='fraction of the calls that are slow')
+    parser.add_argument('--tail-latency', type=float, default=1.0, help='seconds per slow call')
+    parser.add_argument('--batch-latency', type=float, default=0.005,
+                        help='extra seconds per analysis of a batch call')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of the calls that fail')
+    parser.add_argument('--fail', action='append', default=[], help='function that always fails (repeatable)')
+    parser.add_argument('--seed', type=int, default=0)
+    return parser
+
+
+def start_stub(args):
+    """Run the stub with command line ``args`` in a subprocess on a free port; returns (process, base URL)."""
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        port = s.getsockname()[1]
+    process = subprocess.Popen([sys.executable, __file__, '--port', str(port), *args])
+    base = f'http://127.0.0.1:{port}'
+    for _ in range(100):
+        try:
+            requests.get(f'{base}/stats', timeout=1)
+            return process, base
+        except requests.ConnectionError:
+            time.sleep(0.05)
+    process.kill()
+    raise RuntimeError('The function stub did not start')
+
+
+def main():
+    args = parser().parse_args()
+    server = ThreadingHTTPServer(('127.0.0.1', args.port), handler(args))
+    server.daemon_threads = True
+    print(f"Serving {len(FUNCTIONS)} functions on http://127.0.0.1:{args.port}/api/", flush=True)
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
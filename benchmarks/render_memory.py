@@ -0,0 +1,112 @@
+"""Memory regression check for chart rendering.
+
+Invokes every HTTP function's ``main`` repeatedly with the chart cache disabled, so every
+request draws all of its charts, and fails when the resident set size keeps growing after
+warm-up or when figures are left registered with pyplot. The source CSVs are read from
+``--sources`` (a directory holding poverty_level_wages.csv and wages_by_education.csv,
+served from a temporary LOCAL_BLOB_ROOT) or from the "sources" container of an existing
+LOCAL_BLOB_ROOT. MyFunctionApp/tests/test_render_memory.py runs a reduced form of this
+check with the test suite.
+
+    python benchmarks/render_memory.py --sources data/          # 2000 requests per endpoint
+    python benchmarks/render_memory.py --sources data/ --iterations 50 --functions DisparitiesMvsW
+"""
+import argparse
+import gc
+import importlib
+import os
+import resource
+import shutil
+import sys
+import tempfile
+
+APP = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'MyFunctionApp')
+SOURCES = ['poverty_level_wages.csv', 'wages_by_education.csv']
+
+# Every HTTP function, with the query parameters of one typical request
+ENDPOINTS = {
+    'DisparitiesMvsW': {},
+    'EarningAboveLevel': {},
+    'HourlyWagesCompMvsW': {},
+    'PercentageChangeOverYears': {},
+    'RaceBasedEarning': {},
+    'TrendingWagesOverYears': {'forecast': '5'},
+    'WageInequality': {},
+    'WageRangesDistribution': {},
+    'EducationImpactForDG': {'year': '2020', 'education_level': 'high_school'},
+    'WageGapAndTrendOverYears': {'year': '2010-2015', 'education_level': 'high_school,bachelors_degree'},
+}
+
+
+def rss_mib():
+    """Current resident set size (peak RSS where /proc is not available)."""
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except OSError:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 2 ** 20 if sys.platform == 'darwin' else peak / 2 ** 10
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--iterations', type=int, default=2000, help='requests per endpoint')
+    parser.add_argument('--warmup', type=int, default=100, help='requests per endpoint before the baseline is taken')
+    parser.add_argument('--tolerance-mib', type=float, default=25.0, help='allowed RSS growth after warm-up')
+    parser.add_argument('--functions', nargs='*', default=list(ENDPOINTS))
+    parser.add_argument('--sources', help='directory containing the source CSVs')
+    args = parser.parse_args()
+
+    if args.sources:
+        blob_root = tempfile.mkdtemp(prefix='render_memory_')
+        os.makedirs(os.path.join(blob_root, 'sources'))
+        for name in SOURCES:
+            shutil.copy(os.path.join(args.sources, name), os.path.join(blob_root, 'sources', name))
+        os.environ['LOCAL_BLOB_ROOT'] = blob_root
+    elif os.getenv('LOCAL_BLOB_ROOT'):
+        blob_root = None
+    else:
+        parser.error('pass --sources or set LOCAL_BLOB_ROOT')
+    os.environ['CHART_CACHE_MAX_BYTES'] = '0'
+    # Never serve materialized results, so that every request renders (the charts the
+    # reports reference are stored in this container, and removed afterwards)
+    os.environ['RESULTS_CONTAINER'] = 'render-memory-no-results'
+    sys.path.insert(0, APP)
+
+    import azure.functions as func
+    from matplotlib._pylab_helpers import Gcf
+
+    failed = False
+    try:
+        for name in args.functions:
+            module = importlib.import_module(name)
+            request = func.HttpRequest(method='GET', url=f'http://localhost/api/{name}', params=ENDPOINTS[name], body=b'')
+
+            for _ in range(args.warmup):
+                module.main(request)
+            gc.collect()
+            baseline = rss_mib()
+
+            for i in range(args.iterations):
+                response = module.main(request)
+                if response.status_code != 200:
+                    raise RuntimeError(f"{name} returned {response.status_code}: {response.get_body()[:200]!r}")
+            gc.collect()
+            growth = rss_mib() - baseline
+            figures = Gcf.get_num_fig_managers()
+
+            ok = growth <= args.tolerance_mib and figures == 0
+            failed = failed or not ok
+            print(f"{name:28s} {args.iterations:6d} requests  RSS {baseline:8.1f} MiB -> {baseline + growth:8.1f} MiB "
+                  f"({growth:+.1f})  open pyplot figures {figures}  {'ok' if ok else 'FAIL'}", flush=True)
+    finally:
+        if blob_root:
+            shutil.rmtree(blob_root, ignore_errors=True)
+        else:
+            shutil.rmtree(os.path.join(os.environ['LOCAL_BLOB_ROOT'], os.environ['RESULTS_CONTAINER']), ignore_errors=True)
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
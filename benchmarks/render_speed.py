@@ -0,0 +1,156 @@
+"""Chart rendering time of the line and bar charts drawn with shared_code.plotting.
+
+Times drawing and PNG encoding of every chart of the functions that plot many series
+(EducationImpactForDG, WageGapAndTrendOverYears and WageInequality) on the current
+datasets, then compares the ways of drawing the same wide chart of synthetic monthly series,
+as long as the yearly series of the datasets (--scale 1) and --scale times longer:
+
+* ``seaborn`` - one ``sns.lineplot`` per series (only when seaborn is installed);
+* ``plot`` - one ``ax.plot`` per series;
+* ``collection`` - ``draw_lines`` without downsampling;
+* ``lttb`` - ``draw_lines``, downsampled to the Axes' width in pixels.
+
+The source CSVs are read from ``--sources`` (a directory holding poverty_level_wages.csv and
+wages_by_education.csv, served from a temporary LOCAL_BLOB_ROOT) or from the "sources"
+container of an existing LOCAL_BLOB_ROOT.
+
+    python benchmarks/render_speed.py --sources data/
+    python benchmarks/render_speed.py --sources data/ --repeat 20 --scale 100 --series 25
+"""
+import argparse
+import importlib
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+APP = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'MyFunctionApp')
+SOURCES = ['poverty_level_wages.csv', 'wages_by_education.csv']
+
+# The functions drawn with shared_code.plotting, with the arguments of charts() besides the results
+FUNCTIONS = {
+    'EducationImpactForDG': ([2010, 2015, 2020], ['high_school', 'bachelors_degree']),
+    'WageGapAndTrendOverYears': ([2010, 2015, 2020], ['high_school', 'bachelors_degree']),
+    'WageInequality': (),
+}
+
+# Length of the yearly series of the datasets (1973-2022)
+YEARS = 50
+
+
+def timed(function, repeat):
+    """Median wall time of ``function()`` in milliseconds."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append((time.perf_counter() - start) * 1000)
+    return statistics.median(times)
+
+
+def synthetic(length, series, seed=0):
+    """Monthly x values and ``series`` random walks of ``length`` points."""
+    rng = np.random.default_rng(seed)
+    x = 1973 + np.arange(length) / 12
+    ys = 0.2 + np.cumsum(rng.normal(scale=0.01, size=(length, series)), axis=0)
+    return x, ys
+
+
+def variants():
+    """Draw functions of the synthetic chart, by name."""
+    from shared_code.charts import new_figure
+    from shared_code.plotting import draw_lines
+
+    def finish(fig, ax, handles=None):
+        ax.set_title('Synthetic series')
+        ax.set_xlabel('Year')
+        ax.legend(handles=handles, loc='upper right')
+        fig.tight_layout()
+        return fig
+
+    def plot(x, ys):
+        fig, ax = new_figure(figsize=(14, 8))
+        for j in range(ys.shape[1]):
+            ax.plot(x, ys[:, j], label=f'series {j}')
+        return finish(fig, ax)
+
+    def collection(x, ys):
+        fig, ax = new_figure(figsize=(14, 8))
+        handles = draw_lines(ax, x, ys, [f'series {j}' for j in range(ys.shape[1])], max_points=len(x))
+        return finish(fig, ax, handles)
+
+    def lttb(x, ys):
+        fig, ax = new_figure(figsize=(14, 8))
+        handles = draw_lines(ax, x, ys, [f'series {j}' for j in range(ys.shape[1])])
+        return finish(fig, ax, handles)
+
+    drawers = {'plot': plot, 'collection': collection, 'lttb': lttb}
+    try:
+        import seaborn as sns
+    except ImportError:
+        return drawers
+
+    def seaborn(x, ys):
+        fig, ax = new_figure(figsize=(14, 8))
+        for j in range(ys.shape[1]):
+            sns.lineplot(x=x, y=ys[:, j], label=f'series {j}', ax=ax)
+        return finish(fig, ax)
+
+    return {'seaborn': seaborn, **drawers}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=10, help='renders per measurement (the median is reported)')
+    parser.add_argument('--scale', type=int, default=100, help='length of the long synthetic series, in dataset lengths')
+    parser.add_argument('--series', type=int, default=25, help='number of synthetic series')
+    parser.add_argument('--sources', help='directory containing the source CSVs')
+    args = parser.parse_args()
+
+    if args.sources:
+        blob_root = tempfile.mkdtemp(prefix='render_speed_')
+        os.makedirs(os.path.join(blob_root, 'sources'))
+        for name in SOURCES:
+            shutil.copy(os.path.join(args.sources, name), os.path.join(blob_root, 'sources', name))
+        os.environ['LOCAL_BLOB_ROOT'] = blob_root
+    elif os.getenv('LOCAL_BLOB_ROOT'):
+        blob_root = None
+    else:
+        parser.error('pass --sources or set LOCAL_BLOB_ROOT')
+    sys.path.insert(0, APP)
+
+    from shared_code.analytics import analytics
+    from shared_code.charts import figure_png, render_chart
+    from shared_code.storage import get_container_client
+
+    try:
+        print('Current datasets (draw + PNG encode, median ms)')
+        container_client = get_container_client('sources')
+        for name, chart_args in FUNCTIONS.items():
+            module = importlib.import_module(name)
+            results, _ = analytics.compute(container_client, module.METRICS)
+            for chart in module.charts(results, *chart_args):
+                ms = timed(lambda: render_chart(chart.draw, chart.data, 'png'), args.repeat)
+                level = chart.params.get('education_level', '')
+                print(f"  {name:28s} {chart.chart_id:28s} {level:18s} {ms:8.1f}", flush=True)
+
+        drawers = variants()
+        if 'seaborn' not in drawers:
+            print('seaborn is not installed; skipping the seaborn baseline')
+        for scale in sorted({1, args.scale}):
+            x, ys = synthetic(YEARS * scale, args.series)
+            print(f"Synthetic: {args.series} monthly series of {len(x)} points (draw + PNG encode, median ms)")
+            for variant, draw in drawers.items():
+                ms = timed(lambda: figure_png(draw(x, ys)), args.repeat)
+                print(f"  {variant:12s} {ms:8.1f}", flush=True)
+    finally:
+        if blob_root:
+            shutil.rmtree(blob_root, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,94 +1,150 @@
-from flask import Flask, render_template_string
-import requests
+from flask import Flask, Response, jsonify, render_template, stream_with_context
 import json
+import os
+from urllib.parse import urlsplit
+from compression import init_compression
+from panel_cache import panel_cache
 
 app = Flask(__name__)
 
-# List of Azure Function URLs
+# gzip/brotli for clients that accept it (see compression.py)
+init_compression(app)
+
+# List of Azure Function URLs; the parameterised analyses are shown for the latest year of
+# their dataset and one education level (they answer 400 without a year)
 function_urls = [
     "https://project-functions.azurewebsites.net/api/DisparitiesMvsW?code=-vBhshTBCdvRj8s4-2i7nTI0OjB4ksqbx-w7cnUCzu8uAzFu3P2khQ%3D%3D",
     "https://project-functions.azurewebsites.net/api/EarningAboveLevel?code=-vBhshTBCdvRj8s4-2i7nTI0OjB4ksqbx-w7cnUCzu8uAzFu3P2khQ%3D%3D",
-    "https://project-functions.azurewebsites.net/api/EducationImpactForDG?",
+    "https://project-functions.azurewebsites.net/api/EducationImpactForDG?year=2022&education_level=bachelors_degree",
     "https://project-functions.azurewebsites.net/api/HourlyWagesCompMvsW?code=-vBhshTBCdvRj8s4-2i7nTI0OjB4ksqbx-w7cnUCzu8uAzFu3P2khQ%3D%3D",
     "https://project-functions.azurewebsites.net/api/PercentageChangeOverYears?code=-vBhshTBCdvRj8s4-2i7nTI0OjB4ksqbx-w7cnUCzu8uAzFu3P2khQ%3D%3D",
     "https://project-functions.azurewebsites.net/api/RaceBasedEarning?code=-vBhshTBCdvRj8s4-2i7nTI0OjB4ksqbx-w7cnUCzu8uAzFu3P2khQ%3D%3D",
     "https://project-functions.azurewebsites.net/api/TrendingWagesOverYears?code=-vBhshTBCdvRj8s4-2i7nTI0OjB4ksqbx-w7cnUCzu8uAzFu3P2khQ%3D%3D",
-    "https://project-functions.azurewebsites.net/api/WageGapAndTrendOverYears?",
+    "https://project-functions.azurewebsites.net/api/WageGapAndTrendOverYears?year=2022&education_level=bachelors_degree",
     "https://project-functions.azurewebsites.net/api/WageInequality?code=-vBhshTBCdvRj8s4-2i7nTI0OjB4ksqbx-w7cnUCzu8uAzFu3P2khQ%3D%3D",
     "https://project-functions.azurewebsites.net/api/WageRangesDistribution?code=-vBhshTBCdvRj8s4-2i7nTI0OjB4ksqbx-w7cnUCzu8uAzFu3P2khQ%3D%3D"
 ]
 
-# Function to fetch data from a URL
-def fetch_data(url):
-    try:
-        response = requests.get(url)
-        if response.status_code == 200:
-            return response.json()  # Assuming the response is JSON
-        else:
-            return f"Error: {response.status_code} for {url}"
-    except Exception as e:
-        return f"Error fetching data: {e}"
+# Another function app to call instead, such as a local one (e.g. http://localhost:7071)
+FUNCTION_APP_URL = os.getenv('DASHBOARD_FUNCTION_APP_URL')
+if FUNCTION_APP_URL:
+    function_urls = [FUNCTION_APP_URL.rstrip('/') + urlsplit(url)._replace(scheme='', netloc='').geturl() for url in function_urls]
+
+# Stream the dashboard: the page shell is sent at once and each panel as soon as it is ready
+# (DASHBOARD_STREAM=0 sends the whole page when every panel is)
+STREAM = os.getenv('DASHBOARD_STREAM', '1').lower() not in ('0', 'false', 'no')
+
+# Dashboard page, split so that a streamed page can be sent in parts
+DASHBOARD_HEAD = """
+<!DOCTYPE html>
+<html lang="en">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>Function Outputs from Blob Storage</title>
+    <style>
+        body {
+            font-family: Arial, sans-serif;
+        }
+        h1 {
+            color: #333;
+        }
+        .function-output {
+            margin-bottom: 20px;
+            padding: 10px;
+            border: 1px solid #ccc;
+        }
+        pre {
+            background-color: #f9f9f9;
+            padding: 10px;
+            border-radius: 5px;
+            overflow-x: auto;
+        }
+        a {
+            text-decoration: none;
+            color: #007BFF; /* Bootstrap primary color */
+        }
+        a:hover {
+            text-decoration: underline;
+        }
+        .function-output.error {
+            border-color: #d9534f;
+        }
+        .error-message {
+            color: #d9534f;
+        }
+        .elapsed {
+            color: #777;
+            font-size: 0.9em;
+        }
+        /* Panels arrive in any order; each is shown in its place in the list */
+        .function-outputs {
+            display: flex;
+            flex-direction: column;
+        }
+    </style>
+</head>
+<body>
+    <h1>Function Outputs from Blob Storage</h1>
+    
+    <div class="function-outputs">
+"""
+
+DASHBOARD_PANEL = """
+        <div class="function-output{% if panel.error %} error{% endif %}" style="order: {{ index }}">
+            <h2><a href="{{ panel.url }}" target="_blank">{{ panel.url }}</a></h2>
+            {% if panel.age is not none %}<p class="elapsed">Updated {{ '%.0f' | format(panel.age) }} s ago{% if panel.elapsed is not none %} (took {{ '%.2f' | format(panel.elapsed) }} s){% endif %}</p>{% endif %}
+            {% if panel.refresh_error %}<p class="error-message">Refresh failed, showing the last output: {{ panel.refresh_error }}</p>{% endif %}
+            {% if panel.error %}
+            <p class="error-message">{{ panel.error }}</p>
+            {% else %}
+            <pre>{{ panel.data | tojson(indent=2) }}</pre> <!-- Render JSON -->
+            {% endif %}
+        </div>
+"""
+
+DASHBOARD_TAIL = """
+    </div>
+    
+</body>
+</html>
+"""
+
+# Compiled once when the app starts rather than on every request
+DASHBOARD_TEMPLATE = app.jinja_env.from_string(
+    DASHBOARD_HEAD
+    # Loop through all function outputs and display them
+    + "{% for panel in panels %}{% set index = loop.index0 %}" + DASHBOARD_PANEL + "{% endfor %}"
+    + DASHBOARD_TAIL
+)
+PANEL_TEMPLATE = app.jinja_env.from_string(DASHBOARD_PANEL)
 
 @app.route('/')
 def display_function_outputs():
-    all_outputs = {}
-    
-    # Loop through each function URL, fetch data, and store it
-    for url in function_urls:
-        output = fetch_data(url)
-        all_outputs[url] = output
+    # Latest output of every function URL, refreshed in the background (see panel_cache.py)
+    if not STREAM:
+        panels = panel_cache.panels(function_urls)
+        return render_template(DASHBOARD_TEMPLATE, panels=panels)
+
+    def generate():
+        yield DASHBOARD_HEAD
+        # Cached panels first, then the others in the order they arrive
+        for index, panel in panel_cache.panels_as_completed(function_urls):
+            yield PANEL_TEMPLATE.render(panel=panel, index=index)
+        yield DASHBOARD_TAIL
 
-    # Render the HTML directly inside Python with render_template_string
-    html_template = """
-    <!DOCTYPE html>
-    <html lang="en">
-    <head>
-        <meta charset="UTF-8">
-        <meta name="viewport" content="width=device-width, initial-scale=1.0">
-        <title>Function Outputs from Blob Storage</title>
-        <style>
-            body {
-                font-family: Arial, sans-serif;
-            }
-            h1 {
-                color: #333;
-            }
-            .function-output {
-                margin-bottom: 20px;
-                padding: 10px;
-                border: 1px solid #ccc;
-            }
-            pre {
-                background-color: #f9f9f9;
-                padding: 10px;
-                border-radius: 5px;
-                overflow-x: auto;
-            }
-            a {
-                text-decoration: none;
-                color: #007BFF; /* Bootstrap primary color */
-            }
-            a:hover {
-                text-decoration: underline;
-            }
-        </style>
-    </head>
-    <body>
-        <h1>Function Outputs from Blob Storage</h1>
-        
-        <!-- Loop through all function outputs and display them -->
-        {% for url, data in all_outputs.items() %}
-            <div class="function-output">
-                <h2><a href="{{ url }}" target="_blank">{{ url }}</a></h2>
-                <pre>{{ data | tojson(indent=2) }}</pre> <!-- Render JSON or text -->
-            </div>
-        {% endfor %}
-        
-    </body>
-    </html>
-    """
+    # Sent as it is generated; proxies that buffer (nginx) are asked not to
+    return Response(stream_with_context(generate()), mimetype='text/html', headers={'X-Accel-Buffering': 'no'})
 
-    return render_template_string(html_template, all_outputs=all_outputs)
+@app.route('/panels')
+def panel_status():
+    # Age and state of every panel, without the data
+    panels = panel_cache.panels(function_urls)
+    return jsonify([
+        {key: panel[key] for key in ('url', 'age', 'elapsed', 'error', 'refresh_error')}
+        for panel in panels
+    ])
 
+# Development server; in production the app is served by gunicorn (see gunicorn.conf.py)
 if __name__ == '__main__':
     app.run(debug=True)
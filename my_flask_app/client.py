@@ -0,0 +1,185 @@
+"""Concurrent calls from the dashboard to the function endpoints.
+
+``fetch_all`` requests every endpoint at once on a thread pool, through one pooled
+``requests.Session`` per process, so connections to the function app are kept alive and
+reused across page loads and a page takes about as long as its slowest endpoint rather than
+the sum of them. Each endpoint's result is a panel: its JSON output, or an error for an endpoint that
+failed or did not answer in time; the other panels are shown regardless.
+``fetch_as_completed`` yields the same panels as each one arrives, for streamed pages.
+
+A call that outlasts the usual latency of its endpoint is hedged with a duplicate call, the
+first good response winning, and endpoints that keep failing are skipped for a while (see
+health.py).
+
+With DASHBOARD_BATCH_URL set, the panels are fetched instead with one call to the batch
+function (BatchAnalyses), which runs every analysis over one load of its dataset; the panels
+of a page then arrive together. The batch call is not hedged.
+
+Configuration is read from the environment:
+
+* DASHBOARD_CONCURRENCY - endpoints called at the same time by a worker (default 10).
+* DASHBOARD_FETCH_TIMEOUT - seconds to wait for an endpoint to connect, and then for each
+  read of its response (default 15).
+* DASHBOARD_PAGE_DEADLINE - seconds a page waits for all its endpoints (default 20); the
+  endpoints still outstanding by then are shown as timed out.
+* DASHBOARD_BATCH_URL - URL of the batch function, with its function key; unset, every
+  endpoint is called on its own.
+"""
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError, as_completed, wait
+from urllib.parse import parse_qsl, urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from health import breakers, latencies
+
+CONCURRENCY = int(os.getenv('DASHBOARD_CONCURRENCY', '10'))
+FETCH_TIMEOUT = float(os.getenv('DASHBOARD_FETCH_TIMEOUT', '15'))
+PAGE_DEADLINE = float(os.getenv('DASHBOARD_PAGE_DEADLINE', '20'))
+BATCH_URL = os.getenv('DASHBOARD_BATCH_URL', '')
+
+_pools_lock = threading.Lock()
+_pools_pid = None
+
+
+def _pools():
+    """``(session, executor, attempts)`` of this process, created on first use in each process.
+
+    Nothing is created at import, so that workers forked from a preloading master (see
+    gunicorn.conf.py) never share a connection pool, queue or lock with it or each other.
+    """
+    global _pools_pid, _session, _executor, _attempts
+    pid = os.getpid()
+    if _pools_pid != pid:
+        with _pools_lock:
+            if _pools_pid != pid:
+                # One keep-alive connection pool per host, large enough for every concurrent call and its hedge
+                _session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=4, pool_maxsize=2 * CONCURRENCY)
+                _session.mount('https://', adapter)
+                _session.mount('http://', adapter)
+                _executor = ThreadPoolExecutor(max_workers=CONCURRENCY, thread_name_prefix='fetch')
+                # Hedged calls, and the calls they duplicate
+                _attempts = ThreadPoolExecutor(max_workers=2 * CONCURRENCY, thread_name_prefix='attempt')
+                _pools_pid = pid
+    return _session, _executor, _attempts
+
+
+def panel(url, data=None, error=None, elapsed=None):
+    """What the dashboard shows for one endpoint."""
+    return {'url': url, 'data': data, 'error': error, 'elapsed': elapsed}
+
+
+# Function to fetch data from a URL
+def fetch_data(url, payload=None):
+    if not breakers.allow(url):
+        return panel(url, error=f"Skipped: the endpoint keeps failing; retried in {breakers.retry_in(url):.0f} s")
+    start = time.monotonic()
+    # A hedged batch would run every analysis of the page again
+    delay = latencies.hedge_delay(url) if url != BATCH_URL else None
+    if delay is None:
+        fetched = _call(url, payload)
+    else:
+        attempts = _pools()[2]
+        calls = [attempts.submit(_call, url, payload)]
+        if not wait(calls, timeout=delay).done:
+            logging.info(f"Hedging {url} after {delay:.2f} s")
+            calls.append(attempts.submit(_call, url, payload))
+        # The first good response wins; the other call is left to finish on its own
+        for call in as_completed(calls):
+            fetched = call.result()
+            if fetched['error'] is None:
+                break
+        fetched['elapsed'] = time.monotonic() - start
+
+    if fetched['error'] is None:
+        breakers.success(url)
+    else:
+        breakers.failure(url)
+    return fetched
+
+
+def _call(url, payload=None):
+    """One call to ``url``, a POST of ``payload`` if given; the latency of every successful one is recorded."""
+    start = time.monotonic()
+    session = _pools()[0]
+    try:
+        # The functions answer with HTML unless JSON is asked for
+        if payload is None:
+            response = session.get(url, headers={'Accept': 'application/json'}, timeout=FETCH_TIMEOUT)
+        else:
+            response = session.post(url, json=payload, headers={'Accept': 'application/json'}, timeout=FETCH_TIMEOUT)
+        elapsed = time.monotonic() - start
+        if response.status_code == 200:
+            data = response.json()
+            latencies.record(url, elapsed)
+            return panel(url, data=data, elapsed=elapsed)
+        else:
+            return panel(url, error=f"Error: {response.status_code} for {url}", elapsed=elapsed)
+    except requests.Timeout:
+        return panel(url, error=f"Timed out after {FETCH_TIMEOUT:g} s", elapsed=time.monotonic() - start)
+    except Exception as e:
+        return panel(url, error=f"Error fetching data: {e}", elapsed=time.monotonic() - start)
+
+
+def fetch_batch(urls):
+    """The panels of ``urls`` from one call to the batch function."""
+    analyses = []
+    for url in urls:
+        parts = urlsplit(url)
+        # The batch function has a function key of its own
+        params = {key: value for key, value in parse_qsl(parts.query) if key != 'code'}
+        analyses.append({'name': parts.path.rstrip('/').rsplit('/', 1)[-1], 'params': params})
+
+    fetched = fetch_data(BATCH_URL, {'analyses': analyses})
+    if fetched['error'] is not None:
+        return [panel(url, error=fetched['error'], elapsed=fetched['elapsed']) for url in urls]
+    return [
+        panel(url, data=outcome['data'], elapsed=fetched['elapsed']) if outcome['status'] == 200
+        else panel(url, error=f"Error: {outcome['status']} for {url}", elapsed=fetched['elapsed'])
+        for url, outcome in zip(urls, fetched['data']['analyses'])
+    ]
+
+
+def fetch_as_completed(urls, deadline=None):
+    """``(index, panel)`` of each of ``urls`` in the order they are fetched, within ``deadline`` seconds."""
+    if deadline is None:
+        deadline = PAGE_DEADLINE
+    if BATCH_URL:
+        batch = _pools()[1].submit(fetch_batch, urls)
+        if wait([batch], timeout=deadline).done:
+            yield from enumerate(batch.result())
+        else:
+            for index, url in enumerate(urls):
+                yield index, panel(url, error=f"No response within the page deadline of {deadline:g} s")
+        return
+    executor = _pools()[1]
+    futures = {executor.submit(fetch_data, url): index for index, url in enumerate(urls)}
+    pending = dict(futures)
+    try:
+        for future in as_completed(futures, timeout=deadline):
+            del pending[future]
+            yield futures[future], future.result()
+    except TimeoutError:
+        for future, index in sorted(pending.items(), key=lambda item: item[1]):
+            if future.done():
+                yield index, future.result()
+            else:
+                # Still running (it will stop at its own timeout) or still queued
+                yield index, panel(urls[index], error=f"No response within the page deadline of {deadline:g} s")
+    finally:
+        # Nothing left to wait for, or the page was abandoned
+        for future in pending:
+            future.cancel()
+
+
+def fetch_all(urls, deadline=None):
+    """The panels of ``urls``, in order, fetched concurrently within ``deadline`` seconds."""
+    panels = [None] * len(urls)
+    for index, fetched in fetch_as_completed(urls, deadline):
+        panels[index] = fetched
+    return panels
@@ -0,0 +1,122 @@
+"""Content-Encoding negotiation for the dashboard's responses.
+
+``init_compression(app)`` compresses every text response of at least COMPRESSION_MIN_BYTES
+(default 1024) with the best encoding the request's Accept-Encoding header allows: brotli
+(``br``) when the Brotli package is installed, else gzip. The levels are set by
+COMPRESSION_GZIP_LEVEL (1-9, default 6) and COMPRESSION_BROTLI_QUALITY (0-11, default 5).
+Streamed responses are compressed as they are sent: the compressor is flushed after every
+chunk, so each one still reaches the client as soon as it is generated.
+
+The dashboard page is the same for as long as the function outputs it embeds are, so
+compressed bodies are cached per worker process, keyed by the content hash of the
+uncompressed body and the encoding, up to COMPRESSION_CACHE_MAX_BYTES (default 16 MiB,
+least recently used first evicted; 0 disables the cache).
+"""
+import gzip
+import hashlib
+import os
+import threading
+import zlib
+from collections import OrderedDict
+
+from flask import request
+
+try:
+    import brotli
+except ImportError:
+    # Optional: without it only gzip is offered
+    brotli = None
+
+MIN_BYTES = int(os.getenv('COMPRESSION_MIN_BYTES', '1024'))
+GZIP_LEVEL = int(os.getenv('COMPRESSION_GZIP_LEVEL', '6'))
+BROTLI_QUALITY = int(os.getenv('COMPRESSION_BROTLI_QUALITY', '5'))
+CACHE_MAX_BYTES = int(os.getenv('COMPRESSION_CACHE_MAX_BYTES', str(16 * 1024 * 1024)))
+
+# Media types worth compressing
+COMPRESSIBLE = {'text/html', 'text/plain', 'text/css', 'application/json', 'application/javascript', 'image/svg+xml'}
+
+# Encodings offered, in order of preference
+ENCODINGS = (['br'] if brotli is not None else []) + ['gzip']
+
+_cache = OrderedDict()
+_cache_bytes = 0
+_lock = threading.Lock()
+
+
+def compress(body, encoding):
+    """``body`` compressed with ``encoding``; compressed only once while it stays cached."""
+    global _cache_bytes
+    key = (hashlib.sha256(body).digest(), encoding)
+    with _lock:
+        compressed = _cache.get(key)
+        if compressed is not None:
+            _cache.move_to_end(key)
+            return compressed
+
+    if encoding == 'br':
+        compressed = brotli.compress(body, quality=BROTLI_QUALITY)
+    else:
+        # No timestamp, so that the same body always compresses to the same bytes
+        compressed = gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+    with _lock:
+        if len(compressed) <= CACHE_MAX_BYTES and key not in _cache:
+            _cache[key] = compressed
+            _cache_bytes += len(compressed)
+            while _cache_bytes > CACHE_MAX_BYTES and _cache:
+                _, evicted = _cache.popitem(last=False)
+                _cache_bytes -= len(evicted)
+    return compressed
+
+
+def compress_stream(chunks, encoding):
+    """``chunks`` compressed with ``encoding``, flushing the compressor after each one."""
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+
+        def flushed(data):
+            return compressor.process(data) + compressor.flush()
+        finish = compressor.finish
+    else:
+        # wbits 31: a gzip header (with no timestamp) and trailer around the deflate stream
+        compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+
+        def flushed(data):
+            return compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        finish = compressor.flush
+
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode()
+        if chunk:
+            yield flushed(chunk)
+    yield finish()
+
+
+def compress_response(response):
+    """``after_request`` hook compressing ``response`` if the client accepts it."""
+    if (response.direct_passthrough or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESSIBLE):
+        return response
+
+    # Caches must not serve a compressed body to a client that did not ask for one
+    response.vary.add('Accept-Encoding')
+
+    # The length of a streamed body is not known up front; it is always worth compressing
+    if not response.is_streamed and len(response.get_data()) < MIN_BYTES:
+        return response
+    qualities = [(request.accept_encodings.quality(encoding), encoding) for encoding in ENCODINGS]
+    quality, encoding = max(qualities, key=lambda item: item[0])
+    if quality <= 0:
+        return response
+
+    if response.is_streamed:
+        response.response = compress_stream(response.response, encoding)
+    else:
+        response.set_data(compress(response.get_data(), encoding))
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+
+def init_compression(app):
+    app.after_request(compress_response)
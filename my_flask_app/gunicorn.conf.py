@@ -0,0 +1,61 @@
+"""Gunicorn configuration of the dashboard.
+
+    gunicorn -c my_flask_app/gunicorn.conf.py
+
+(or just ``gunicorn`` from my_flask_app, where it is picked up by name). A page spends almost
+all of its time waiting on the function app, so a worker serves many requests at once: with
+threads (``gthread``, the default) or with greenlets (``gevent``, which must be installed).
+``sync`` workers, which serve one request at a time, are kept for comparison; see
+benchmarks/dashboard_serving.py.
+
+The app is loaded once, in the master, before the workers are forked (``preload_app``), so
+workers start fast and share its memory. The dashboard's per-process state is created on
+first use in each worker, keyed on its pid: client.py's ``requests.Session`` and thread pools
+(``_pools()``) and the panel cache's refresher thread (``PanelCache._start``). Importing the
+app creates none of them, so nothing is inherited across the fork.
+
+Configuration is read from the environment:
+
+* GUNICORN_WORKER_CLASS - ``gthread`` (default), ``gevent`` or ``sync``.
+* GUNICORN_WORKERS - worker processes (default 2 per CPU, plus 1).
+* GUNICORN_THREADS - requests served at once by a ``gthread`` worker (default 16).
+* GUNICORN_WORKER_CONNECTIONS - requests served at once by a ``gevent`` worker (default 1000).
+* GUNICORN_TIMEOUT - seconds a worker may be silent before it is restarted (default 60).
+* PORT - port listened on (default 8000), on every interface.
+
+Unless DASHBOARD_CONCURRENCY is set, a worker calls the functions from as many threads as it
+serves requests at once, from 10 (one page's endpoints) up to MAX_CONCURRENCY (32); hedged
+calls get twice as many. Pages are mostly served from the panel cache, so the threads only
+bound how many endpoint calls a worker has in flight.
+"""
+import multiprocessing
+import os
+
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gthread')
+workers = int(os.getenv('GUNICORN_WORKERS', str(multiprocessing.cpu_count() * 2 + 1)))
+# More than one thread turns sync workers into gthread ones
+threads = int(os.getenv('GUNICORN_THREADS', '16')) if worker_class == 'gthread' else 1
+worker_connections = int(os.getenv('GUNICORN_WORKER_CONNECTIONS', '1000'))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '60'))
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+
+wsgi_app = 'app:app'
+chdir = os.path.dirname(os.path.abspath(__file__))
+preload_app = True
+# Clients and proxies in front reuse their connection for the next request
+keepalive = 5
+accesslog = '-'
+errorlog = '-'
+
+if worker_class == 'gevent':
+    # Before the app and requests are imported by the preload, so that their sockets,
+    # locks and threads cooperate with gevent
+    from gevent import monkey
+    monkey.patch_all()
+
+# Calls to the function app in flight per worker: at least one page's ten endpoints, at most
+# MAX_CONCURRENCY whatever the requests served at once (a fetch thread and two attempt
+# threads per call)
+MAX_CONCURRENCY = 32
+concurrent_requests = {'gthread': threads, 'gevent': min(worker_connections, 100)}.get(worker_class, 1)
+os.environ.setdefault('DASHBOARD_CONCURRENCY', str(min(max(10, concurrent_requests), MAX_CONCURRENCY)))
@@ -0,0 +1,132 @@
+"""Per-endpoint latency and failure tracking for the dashboard's calls to the functions.
+
+``latencies`` keeps the durations of the latest successful calls to each endpoint, and gives
+the delay after which client.py sends a hedged duplicate of a call still outstanding: the
+observed DASHBOARD_HEDGE_QUANTILE of the endpoint's latency. Cold starts and slow instances
+then cost about one typical call more instead of the whole slow call.
+
+``breakers`` holds a circuit breaker per endpoint. After DASHBOARD_BREAKER_FAILURES calls in a
+row have failed, the endpoint is not called for DASHBOARD_BREAKER_COOLDOWN seconds; then one
+trial call is let through, which closes the breaker if it succeeds and opens it again if not.
+
+Configuration is read from the environment:
+
+* DASHBOARD_HEDGE_QUANTILE - latency quantile after which a call is hedged (default 0.95);
+  0 disables hedging.
+* DASHBOARD_HEDGE_MIN_SAMPLES - successful calls to an endpoint needed before its calls are
+  hedged (default 20).
+* DASHBOARD_HEDGE_MIN_DELAY - shortest delay before a hedge, in seconds (default 0.05).
+* DASHBOARD_BREAKER_FAILURES - calls failed in a row that open an endpoint's breaker
+  (default 5); 0 disables the breakers.
+* DASHBOARD_BREAKER_COOLDOWN - seconds an open breaker skips the endpoint (default 30).
+"""
+import logging
+import math
+import os
+import threading
+import time
+from collections import deque
+
+HEDGE_QUANTILE = float(os.getenv('DASHBOARD_HEDGE_QUANTILE', '0.95'))
+HEDGE_MIN_SAMPLES = int(os.getenv('DASHBOARD_HEDGE_MIN_SAMPLES', '20'))
+HEDGE_MIN_DELAY = float(os.getenv('DASHBOARD_HEDGE_MIN_DELAY', '0.05'))
+BREAKER_FAILURES = int(os.getenv('DASHBOARD_BREAKER_FAILURES', '5'))
+BREAKER_COOLDOWN = float(os.getenv('DASHBOARD_BREAKER_COOLDOWN', '30'))
+
+# Latest calls per endpoint the quantile is taken over
+WINDOW = 200
+
+
+class LatencyTracker:
+    def __init__(self, window=WINDOW):
+        self.window = window
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def record(self, url, seconds):
+        with self._lock:
+            samples = self._samples.get(url)
+            if samples is None:
+                samples = self._samples[url] = deque(maxlen=self.window)
+            samples.append(seconds)
+
+    def quantile(self, url, q):
+        """The ``q`` quantile of the latest latencies of ``url``, or None without enough of them."""
+        with self._lock:
+            samples = list(self._samples.get(url, ()))
+        if len(samples) < HEDGE_MIN_SAMPLES:
+            return None
+        samples.sort()
+        # Nearest rank
+        return samples[max(0, math.ceil(q * len(samples)) - 1)]
+
+    def hedge_delay(self, url):
+        """Seconds after which a call to ``url`` is hedged, or None if it is not."""
+        if HEDGE_QUANTILE <= 0:
+            return None
+        delay = self.quantile(url, HEDGE_QUANTILE)
+        return None if delay is None else max(delay, HEDGE_MIN_DELAY)
+
+    def clear(self):
+        with self._lock:
+            self._samples.clear()
+
+
+class CircuitBreaker:
+    def __init__(self, failures=BREAKER_FAILURES, cooldown=BREAKER_COOLDOWN, clock=time.monotonic):
+        self.failures = failures
+        self.cooldown = cooldown
+        self._clock = clock
+        # url -> [failures in a row, clock time the breaker opened or None, trial call in progress]
+        self._states = {}
+        self._lock = threading.Lock()
+
+    def allow(self, url):
+        """Whether ``url`` may be called now; a call allowed must be followed by ``success`` or ``failure``."""
+        if self.failures <= 0:
+            return True
+        with self._lock:
+            state = self._states.get(url)
+            if state is None or state[1] is None:
+                return True
+            if state[2] or self._clock() - state[1] < self.cooldown:
+                return False
+            # Half open: one trial call
+            state[2] = True
+            return True
+
+    def retry_in(self, url):
+        """Seconds until ``url`` is tried again while its breaker is open."""
+        with self._lock:
+            state = self._states.get(url)
+            if state is None or state[1] is None:
+                return 0.0
+            return max(0.0, self.cooldown - (self._clock() - state[1]))
+
+    def success(self, url):
+        with self._lock:
+            state = self._states.pop(url, None)
+        if state is not None and state[1] is not None:
+            logging.info(f"Circuit closed for {url}")
+
+    def failure(self, url):
+        with self._lock:
+            state = self._states.setdefault(url, [0, None, False])
+            state[0] += 1
+            if state[2]:
+                # The trial call failed too
+                state[1] = self._clock()
+                state[2] = False
+                logging.info(f"Circuit still open for {url}; retried in {self.cooldown:g} s")
+            elif state[1] is None and self.failures > 0 and state[0] >= self.failures:
+                state[1] = self._clock()
+                logging.warning(f"Circuit open for {url} after {state[0]} failures in a row; retried in {self.cooldown:g} s")
+
+    def clear(self):
+        with self._lock:
+            self._states.clear()
+
+
+# Shared by every call made by this worker process
+latencies = LatencyTracker()
+breakers = CircuitBreaker()
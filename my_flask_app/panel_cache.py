@@ -0,0 +1,215 @@
+"""Stale-while-revalidate cache of the dashboard's panels, shared by the workers of a host.
+
+Each endpoint's latest panel (see client.py) is kept in a SQLite database that every worker
+process on the host opens, so a page is served from it at once, however old its panels are,
+and dashboard traffic no longer turns into function calls. A background refresher thread in
+each worker fetches the panels that are due again, every DASHBOARD_TTL seconds per endpoint.
+Before fetching, it claims a lease on each due panel in the database, so each panel is
+refreshed by one worker at a time however many pages are being served. Stale panels seen by
+a request wake the refresher at once.
+
+A panel not in the cache yet (the first page after a deploy) is waited for, up to the page
+deadline. A refresh that fails keeps the last good panel, with the error noted, and is
+retried after DASHBOARD_ERROR_RETRY seconds. Every panel carries its age in seconds.
+``panels_as_completed`` yields the cached panels at once and the others as they arrive, for
+streamed pages.
+
+Configuration is read from the environment:
+
+* DASHBOARD_TTL - seconds before a panel is refreshed (default 60). 0 disables the cache:
+  every page then calls the endpoints.
+* DASHBOARD_TTLS - per-endpoint TTLs, by function name, e.g.
+  ``TrendingWagesOverYears=300,WageInequality=300``.
+* DASHBOARD_ERROR_RETRY - seconds before a failed refresh is retried (default 15).
+* DASHBOARD_CACHE_PATH - the database file (default ``dashboard_panels.sqlite3`` in the
+  temporary directory); it must be on a local disk shared by the workers.
+"""
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from contextlib import closing
+from urllib.parse import urlsplit
+
+from client import PAGE_DEADLINE, fetch_as_completed, panel
+
+TTL = float(os.getenv('DASHBOARD_TTL', '60'))
+TTLS = {
+    name.strip(): float(ttl)
+    for name, _, ttl in (item.partition('=') for item in os.getenv('DASHBOARD_TTLS', '').split(',') if item.strip())
+}
+ERROR_RETRY = float(os.getenv('DASHBOARD_ERROR_RETRY', '15'))
+CACHE_PATH = os.getenv('DASHBOARD_CACHE_PATH', os.path.join(tempfile.gettempdir(), 'dashboard_panels.sqlite3'))
+
+# Seconds between a worker's checks for panels due for a refresh
+POLL_INTERVAL = 1.0
+# A refresh claimed by a worker that died is given up after this long
+LEASE = PAGE_DEADLINE + 5
+# Seconds between reads of the database while waiting for a panel
+WAIT_INTERVAL = 0.05
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS panels (
+    url TEXT PRIMARY KEY,
+    panel TEXT,
+    fetched_at REAL NOT NULL DEFAULT 0,
+    refresh_at REAL NOT NULL DEFAULT 0,
+    leased_until REAL NOT NULL DEFAULT 0,
+    error TEXT
+)
+"""
+
+
+def endpoint_ttl(url):
+    """TTL of the panel of ``url``, by the function name at the end of its path."""
+    name = urlsplit(url).path.rstrip('/').rsplit('/', 1)[-1]
+    return TTLS.get(name, TTL)
+
+
+class PanelCache:
+    """The panels cached in the database at ``path``.
+
+    ``clock`` gives the wall-clock time that the panels' ages, refreshes and leases are
+    measured in, shared by the worker processes. Without ``refresher``, no background thread
+    is started and panels are only fetched by calls to ``refresh_due``.
+    """
+
+    def __init__(self, path=CACHE_PATH, clock=time.time, refresher=True):
+        self.path = path
+        self.refresher = refresher
+        self._clock = clock
+        self._pid = None
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+
+    def panels(self, urls, deadline=None):
+        """The panels of ``urls``, in order, each with its ``age`` in seconds."""
+        panels = [None] * len(urls)
+        for index, cached in self.panels_as_completed(urls, deadline):
+            panels[index] = cached
+        return panels
+
+    def panels_as_completed(self, urls, deadline=None):
+        """``(index, panel)`` of each of ``urls``: the cached ones first, then the others as they arrive."""
+        if deadline is None:
+            deadline = PAGE_DEADLINE
+        if TTL <= 0:
+            for index, fetched in fetch_as_completed(urls, deadline):
+                yield index, dict(fetched, age=0.0, refresh_error=None)
+            return
+        self._start()
+
+        end = time.monotonic() + deadline
+        rows = self._read(urls)
+        missing = [url for url in urls if url not in rows]
+        if missing:
+            with closing(self._connect()) as db:
+                db.executemany("INSERT OR IGNORE INTO panels (url) VALUES (?)", [(url,) for url in missing])
+        now = self._clock()
+        if missing or any(row['refresh_at'] <= now for row in rows.values()):
+            # Refresh in the background; the stale panels are served meanwhile
+            self._wake.set()
+
+        # Panels not cached yet are waited for, up to the deadline
+        pending = list(range(len(urls)))
+        while True:
+            now = self._clock()
+            for index in list(pending):
+                row = rows.get(urls[index])
+                if row is not None and row['panel'] is not None:
+                    pending.remove(index)
+                    yield index, dict(json.loads(row['panel']), age=now - row['fetched_at'], refresh_error=row['error'])
+            if not pending or time.monotonic() >= end:
+                break
+            time.sleep(WAIT_INTERVAL)
+            rows = self._read([urls[index] for index in pending])
+
+        for index in pending:
+            yield index, dict(panel(urls[index], error=f"No response within the page deadline of {deadline:g} s"), age=None, refresh_error=None)
+
+    def refresh_due(self):
+        """Fetch the panels due for a refresh that no other worker is refreshing."""
+        now = self._clock()
+        with closing(self._connect()) as db:
+            due = [url for (url,) in db.execute(
+                "SELECT url FROM panels WHERE refresh_at <= ? AND leased_until < ?", (now, now),
+            )]
+            # Claim each panel; a worker that claimed it first wins
+            claimed = [url for url in due if db.execute(
+                "UPDATE panels SET leased_until = ? WHERE url = ? AND refresh_at <= ? AND leased_until < ?",
+                (now + LEASE, url, now, now),
+            ).rowcount == 1]
+        if not claimed:
+            return
+
+        # Each panel is stored as soon as it arrives, for the pages waiting for it
+        with closing(self._connect()) as db:
+            for _, new in fetch_as_completed(claimed):
+                self._store(db, new, self._clock())
+
+    def _store(self, db, new, now):
+        url = new['url']
+        ttl = endpoint_ttl(url)
+        if new['error'] is None:
+            db.execute(
+                "UPDATE panels SET panel = ?, fetched_at = ?, refresh_at = ?, leased_until = 0, error = NULL WHERE url = ?",
+                (json.dumps(new), now, now + ttl, url),
+            )
+            return
+        logging.warning(f"Could not refresh {url}: {new['error']}")
+        row = db.execute("SELECT panel FROM panels WHERE url = ?", (url,)).fetchone()
+        previous = json.loads(row[0]) if row and row[0] else None
+        if previous is None or previous['error'] is not None:
+            # Nothing better to show than the error itself
+            db.execute(
+                "UPDATE panels SET panel = ?, fetched_at = ?, refresh_at = ?, leased_until = 0, error = NULL WHERE url = ?",
+                (json.dumps(new), now, now + min(ERROR_RETRY, ttl), url),
+            )
+        else:
+            # Keep serving the last good panel
+            db.execute(
+                "UPDATE panels SET refresh_at = ?, leased_until = 0, error = ? WHERE url = ?",
+                (now + min(ERROR_RETRY, ttl), new['error'], url),
+            )
+
+    def _read(self, urls):
+        with closing(self._connect()) as db:
+            db.row_factory = sqlite3.Row
+            placeholders = ','.join('?' * len(urls))
+            return {row['url']: dict(row) for row in db.execute(f"SELECT * FROM panels WHERE url IN ({placeholders})", list(urls))}
+
+    def _connect(self):
+        # Autocommit: every statement is its own transaction
+        return sqlite3.connect(self.path, timeout=10, isolation_level=None)
+
+    def _start(self):
+        """Create the database and start this worker process's refresher, once per process."""
+        pid = os.getpid()
+        if self._pid == pid:
+            return
+        with self._lock:
+            if self._pid == pid:
+                return
+            with closing(self._connect()) as db:
+                # Readers do not wait for the worker writing a refreshed panel
+                db.execute("PRAGMA journal_mode=WAL")
+                db.execute(SCHEMA)
+            if self.refresher:
+                threading.Thread(target=self._run, name='panel-refresher', daemon=True).start()
+            self._pid = pid
+
+    def _run(self):
+        while True:
+            self._wake.wait(POLL_INTERVAL)
+            self._wake.clear()
+            try:
+                self.refresh_due()
+            except Exception as e:
+                logging.warning(f"Panel refresh failed: {str(e)}")
+
+
+# Shared by every request served by this worker process
+panel_cache = PanelCache()
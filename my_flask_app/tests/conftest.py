@@ -0,0 +1,18 @@
+"""Tests of the dashboard's own modules; run from my_flask_app with ``python -m pytest tests``."""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class Clock:
+    """A clock that only moves when told to, for the ``clock`` arguments of health.py and panel_cache.py."""
+
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
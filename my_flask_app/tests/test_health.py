@@ -0,0 +1,133 @@
+import pytest
+
+import health
+from conftest import Clock
+
+URL = 'https://functions.example/api/TrendingWagesOverYears'
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+@pytest.fixture
+def breaker(clock):
+    return health.CircuitBreaker(failures=3, cooldown=30, clock=clock)
+
+
+def test_no_hedge_delay_before_enough_samples():
+    tracker = health.LatencyTracker()
+    for _ in range(health.HEDGE_MIN_SAMPLES - 1):
+        tracker.record(URL, 0.5)
+    assert tracker.hedge_delay(URL) is None
+
+    tracker.record(URL, 0.5)
+    assert tracker.hedge_delay(URL) == 0.5
+
+
+def test_hedge_delay_is_the_latency_quantile(monkeypatch):
+    monkeypatch.setattr(health, 'HEDGE_QUANTILE', 0.95)
+    tracker = health.LatencyTracker()
+    # 0.01 s .. 1.00 s: the nearest-rank 95th percentile is the 95th sample
+    for i in range(1, 101):
+        tracker.record(URL, i / 100)
+    assert tracker.hedge_delay(URL) == pytest.approx(0.95)
+    assert tracker.hedge_delay('https://functions.example/api/WageInequality') is None
+
+
+def test_hedge_delay_keeps_only_the_latest_window():
+    tracker = health.LatencyTracker(window=health.HEDGE_MIN_SAMPLES)
+    for _ in range(health.HEDGE_MIN_SAMPLES):
+        tracker.record(URL, 5.0)
+    for _ in range(health.HEDGE_MIN_SAMPLES):
+        tracker.record(URL, 0.2)
+    assert tracker.hedge_delay(URL) == pytest.approx(0.2)
+
+
+def test_hedge_delay_is_at_least_the_minimum_delay():
+    tracker = health.LatencyTracker()
+    for _ in range(health.HEDGE_MIN_SAMPLES):
+        tracker.record(URL, 0.001)
+    assert tracker.hedge_delay(URL) == health.HEDGE_MIN_DELAY
+
+
+def test_a_zero_quantile_disables_hedging(monkeypatch):
+    monkeypatch.setattr(health, 'HEDGE_QUANTILE', 0)
+    tracker = health.LatencyTracker()
+    for _ in range(health.HEDGE_MIN_SAMPLES):
+        tracker.record(URL, 0.5)
+    assert tracker.hedge_delay(URL) is None
+
+
+def test_breaker_opens_after_failures_in_a_row(breaker):
+    for _ in range(2):
+        breaker.failure(URL)
+        assert breaker.allow(URL)
+    breaker.failure(URL)
+    assert not breaker.allow(URL)
+    assert breaker.retry_in(URL) == 30
+
+
+def test_a_success_resets_the_failure_count(breaker):
+    breaker.failure(URL)
+    breaker.failure(URL)
+    breaker.success(URL)
+    breaker.failure(URL)
+    breaker.failure(URL)
+    assert breaker.allow(URL)
+
+
+def test_open_breaker_lets_one_trial_through_after_the_cooldown(breaker, clock):
+    for _ in range(3):
+        breaker.failure(URL)
+    clock.advance(29)
+    assert not breaker.allow(URL)
+    assert breaker.retry_in(URL) == 1
+
+    clock.advance(1)
+    assert breaker.allow(URL)
+    # Half open: no other call until the trial's outcome is known
+    assert not breaker.allow(URL)
+
+
+def test_failed_trial_reopens_the_breaker(breaker, clock):
+    for _ in range(3):
+        breaker.failure(URL)
+    clock.advance(30)
+    assert breaker.allow(URL)
+    breaker.failure(URL)
+
+    assert not breaker.allow(URL)
+    assert breaker.retry_in(URL) == 30
+    clock.advance(30)
+    assert breaker.allow(URL)
+
+
+def test_successful_trial_closes_the_breaker(breaker, clock):
+    for _ in range(3):
+        breaker.failure(URL)
+    clock.advance(30)
+    assert breaker.allow(URL)
+    breaker.success(URL)
+
+    assert breaker.allow(URL)
+    assert breaker.allow(URL)
+    assert breaker.retry_in(URL) == 0
+    # Counting starts again from zero
+    breaker.failure(URL)
+    assert breaker.allow(URL)
+
+
+def test_breakers_are_per_endpoint(breaker):
+    for _ in range(3):
+        breaker.failure(URL)
+    assert not breaker.allow(URL)
+    assert breaker.allow('https://functions.example/api/WageInequality')
+
+
+def test_zero_failures_disables_the_breaker(clock):
+    breaker = health.CircuitBreaker(failures=0, cooldown=30, clock=clock)
+    for _ in range(10):
+        breaker.failure(URL)
+    assert breaker.allow(URL)
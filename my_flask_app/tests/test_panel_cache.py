@@ -0,0 +1,198 @@
+import pytest
+
+import panel_cache
+from client import panel
+from conftest import Clock
+
+TRENDS = 'https://functions.example/api/TrendingWagesOverYears'
+INEQUALITY = 'https://functions.example/api/WageInequality'
+URLS = [TRENDS, INEQUALITY]
+
+
+class Endpoints:
+    """Stands in for ``client.fetch_as_completed``: answers each call with the next version of its panel."""
+
+    def __init__(self):
+        self.calls = []
+        self.versions = {}
+        self.failing = set()
+        # Called with the urls being fetched, before they are answered
+        self.during_fetch = None
+
+    def __call__(self, urls, deadline=None):
+        self.calls.append(list(urls))
+        if self.during_fetch is not None:
+            self.during_fetch(urls)
+        for index, url in enumerate(urls):
+            if url in self.failing:
+                yield index, panel(url, error='HTTP 503')
+            else:
+                self.versions[url] = self.versions.get(url, 0) + 1
+                yield index, panel(url, data={'version': self.versions[url]}, elapsed=0.1)
+
+    def fetched(self):
+        return [url for urls in self.calls for url in urls]
+
+
+@pytest.fixture
+def endpoints(monkeypatch):
+    endpoints = Endpoints()
+    monkeypatch.setattr(panel_cache, 'fetch_as_completed', endpoints)
+    monkeypatch.setattr(panel_cache, 'TTL', 60.0)
+    monkeypatch.setattr(panel_cache, 'TTLS', {})
+    monkeypatch.setattr(panel_cache, 'ERROR_RETRY', 15.0)
+    return endpoints
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+@pytest.fixture
+def cache(tmp_path, clock, endpoints):
+    return new_cache(tmp_path, clock)
+
+
+def new_cache(tmp_path, clock):
+    """A worker's cache of the shared database, whose panels are only fetched by ``refresh_due``."""
+    return panel_cache.PanelCache(path=str(tmp_path / 'panels.sqlite3'), clock=clock, refresher=False)
+
+
+def versions(panels):
+    return [None if p['data'] is None else p['data']['version'] for p in panels]
+
+
+def test_uncached_panels_are_waited_for_up_to_the_deadline(cache, endpoints):
+    panels = cache.panels(URLS, deadline=0)
+    assert [p['error'] for p in panels] == ["No response within the page deadline of 0 s"] * 2
+    assert [p['age'] for p in panels] == [None, None]
+
+    cache.refresh_due()
+    assert endpoints.fetched() == URLS
+    panels = cache.panels(URLS, deadline=0)
+    assert versions(panels) == [1, 1]
+    assert [p['age'] for p in panels] == [0, 0]
+
+
+def test_panels_are_served_from_the_cache_within_their_ttl(cache, endpoints, clock):
+    cache.panels(URLS, deadline=0)
+    cache.refresh_due()
+
+    clock.advance(59)
+    cache.refresh_due()
+    panels = cache.panels(URLS, deadline=0)
+    assert versions(panels) == [1, 1]
+    assert [p['age'] for p in panels] == [59, 59]
+    assert len(endpoints.calls) == 1
+
+
+def test_stale_panels_are_served_while_they_are_refreshed(cache, endpoints, clock):
+    cache.panels(URLS, deadline=0)
+    cache.refresh_due()
+
+    clock.advance(60)
+    panels = cache.panels(URLS, deadline=0)
+    assert versions(panels) == [1, 1]
+    assert [p['age'] for p in panels] == [60, 60]
+
+    cache.refresh_due()
+    assert endpoints.calls[1] == URLS
+    panels = cache.panels(URLS, deadline=0)
+    assert versions(panels) == [2, 2]
+    assert [p['age'] for p in panels] == [0, 0]
+
+
+def test_per_endpoint_ttls(cache, endpoints, clock, monkeypatch):
+    monkeypatch.setattr(panel_cache, 'TTLS', {'WageInequality': 300.0})
+    cache.panels(URLS, deadline=0)
+    cache.refresh_due()
+
+    clock.advance(60)
+    cache.refresh_due()
+    assert endpoints.calls[1] == [TRENDS]
+
+    clock.advance(240)
+    cache.refresh_due()
+    assert endpoints.calls[2] == URLS
+    assert versions(cache.panels(URLS, deadline=0)) == [3, 2]
+
+
+def test_failed_refresh_keeps_the_last_good_panel(cache, endpoints, clock):
+    cache.panels(URLS, deadline=0)
+    cache.refresh_due()
+
+    clock.advance(60)
+    endpoints.failing.add(TRENDS)
+    cache.refresh_due()
+    trends, inequality = cache.panels(URLS, deadline=0)
+    assert trends['data'] == {'version': 1} and trends['error'] is None
+    assert trends['refresh_error'] == 'HTTP 503'
+    assert trends['age'] == 60
+    assert inequality['data'] == {'version': 2} and inequality['refresh_error'] is None
+
+    # Retried after ERROR_RETRY rather than the TTL
+    clock.advance(14)
+    cache.refresh_due()
+    assert len(endpoints.calls) == 2
+    clock.advance(1)
+    endpoints.failing.clear()
+    cache.refresh_due()
+    assert endpoints.calls[2] == [TRENDS]
+    trends, _ = cache.panels(URLS, deadline=0)
+    assert trends['data'] == {'version': 2} and trends['refresh_error'] is None
+
+
+def test_failed_first_fetch_serves_the_error(cache, endpoints, clock):
+    endpoints.failing.add(TRENDS)
+    cache.panels(URLS, deadline=0)
+    cache.refresh_due()
+
+    trends, inequality = cache.panels(URLS, deadline=0)
+    assert trends['error'] == 'HTTP 503' and trends['data'] is None
+    assert inequality['data'] == {'version': 1}
+
+    clock.advance(15)
+    endpoints.failing.clear()
+    cache.refresh_due()
+    assert endpoints.calls[1] == [TRENDS]
+    trends, _ = cache.panels(URLS, deadline=0)
+    assert trends['error'] is None and trends['data'] == {'version': 1}
+
+
+def test_leased_panels_are_not_refreshed_by_other_workers(tmp_path, cache, endpoints, clock):
+    other = new_cache(tmp_path, clock)
+    cache.panels(URLS, deadline=0)
+    other_fetches = []
+
+    def other_worker_refreshes(urls):
+        if len(endpoints.calls) == 1:
+            other.refresh_due()
+            other_fetches.extend(endpoints.calls[1:])
+
+    endpoints.during_fetch = other_worker_refreshes
+    cache.refresh_due()
+    assert other_fetches == []
+    assert endpoints.fetched() == URLS
+
+
+def test_lease_of_a_worker_that_died_expires(tmp_path, cache, endpoints, clock):
+    cache.panels(URLS, deadline=0)
+
+    def die(urls):
+        raise RuntimeError('worker killed')
+
+    endpoints.during_fetch = die
+    with pytest.raises(RuntimeError):
+        cache.refresh_due()
+    endpoints.during_fetch = None
+
+    other = new_cache(tmp_path, clock)
+    clock.advance(panel_cache.LEASE - 1)
+    other.refresh_due()
+    assert len(endpoints.calls) == 1
+
+    clock.advance(2)
+    other.refresh_due()
+    assert endpoints.calls[1] == URLS
+    assert versions(other.panels(URLS, deadline=0)) == [1, 1]
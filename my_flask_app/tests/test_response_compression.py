@@ -0,0 +1,105 @@
+import gzip
+import zlib
+
+import pytest
+from flask import Flask, Response, stream_with_context
+
+import compression
+
+BODY = '<html><body>' + '<p>Annual wage by year</p>' * 200 + '</body></html>'
+PARTS = ['<html><head></head><body>', '<section>first panel</section>' * 20, '<section>second</section>', '</body></html>']
+
+
+@pytest.fixture
+def client():
+    app = Flask(__name__)
+    compression.init_compression(app)
+
+    @app.route('/page')
+    def page():
+        return BODY
+
+    @app.route('/small')
+    def small():
+        return '<p>tiny</p>'
+
+    @app.route('/image')
+    def image():
+        return Response(b'\x89PNG' + bytes(4096), mimetype='image/png')
+
+    @app.route('/stream')
+    def stream():
+        return Response(stream_with_context(iter(PARTS)), mimetype='text/html')
+
+    return app.test_client()
+
+
+def decompress(body, encoding):
+    if encoding == 'br':
+        return pytest.importorskip('brotli').decompress(body)
+    return gzip.decompress(body)
+
+
+@pytest.mark.parametrize('accept_encoding, expected', [
+    ('gzip', 'gzip'),
+    ('br', 'br'),
+    ('gzip, br', 'br'),
+    ('br;q=0, gzip', 'gzip'),
+    ('identity', None),
+    ('gzip;q=0', None),
+    ('', None),
+])
+def test_page_is_compressed_as_accepted(client, accept_encoding, expected):
+    if expected == 'br' and 'br' not in compression.ENCODINGS:
+        pytest.skip('brotli is not installed')
+    response = client.get('/page', headers={'Accept-Encoding': accept_encoding})
+    assert response.headers.get('Content-Encoding') == expected
+    assert 'Accept-Encoding' in response.headers['Vary']
+    body = response.get_data()
+    assert (decompress(body, expected) if expected else body).decode() == BODY
+
+
+def test_compressed_page_is_cached_per_encoding(client):
+    first = client.get('/page', headers={'Accept-Encoding': 'gzip'}).get_data()
+    assert client.get('/page', headers={'Accept-Encoding': 'gzip'}).get_data() == first
+    key = (compression.hashlib.sha256(BODY.encode()).digest(), 'gzip')
+    assert compression._cache[key] == first
+    if 'br' in compression.ENCODINGS:
+        client.get('/page', headers={'Accept-Encoding': 'br'})
+        assert (key[0], 'br') in compression._cache
+
+
+def test_small_and_binary_responses_are_sent_as_they_are(client):
+    small = client.get('/small', headers={'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in small.headers and small.get_data() == b'<p>tiny</p>'
+    image = client.get('/image', headers={'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in image.headers and len(image.get_data()) == 4100
+
+
+def stream_decompressor(encoding):
+    if encoding == 'br':
+        return pytest.importorskip('brotli').Decompressor().process
+    return zlib.decompressobj(31).decompress
+
+
+@pytest.mark.parametrize('encoding', ['gzip', 'br'])
+def test_streamed_page_is_flushed_part_by_part(client, encoding):
+    if encoding not in compression.ENCODINGS:
+        pytest.skip('brotli is not installed')
+    response = client.get('/stream', headers={'Accept-Encoding': encoding}, buffered=False)
+    assert response.headers['Content-Encoding'] == encoding
+    assert 'Accept-Encoding' in response.headers['Vary']
+
+    # Every part can be decompressed as soon as its chunk arrives
+    decompress_chunk = stream_decompressor(encoding)
+    chunks = list(response.response)
+    assert [decompress_chunk(chunk).decode() for chunk in chunks[:len(PARTS)]] == PARTS
+    assert all(not decompress_chunk(chunk) for chunk in chunks[len(PARTS):])
+    assert decompress(b''.join(chunks), encoding).decode() == ''.join(PARTS)
+
+
+def test_streamed_page_without_accepted_encoding_is_sent_as_it_is(client):
+    for accept_encoding in ('identity', 'gzip;q=0'):
+        response = client.get('/stream', headers={'Accept-Encoding': accept_encoding})
+        assert 'Content-Encoding' not in response.headers
+        assert response.get_data(as_text=True) == ''.join(PARTS)